@@ -0,0 +1,322 @@
+"""Offline benchmark for the document processor.
+
+Generates a synthetic corpus (born-digital and scanned PDFs, image-heavy DOCX/PPTX, large images),
+times every pipeline stage plus the end-to-end pipeline, and writes the results as JSON. With
+--baseline, stages that got slower by more than --threshold are reported and the exit code is 1.
+
+    python benchmark.py --scale 0.5 --output results.json --baseline previous.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+# The processor reads its configuration at import time: benchmark it in-process, with the stub
+# summariser and scratch directories that do not touch a running service's state.
+_scratch = tempfile.mkdtemp(prefix="document_processor_benchmark_")
+for _name, _value in {
+    "SUMMARY_BACKEND": "stub",
+    "SUMMARY_REQUESTS_PER_MINUTE": "1000000",
+    "EXECUTION_MODE": "thread",
+    "WORKSPACE_ROOT": os.path.join(_scratch, "workspaces"),
+    "CACHE_DIR": os.path.join(_scratch, "cache"),
+    "CACHE_MEMORY_ITEMS": "0",
+    "CACHE_DISK_MAX_BYTES": "0",
+    "MANIFESTS_ENABLED": "false",
+    "JOB_DB_PATH": os.path.join(_scratch, "jobs.sqlite3"),
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import cv2
+import docx
+import fitz  # PyMuPDF
+import numpy as np
+from docx.shared import Inches
+from pptx import Presentation
+from pptx.util import Inches as PptxInches
+
+import enhancement
+import separation_and_image_enhancement as processor
+
+
+def _png(gray: np.ndarray) -> bytes:
+    return cv2.imencode(".png", gray)[1].tobytes()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its finished children, in MB (Linux reports KB)."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(usage / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# --- Synthetic Corpus ---
+
+def born_digital_pdf(path: str, pages: int):
+    doc = fitz.open()
+    logo = _png(enhancement.synthetic_scan(160, 160, noise_sigma=4.0, seed=1))
+    for page_num in range(pages):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(460, 30, 540, 110), stream=logo)  # Shared header image
+        text = "\n".join(f"Page {page_num + 1}, paragraph {line}: metro operations report text." for line in range(40))
+        page.insert_textbox(fitz.Rect(54, 120, 540, 800), text, fontsize=10)
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+def scanned_pdf(path: str, pages: int, scale: float):
+    doc = fitz.open()
+    for page_num in range(pages):
+        scan = enhancement.synthetic_scan(int(2480 * scale), int(3508 * scale), seed=page_num)
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=_png(scan))
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+def image_docx(path: str, images: int, scale: float):
+    document = docx.Document()
+    for index in range(images):
+        document.add_paragraph(f"Figure {index + 1}: inspection photo.")
+        scan = enhancement.synthetic_scan(int(1240 * scale), int(880 * scale), seed=100 + index)
+        document.add_picture(io.BytesIO(_png(scan)), width=Inches(5))
+    document.save(path)
+
+
+def image_pptx(path: str, slides: int, scale: float):
+    presentation = Presentation()
+    for index in range(slides):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+        slide.shapes.title.text = f"Slide {index + 1}"
+        scan = enhancement.synthetic_scan(int(1240 * scale), int(880 * scale), seed=200 + index)
+        slide.shapes.add_picture(io.BytesIO(_png(scan)), PptxInches(1), PptxInches(1.5), width=PptxInches(8))
+    presentation.save(path)
+
+
+def large_image(path: str, scale: float):
+    cv2.imwrite(path, enhancement.synthetic_scan(int(4960 * scale), int(7016 * scale), seed=300))
+
+
+def build_corpus(directory: str, scale: float = 1.0) -> list:
+    """Writes the synthetic corpus to `directory` and returns (name, path, content_type) entries."""
+    os.makedirs(directory, exist_ok=True)
+    count = max(1, round(8 * scale))
+    corpus = [
+        ("born_digital.pdf", born_digital_pdf, (count * 4,), "application/pdf"),
+        ("scanned.pdf", scanned_pdf, (count, scale), "application/pdf"),
+        ("images.docx", image_docx, (count * 2, scale), "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+        ("images.pptx", image_pptx, (count * 2, scale), "application/vnd.openxmlformats-officedocument.presentationml.presentation"),
+        ("large.png", large_image, (scale,), "image/png"),
+    ]
+    entries = []
+    for name, build, args, content_type in corpus:
+        path = os.path.join(directory, name)
+        build(path, *args)
+        entries.append((name, path, content_type))
+    return entries
+
+
+# --- Stage Timings ---
+
+class StageTimer:
+    """Collects per-item latencies for one stage of one document."""
+
+    def __init__(self, stage: str, document: str):
+        self.stage = stage
+        self.document = document
+        self.latencies = []
+        self.errors = 0
+        self.units = 0.0
+
+    def time(self, fn, *args, units: float = 1.0):
+        started = time.perf_counter()
+        result = fn(*args)
+        self.latencies.append(time.perf_counter() - started)
+        self.units += units
+        return result
+
+    def result(self, unit: str = "items") -> dict:
+        total = sum(self.latencies)
+        ordered = sorted(self.latencies)
+        return {
+            "stage": self.stage,
+            "document": self.document,
+            "items": len(self.latencies),
+            "errors": self.errors,
+            "seconds": round(total, 4),
+            f"{unit}_per_second": round(self.units / total, 3) if total else None,
+            "latency_ms": {
+                "p50": round(statistics.median(ordered) * 1000, 2) if ordered else None,
+                "p95": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2) if ordered else None,
+                "max": round(ordered[-1] * 1000, 2) if ordered else None,
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def _extract_images(name: str, path: str, timer: StageTimer) -> tuple:
+    """Runs the format handler's extraction, returning (text, images) for the later stages.
+
+    Images are encoded bytes, or PageRenders for scanned PDF pages.
+    """
+    if name.endswith(".pdf"):
+        texts, images, known = [], [], set()
+        for page_num in range(processor.count_pdf_pages(path)):
+            text, page_info, xrefs, page_images = timer.time(processor.extract_pdf_page, path, page_num, frozenset(known))
+            texts.append(text)
+            if page_info["page_type"] == "scanned":
+                images.append(processor.PageRender(path, page_num, processor.OCR_DPI))
+            else:
+                known.update(xrefs)
+                images.extend(image_bytes for _, _, image_bytes, _ in page_images)
+        return "\n\n".join(texts), images
+    if name.endswith(".docx"):
+        text, images = timer.time(processor.extract_docx_content, path)
+        return text, [image_bytes for _, _, image_bytes, _ in images]
+    if name.endswith(".pptx"):
+        slides = timer.time(processor.extract_pptx_content, path)
+        return "\n\n".join(text for text, _ in slides), [image[2] for _, images in slides for image in images]
+    return "", [timer.time(processor._read_file, path)]
+
+
+def benchmark_stages(name: str, path: str) -> list:
+    """Times extraction, enhancement, OCR, summary and PDF output for one document."""
+    extract = StageTimer("extract", name)
+    text, images = _extract_images(name, path, extract)
+
+    enhance = StageTimer("enhance", name)
+    binaries = []
+    for image in images:
+        gray, dpi, _owner = processor.load_grayscale(image)
+        binaries.append(enhance.time(processor.apply_enhancement_pipeline, gray, dpi, units=gray.size / 1e6))
+
+    ocr_timer = StageTimer("ocr", name)
+    ocr_texts = []
+    structured = processor.OCR_OUTPUT == "structured"
+    for binary in binaries:
+        pil_image = enhancement.BinaryImage.from_array(binary).to_pil()
+        if structured:
+            ocr_text = ocr_timer.time(processor.extract_words_from_image, pil_image)[0]
+        else:
+            ocr_text = ocr_timer.time(processor.extract_text_from_image, pil_image)
+        ocr_timer.errors += ocr_text.startswith("[ERROR]")
+        ocr_texts.append(ocr_text)
+
+    summary = StageTimer("summary", name)
+
+    async def summarize_all():
+        for binary, ocr_text in zip(binaries, ocr_texts):
+            started = time.perf_counter()
+            await processor.summarizer.summarize(enhancement.BinaryImage.from_array(binary).to_pil(), ocr_text)
+            summary.latencies.append(time.perf_counter() - started)
+            summary.units += 1
+
+    asyncio.run(summarize_all())
+
+    output = StageTimer("pdf_output", name)
+    with tempfile.TemporaryDirectory(dir=_scratch) as temp_dir:
+        output.time(processor.write_text_only_pdf, text, os.path.join(temp_dir, "text.pdf"))
+        output.time(processor.write_images_only_pdf, binaries, os.path.join(temp_dir, "images.pdf"), units=len(binaries))
+
+    return [extract.result(), enhance.result("megapixels"), ocr_timer.result(), summary.result(), output.result()]
+
+
+async def _run_pipeline(name: str, path: str, content_type: str) -> dict:
+    workspace = processor.workspace_manager.create()
+    try:
+        started = time.perf_counter()
+        result = await processor.run_document_pipeline(path, name, content_type, workspace, generate_pdfs=True)
+        seconds = time.perf_counter() - started
+    finally:
+        workspace.release()
+    return {
+        "document": name,
+        "images": result["images_found"],
+        "seconds": round(seconds, 4),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def benchmark_pipeline(corpus: list) -> list:
+    """Times each document through the full pipeline on the execution engine, one after another."""
+    async def run_all():
+        try:
+            return [await _run_pipeline(name, path, content_type) for name, path, content_type in corpus]
+        finally:
+            processor.execution_engine.shutdown()
+    return asyncio.run(run_all())
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Returns the stages whose total time grew by more than `threshold` (e.g. 0.2 = 20%)."""
+    previous = {(stage["stage"], stage["document"]): stage for stage in baseline.get("stages", [])}
+    previous.update({("pipeline", run["document"]): run for run in baseline.get("pipeline", [])})
+    current = [(stage["stage"], stage["document"], stage) for stage in results["stages"]]
+    current += [("pipeline", run["document"], run) for run in results["pipeline"]]
+    regressions = []
+    for stage, document, entry in current:
+        before = previous.get((stage, document))
+        if before and before["seconds"] and entry["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append({
+                "stage": stage,
+                "document": document,
+                "baseline_seconds": before["seconds"],
+                "seconds": entry["seconds"],
+                "change": round(entry["seconds"] / before["seconds"] - 1, 3),
+            })
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="corpus size and resolution factor")
+    parser.add_argument("--corpus-dir", help="where to write the corpus (default: a temporary directory)")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown that counts as a regression")
+    parser.add_argument("--skip-pipeline", action="store_true", help="only time the individual stages")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    corpus = build_corpus(args.corpus_dir or os.path.join(_scratch, "corpus"), args.scale)
+    corpus_seconds = time.perf_counter() - started
+
+    results = {
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "scale": args.scale,
+        "config": {
+            "enhancement": processor.ENHANCEMENT_CONFIG,
+            "ocr": processor.OCR_CONFIG,
+            "ocr_backend": processor.OCR_BACKEND,
+            "text_pdf_engine": processor.TEXT_PDF_ENGINE,
+        },
+        "corpus": [{"document": name, "bytes": os.path.getsize(path)} for name, path, _ in corpus],
+        "corpus_seconds": round(corpus_seconds, 4),
+        "stages": [stage for name, path, _ in corpus for stage in benchmark_stages(name, path)],
+        "pipeline": [] if args.skip_pipeline else benchmark_pipeline(corpus),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare(results, json.load(f), args.threshold)
+
+    payload = json.dumps(results, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+    else:
+        print(payload)
+    return 1 if results.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import pickle
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(stage: str, data_hash: str, config: dict) -> str:
+    """Builds a key from the content hash and the configuration that produced the result."""
+    fingerprint = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(f"{stage}:{data_hash}:{fingerprint}".encode()).hexdigest()
+
+
+def _ensure_private_dir(path: str) -> bool:
+    """Creates `path` accessible only to the current user; False if it exists but is not ours.
+
+    Disk entries are unpickled, so a directory another user created (or can write to) would let
+    them run code in this process. Directories we own are tightened to 0700.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(info.st_mode):
+        return False
+    if hasattr(os, "getuid"):
+        if info.st_uid != os.getuid():
+            return False
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700)
+    return True
+
+
+def _default_disk_dir() -> str:
+    # Per user, so users sharing /tmp do not collide on (or plant entries in) one directory.
+    suffix = f"_{os.getuid()}" if hasattr(os, "getuid") else ""
+    return os.path.join(tempfile.gettempdir(), f"document_processor_cache{suffix}")
+
+
+class ContentCache:
+    """Two-tier content-addressed cache: an in-memory LRU backed by a size-bounded disk store.
+
+    The disk tier lives in a directory private to the current user; if that directory belongs to
+    someone else, only the memory tier is used.
+    """
+
+    def __init__(self, memory_items: int = 256, disk_dir: str = None, disk_max_bytes: int = 1024 * 1024 * 1024):
+        self.memory_items = memory_items
+        self.disk_dir = disk_dir or _default_disk_dir()
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        if self.disk_max_bytes > 0 and not _ensure_private_dir(self.disk_dir):
+            print(f"Cache directory {self.disk_dir} is not a directory owned by this user; disabling the disk cache.")
+            self.disk_max_bytes = 0
+        self._disk_bytes = self._scan_disk_usage()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _scan_disk_usage(self) -> int:
+        if self.disk_max_bytes <= 0:
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.is_file())
+
+    def get(self, key: str):
+        """Returns the cached value for `key`, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return self._memory[key]
+
+        path = self._disk_path(key)
+        if self.disk_max_bytes > 0 and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+                os.utime(path)  # Refresh mtime so disk eviction is least-recently-used.
+            except (OSError, pickle.UnpicklingError, EOFError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                self._remember(key, value)
+                return value
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, key: str, value):
+        self._remember(key, value)
+        with self._lock:
+            self._counters["writes"] += 1
+        if self.disk_max_bytes <= 0:
+            return
+
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += len(payload)
+            over_quota = self._disk_bytes > self.disk_max_bytes
+        if over_quota:
+            self._evict_disk()
+
+    def _remember(self, key: str, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Deletes least-recently-used disk entries until usage drops below 90% of the limit."""
+        entries = sorted(
+            (entry for entry in os.scandir(self.disk_dir) if entry.is_file() and entry.name.endswith(".pkl")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        usage = sum(entry.stat().st_size for entry in entries)
+        target = int(self.disk_max_bytes * 0.9)
+        evicted = 0
+        for entry in entries:
+            if usage <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            usage -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = usage
+            self._counters["evictions"] += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,75 @@
+import json
+
+
+def split_text(text: str, size: int = 1200, overlap: int = 200):
+    """Yields (start, end) character spans of at most `size`, consecutive spans sharing about `overlap`.
+
+    Spans end and start at whitespace where possible, so words are not cut in half.
+    """
+    if size <= 0 or not 0 <= overlap < size:
+        raise ValueError("Chunk size must be positive and larger than the overlap.")
+    length = len(text)
+    start = 0
+    while start < length:
+        end = min(length, start + size)
+        if end < length:
+            cut = max(text.rfind(" ", start + size // 2, end), text.rfind("\n", start + size // 2, end))
+            if cut > start:
+                end = cut
+        yield start, end
+        if end >= length:
+            break
+        overlap_start = max(start + 1, end - overlap)
+        # Start the overlap at the next word boundary instead of mid-word.
+        next_start = overlap_start
+        while next_start < end and not text[next_start - 1].isspace():
+            next_start += 1
+        start = next_start if next_start < end else overlap_start
+
+
+def make_chunks(text: str, size: int = 1200, overlap: int = 200, **provenance) -> list:
+    """Splits `text` into chunk dicts carrying their character span and the given provenance."""
+    chunks = []
+    for start, end in split_text(text, size, overlap):
+        chunk_text = text[start:end].strip()
+        if chunk_text:
+            chunks.append({"text": chunk_text, "char_start": start, "char_end": end, **provenance})
+    return chunks
+
+
+class ChunkWriter:
+    """Appends chunks to a JSON Lines file as page texts and OCR results arrive.
+
+    Chunks never span pages or images, so every chunk keeps a single provenance: its page and,
+    for OCR text, the index and bounding box of the image it was read from.
+    """
+
+    def __init__(self, path: str, size: int = 1200, overlap: int = 200):
+        self.path = path
+        self.size = size
+        self.overlap = overlap
+        self.count = 0
+        self._file = open(path, "w", encoding="utf-8")
+
+    def add(self, text: str, **provenance) -> int:
+        chunks = make_chunks(text, self.size, self.overlap, **provenance)
+        for chunk in chunks:
+            self._file.write(json.dumps({"chunk_index": self.count, **chunk}) + "\n")
+            self.count += 1
+        return len(chunks)
+
+    def close(self):
+        self._file.close()
+
+
+def read_chunks(path: str, batch_size: int = 256):
+    """Yields the chunks of a chunk file in lists of up to `batch_size`."""
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import random
+import re
+
+from summarizer import TokenBucket, is_retryable
+
+
+class GeminiEmbeddingBackend:
+    """Gemini text embeddings; one request embeds a whole batch of texts."""
+
+    def __init__(self, model_name: str, api_key: str = None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._configured = False
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    async def embed(self, texts: list, task: str) -> list:
+        import google.generativeai as genai
+        if not self._configured:
+            genai.configure(api_key=self.api_key)
+            self._configured = True
+        response = await asyncio.to_thread(genai.embed_content, model=self.model_name, content=texts, task_type=task)
+        return response["embedding"]
+
+
+class StubEmbeddingBackend:
+    """Local stand-in for the embedding model, used in tests and benchmarks.
+
+    Texts are embedded by hashing their words into `dim` buckets, so texts sharing words
+    score as similar and search results are meaningful without an API key.
+    """
+
+    available = True
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.calls = 0
+
+    async def embed(self, texts: list, task: str) -> list:
+        self.calls += 1
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dim
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % self.dim] += 1.0
+            vectors.append(vector)
+        return vectors
+
+
+class EmbeddingClient:
+    """Rate-limited, retrying embedder that sends texts to the backend in batches of `batch_size`."""
+
+    def __init__(self, backend, batch_size: int = 100, max_concurrency: int = 4, requests_per_minute: float = 600,
+                 max_retries: int = 4, backoff_base: float = 1.0, backoff_max: float = 30.0):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(requests_per_minute / 60.0)
+
+    @property
+    def available(self) -> bool:
+        return self.backend.available
+
+    async def _call(self, texts: list, task: str) -> list:
+        attempt = 0
+        while True:
+            await self._bucket.acquire()
+            try:
+                async with self._semaphore:
+                    return await self.backend.embed(texts, task)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                await asyncio.sleep(max(delay, getattr(e, "retry_after", None) or 0))
+                attempt += 1
+
+    async def embed_many(self, texts: list, task: str = "retrieval_document"):
+        """Embeds `texts`, returning a float32 array with one row per text, in order."""
+        import numpy as np
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._call(batch, task) for batch in batches))
+        return np.asarray([vector for result in results for vector in result], dtype=np.float32)
+
+    async def embed_query(self, text: str):
+        return (await self.embed_many([text], task="retrieval_query"))[0]
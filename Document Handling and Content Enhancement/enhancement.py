@@ -0,0 +1,259 @@
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+# OpenCV and NumPy are imported inside the functions that use them, so importing this module
+# (e.g. for preset configuration) stays cheap.
+if TYPE_CHECKING:
+    import numpy as np
+
+SHARPEN_KERNEL = [[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]]
+
+# Each preset is a plain dict so it can be serialised into cache keys and manifests.
+PRESETS = {
+    # Edge-preserving median filter instead of non-local means; an order of magnitude faster.
+    "fast": {
+        "denoise": "median",
+        "median_ksize": 3,
+        "sharpen_kernel": SHARPEN_KERNEL,
+        "threshold_block_size": 11,
+        "threshold_c": 2,
+    },
+    # Downscale to an OCR-friendly resolution first, then run a lighter non-local means.
+    "balanced": {
+        "denoise": "nlmeans",
+        "denoise_h": 10,
+        "denoise_template_window": 7,
+        "denoise_search_window": 15,
+        "target_dpi": 300,
+        "max_pixels": 3508 * 2480,  # A4 at 300 DPI, used when the source DPI is unknown.
+        "sharpen_kernel": SHARPEN_KERNEL,
+        "threshold_block_size": 11,
+        "threshold_c": 2,
+    },
+    # The original full-resolution pipeline.
+    "quality": {
+        "denoise": "nlmeans",
+        "denoise_h": 10,
+        "denoise_template_window": 7,
+        "denoise_search_window": 21,
+        "sharpen_kernel": SHARPEN_KERNEL,
+        "threshold_block_size": 11,
+        "threshold_c": 2,
+    },
+}
+
+# `auto` picks `fast` for clean images, `balanced` for very large ones and `quality` otherwise.
+AUTO_CONFIG = {
+    "clean_noise_sigma": 3.0,
+    "large_image_pixels": 3508 * 2480,
+}
+
+
+class BinaryImage:
+    """A binarised (0/255) image stored at one bit per pixel, rows padded to whole bytes.
+
+    This is 8x smaller than a uint8 array when pickled between processes or cached, and its
+    bit layout is exactly what PIL expects for mode "1" images.
+    """
+
+    __slots__ = ("bits", "shape")
+
+    def __init__(self, bits: "np.ndarray", shape: tuple):
+        self.bits = bits
+        self.shape = shape
+
+    @classmethod
+    def from_array(cls, binary: "np.ndarray") -> "BinaryImage":
+        import numpy as np
+        return cls(np.packbits(binary > 127, axis=1), binary.shape)
+
+    @property
+    def width(self) -> int:
+        return self.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.shape[0]
+
+    def to_array(self) -> "np.ndarray":
+        import numpy as np
+        bits = np.unpackbits(self.bits, axis=1, count=self.shape[1])
+        return bits * np.uint8(255)
+
+    def to_pil(self):
+        from PIL import Image
+        return Image.frombuffer("1", (self.width, self.height), self.bits.tobytes(), "raw", "1", 0, 1)
+
+
+def register_preset(name: str, config: dict):
+    """Adds or replaces an enhancement preset."""
+    PRESETS[name] = config
+
+
+def preset_config(preset: str) -> dict:
+    """Returns the configuration that determines the output of `preset`, for cache keys."""
+    if preset == "auto":
+        return {"preset": "auto", "auto": AUTO_CONFIG, "presets": {name: PRESETS[name] for name in ("fast", "balanced", "quality")}}
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown enhancement preset: {preset}")
+    return {"preset": preset, **PRESETS[preset]}
+
+
+def estimate_noise(gray: "np.ndarray", max_side: int = 1024) -> float:
+    """Estimates the Gaussian noise sigma of a grayscale image (Immerkaer's method).
+
+    Large images are measured on a centred crop to keep the estimate cheap.
+    """
+    import cv2
+    import numpy as np
+    height, width = gray.shape[:2]
+    if height > max_side or width > max_side:
+        top, left = max(0, (height - max_side) // 2), max(0, (width - max_side) // 2)
+        gray = gray[top:top + max_side, left:left + max_side]
+        height, width = gray.shape[:2]
+    if height < 3 or width < 3:
+        return 0.0
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    response = cv2.filter2D(gray.astype(np.float32), -1, kernel)[1:-1, 1:-1]
+    return float(np.abs(response).sum() * math.sqrt(math.pi / 2) / (6.0 * (width - 2) * (height - 2)))
+
+
+def choose_preset(gray: "np.ndarray") -> str:
+    """Selects a preset from image size and measured noise."""
+    if estimate_noise(gray) < AUTO_CONFIG["clean_noise_sigma"]:
+        return "fast"
+    if gray.shape[0] * gray.shape[1] > AUTO_CONFIG["large_image_pixels"]:
+        return "balanced"
+    return "quality"
+
+
+def _downscale(gray: "np.ndarray", config: dict, source_dpi: float = None) -> "np.ndarray":
+    import cv2
+    height, width = gray.shape[:2]
+    scale = 1.0
+    if source_dpi and config.get("target_dpi") and source_dpi > config["target_dpi"]:
+        scale = config["target_dpi"] / source_dpi
+    elif config.get("max_pixels") and height * width > config["max_pixels"]:
+        scale = math.sqrt(config["max_pixels"] / (height * width))
+    if scale >= 1.0:
+        return gray
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def _context_radius(config: dict) -> int:
+    """Pixels of neighbourhood each output pixel depends on, used as the tile overlap."""
+    if config["denoise"] == "nlmeans":
+        denoise = config["denoise_search_window"] // 2 + config["denoise_template_window"] // 2
+    elif config["denoise"] == "bilateral":
+        denoise = config["bilateral_d"] // 2
+    else:
+        denoise = config["median_ksize"] // 2
+    return denoise + len(config["sharpen_kernel"]) // 2 + config["threshold_block_size"] // 2
+
+
+def _enhance_region(gray: "np.ndarray", config: dict) -> "np.ndarray":
+    import cv2
+    import numpy as np
+    if config["denoise"] == "nlmeans":
+        denoised = cv2.fastNlMeansDenoising(
+            gray, None, h=config["denoise_h"],
+            templateWindowSize=config["denoise_template_window"],
+            searchWindowSize=config["denoise_search_window"]
+        )
+    elif config["denoise"] == "bilateral":
+        denoised = cv2.bilateralFilter(gray, config["bilateral_d"], config["bilateral_sigma_color"], config["bilateral_sigma_space"])
+    else:
+        denoised = cv2.medianBlur(gray, config["median_ksize"])
+    sharpened = cv2.filter2D(denoised, -1, np.array(config["sharpen_kernel"]))
+    return cv2.adaptiveThreshold(
+        sharpened, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY, config["threshold_block_size"], config["threshold_c"]
+    )
+
+
+def _enhance_tiled(gray: "np.ndarray", config: dict, tile_size: int, tile_workers: int) -> "np.ndarray":
+    """Enhances overlapping tiles in parallel and stitches their centres back together.
+
+    OpenCV releases the GIL, so threads give real parallelism here.
+    """
+    import numpy as np
+    height, width = gray.shape[:2]
+    overlap = _context_radius(config)
+    output = np.empty_like(gray)
+    tiles = [(top, left) for top in range(0, height, tile_size) for left in range(0, width, tile_size)]
+
+    def process(tile):
+        top, left = tile
+        bottom, right = min(top + tile_size, height), min(left + tile_size, width)
+        pad_top, pad_left = max(0, top - overlap), max(0, left - overlap)
+        pad_bottom, pad_right = min(height, bottom + overlap), min(width, right + overlap)
+        enhanced = _enhance_region(gray[pad_top:pad_bottom, pad_left:pad_right], config)
+        output[top:bottom, left:right] = enhanced[top - pad_top:bottom - pad_top, left - pad_left:right - pad_left]
+
+    with ThreadPoolExecutor(max_workers=tile_workers) as pool:
+        list(pool.map(process, tiles))
+    return output
+
+
+def enhance(gray: "np.ndarray", preset: str = "quality", source_dpi: float = None,
+            tile_size: int = 2048, tile_workers: int = None) -> "np.ndarray":
+    """Enhances a single-channel uint8 image for OCR and returns the binarised result.
+
+    Images larger than `tile_size` on either side are processed as overlapping tiles.
+    """
+    if preset == "auto":
+        preset = choose_preset(gray)
+    config = PRESETS[preset]
+    gray = _downscale(gray, config, source_dpi)
+
+    height, width = gray.shape[:2]
+    if tile_size and (height > tile_size or width > tile_size):
+        return _enhance_tiled(gray, config, tile_size, tile_workers or min(4, os.cpu_count() or 1))
+    return _enhance_region(gray, config)
+
+
+def benchmark_presets(images: list, presets: list = None, repeat: int = 3) -> list:
+    """Measures per-preset throughput over grayscale `images`, in megapixels per second."""
+    results = []
+    total_pixels = sum(image.shape[0] * image.shape[1] for image in images)
+    for preset in presets or list(PRESETS) + ["auto"]:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for image in images:
+                enhance(image, preset)
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        results.append({
+            "preset": preset,
+            "images": len(images),
+            "seconds": round(best, 4),
+            "megapixels_per_second": round(total_pixels / 1e6 / best, 3) if best else None,
+        })
+    return results
+
+
+def synthetic_scan(width: int = 2480, height: int = 3508, noise_sigma: float = 12.0, seed: int = 0) -> "np.ndarray":
+    """Renders a noisy page of text-like strokes, standing in for a scanned A4 page."""
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 235, dtype=np.uint8)
+    for row, top in enumerate(range(150, height - 150, 60)):
+        cv2.putText(page, f"KMRL synthetic scan line {row} 0123456789", (120, top),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, 20, 2, cv2.LINE_AA)
+    noise = rng.normal(0, noise_sigma, page.shape)
+    return np.clip(page.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    sample = [synthetic_scan(int(2480 * scale), int(3508 * scale), seed=seed) for seed in range(2)]
+    print(json.dumps(benchmark_presets(sample), indent=2))
@@ -0,0 +1,166 @@
+import asyncio
+import contextlib
+import multiprocessing
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class EngineSaturatedError(Exception):
+    """Raised when the engine already holds its maximum number of pending jobs."""
+
+
+class JobTimeoutError(Exception):
+    """Raised when a job does not finish within its timeout."""
+
+
+class ExecutionEngine:
+    """Runs blocking document work on a process (or thread) pool so the event loop stays responsive.
+
+    Admission is bounded: at most `max_pending` requests may hold a slot at once, and callers
+    beyond that are rejected immediately instead of queueing without limit.
+
+    Tasks are handed to the pool at most `max_workers` at a time, taken round-robin from one queue
+    per `group` (e.g. per document), so a large document cannot starve the others behind it.
+
+    Process workers are started with `start_method` ("forkserver" by default where available)
+    rather than forked from the API process: forking while another thread holds an import or
+    library lock leaves the worker blocked on that lock forever. The fork server imports the
+    modules named in `preload` once and each worker is forked from it with them already loaded;
+    modules that fail to import are skipped. Preload only side-effect-free libraries: anything
+    imported there also runs in the fork server process.
+    """
+
+    def __init__(self, mode: str = "process", max_workers: int = None,
+                 max_pending: int = None, job_timeout: float = None,
+                 initializer=None, initargs: tuple = (), start_method: str = None, preload: tuple = ()):
+        if mode not in ("process", "thread"):
+            raise ValueError(f"Unknown execution mode: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.job_timeout = job_timeout
+        # Runs once in every worker, e.g. to load OCR models before the first job arrives.
+        self.initializer = initializer
+        self.initargs = initargs
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.start_method = start_method
+        self.preload = preload
+        self._executor = None
+        self._pending = 0
+        self._queues = OrderedDict()
+        self._in_flight = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.mode == "process":
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == "forkserver" and self.preload:
+                    context.set_forkserver_preload(list(self.preload))
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=context,
+                    initializer=self.initializer, initargs=self.initargs
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, initializer=self.initializer, initargs=self.initargs
+                )
+        return self._executor
+
+    @property
+    def started(self) -> bool:
+        """Whether the worker pool has been created; it is started lazily by the first job."""
+        return self._executor is not None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def acquire_slot(self):
+        """Reserves a pending slot for one request, raising EngineSaturatedError when full."""
+        if self._pending >= self.max_pending:
+            raise EngineSaturatedError(
+                f"Processing queue is full ({self._pending}/{self.max_pending} jobs pending)."
+            )
+        self._pending += 1
+
+    def release_slot(self):
+        self._pending -= 1
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        """Holds a pending slot for the duration of the block."""
+        self.acquire_slot()
+        try:
+            yield
+        finally:
+            self.release_slot()
+
+    async def run(self, fn, *args, timeout: float = None, group: str = None):
+        """Runs `fn(*args)` on the pool and awaits its result, honouring the per-job timeout.
+
+        A timed-out job is abandoned rather than killed: process pools cannot interrupt a
+        running task, so its worker becomes free again once the task returns.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(group, deque()).append((fn, args, future))
+        self._dispatch()
+        timeout = timeout if timeout is not None else self.job_timeout
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise JobTimeoutError(f"{getattr(fn, '__name__', 'job')} did not finish within {timeout} seconds.")
+
+    def _dispatch(self):
+        """Submits queued tasks to the pool, one group at a time in rotation, while workers are free."""
+        loop = asyncio.get_running_loop()
+        while self._in_flight < self.max_workers and self._queues:
+            group, queue = self._queues.popitem(last=False)
+            fn, args, future = queue.popleft()
+            if queue:
+                self._queues[group] = queue
+            if future.done():  # Cancelled or timed out while queued.
+                continue
+            executor = self.executor
+            try:
+                task = loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # The pool broke since the last task finished; retry once on a fresh one.
+                self._discard_executor(executor)
+                executor = self.executor
+                task = loop.run_in_executor(executor, fn, *args)
+            self._in_flight += 1
+            task.add_done_callback(lambda task, future=future, executor=executor: self._task_done(task, future, executor))
+
+    def _task_done(self, task, future, executor):
+        self._in_flight -= 1
+        if not task.cancelled() and isinstance(task.exception(), BrokenProcessPool):
+            # A worker died (e.g. killed for memory); the pool refuses all further work, so replace it.
+            # Tasks that were running on it fail with BrokenProcessPool, queued ones go to the new pool.
+            self._discard_executor(executor)
+        if not future.done():
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        self._dispatch()
+
+    def _discard_executor(self, executor):
+        if self._executor is executor:
+            print("A worker process died unexpectedly; starting a new worker pool.")
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        for queue in self._queues.values():
+            for _, _, future in queue:
+                future.cancel()
+        self._queues.clear()
@@ -0,0 +1,359 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+
+class JobProgress:
+    """Tracks counters and partial results for a running job and persists them to the store.
+
+    Inside an event loop the store is written from a worker thread, one write at a time, so a
+    busy database never blocks the loop; call close() to wait for everything to be written.
+    """
+
+    def __init__(self, store: "JobStore", job_id: str, flush_interval: float = 1.0):
+        self.store = store
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self.pages_total = 0
+        self.pages_done = 0
+        self.images_total = 0
+        self.images_done = 0
+        # Only results finished since the last flush are written, so each flush costs O(new results).
+        self._unflushed = []
+        self._last_flush = 0.0
+        self._writing = None
+        self._flush_again = False
+
+    def set_totals(self, pages: int = None, images: int = None):
+        if pages is not None:
+            self.pages_total = pages
+        if images is not None:
+            self.images_total = images
+        self.flush(force=True)
+
+    def page_done(self, count: int = 1):
+        self.pages_done += count
+        self.flush()
+
+    def image_done(self, analysis: dict):
+        self.images_done += 1
+        self._unflushed.append(analysis)
+        self.flush()
+
+    def flush(self, force: bool = False):
+        """Writes progress to the store, at most once per `flush_interval` unless forced."""
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        if self._writing is not None and not self._writing.done():
+            # The write in flight is followed by another one carrying everything since.
+            self._flush_again = True
+            return
+        self._last_flush = now
+        update = (self.job_id, self._counters(), self._unflushed)
+        self._unflushed = []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.store.update_progress(*update)
+            return
+        self._writing = asyncio.ensure_future(asyncio.to_thread(self.store.update_progress, *update))
+        self._writing.add_done_callback(lambda task, update=update: self._written(task, update))
+
+    def _written(self, task, update: tuple):
+        if task.cancelled() or task.exception() is not None:
+            # Keep the results for the next write rather than dropping them.
+            self._unflushed = list(update[2]) + self._unflushed
+            if not task.cancelled():
+                print(f"Could not save progress for job {self.job_id}: {task.exception()}")
+        if self._flush_again:
+            self._flush_again = False
+            self.flush(force=True)
+
+    async def close(self):
+        """Waits for writes in flight, then writes whatever progress is left."""
+        while self._writing is not None and not self._writing.done():
+            await asyncio.wait([self._writing])
+        self._flush_again = False
+        update = (self.job_id, self._counters(), self._unflushed)
+        self._unflushed = []
+        await asyncio.to_thread(self.store.update_progress, *update)
+
+    def _counters(self) -> dict:
+        return {
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "images_total": self.images_total,
+            "images_done": self.images_done,
+        }
+
+
+class JobStore:
+    """SQLite-backed persistent job queue. Safe to share between threads of one process.
+
+    Calls block on SQLite (up to its busy timeout while another process holds the write lock),
+    so async code runs them with asyncio.to_thread.
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or os.path.join(tempfile.gettempdir(), "document_processor_jobs.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                content_type TEXT,
+                upload_path TEXT NOT NULL,
+                workspace_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                progress TEXT NOT NULL DEFAULT '{}',
+                partial_results TEXT NOT NULL DEFAULT '[]',
+                result TEXT,
+                error TEXT
+            )
+        """)
+        # Columns added after the first release; databases created before them are migrated in place.
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "priority" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        if "batch_id" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        if "lease_expires_at" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_priority ON jobs (status, priority, created_at)")
+        # Partial results are appended one row per image instead of rewriting a growing JSON list.
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS partial_results (
+                job_id TEXT NOT NULL,
+                analysis TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS partial_results_job ON partial_results (job_id)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                items TEXT NOT NULL
+            )
+        """)
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def create(self, filename: str, content_type: str, upload_path: str, workspace_id: str,
+               priority: int = 0, batch_id: str = None) -> str:
+        """Queues a job. Jobs with a higher `priority` are claimed first."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, status, filename, content_type, upload_path, workspace_id, created_at, updated_at, "
+            "priority, batch_id) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, filename, content_type, upload_path, workspace_id, now, now, priority, batch_id),
+        )
+        return job_id
+
+    def create_batch(self, batch_id: str, items: list):
+        """Records the per-file entries of a batch; each entry may reference a job by `job_id`."""
+        self._execute(
+            "INSERT INTO batches (id, created_at, items) VALUES (?, ?, ?)", (batch_id, time.time(), json.dumps(items))
+        )
+
+    def get_batch(self, batch_id: str):
+        row = self._execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        if row is None:
+            return None
+        return {"id": row["id"], "created_at": row["created_at"], "items": json.loads(row["items"])}
+
+    def claim_next(self, owner: str, lease_seconds: float):
+        """Atomically leases the oldest highest-priority claimable job to `owner` and returns it, or None.
+
+        A job is claimable while queued, or while 'running' under a lease its owner stopped renewing
+        (the process died). Several processes can share the store: a running job is never taken from
+        an owner that is still alive.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND "
+                    "(lease_expires_at IS NULL OR lease_expires_at < ?)) ORDER BY priority DESC, created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', owner = ?, lease_expires_at = ?, updated_at = ?, "
+                        "partial_results = '[]' WHERE id = ?",
+                        (owner, now + lease_seconds, now, row["id"]),
+                    )
+                    # A reclaimed job starts over, so the previous attempt's partial results are dropped.
+                    self._conn.execute("DELETE FROM partial_results WHERE job_id = ?", (row["id"],))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._row_to_dict(row) if row is not None else None
+
+    def renew_lease(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        """Extends `owner`'s lease on a running job; False if the lease was lost to another owner."""
+        cursor = self._execute(
+            "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+            (time.time() + lease_seconds, job_id, owner),
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, job_id: str, owner: str):
+        """Returns a job `owner` is still running to the queue, e.g. when its process shuts down."""
+        self._execute(
+            "UPDATE jobs SET status = 'queued', owner = NULL, lease_expires_at = NULL, updated_at = ? "
+            "WHERE id = ? AND owner = ? AND status = 'running'",
+            (time.time(), job_id, owner),
+        )
+
+    def update_progress(self, job_id: str, progress: dict, new_partial_results: list = ()):
+        """Stores the progress counters and appends the partial results finished since the last update."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(progress), time.time(), job_id),
+                )
+                self._conn.executemany(
+                    "INSERT INTO partial_results (job_id, analysis) VALUES (?, ?)",
+                    [(job_id, json.dumps(analysis)) for analysis in new_partial_results],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def complete(self, job_id: str, result: dict):
+        self._execute(
+            "UPDATE jobs SET status = 'completed', result = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job_id),
+        )
+
+    def fail(self, job_id: str, error: str):
+        self._execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+            (error, time.time(), job_id),
+        )
+
+    def workspace_ids_in_use(self, result_ttl_seconds: float) -> set:
+        """Returns the workspaces of unfinished jobs, and of jobs completed within `result_ttl_seconds`."""
+        rows = self._execute(
+            "SELECT workspace_id FROM jobs WHERE status IN ('queued', 'running') "
+            "OR (status = 'completed' AND updated_at > ?)",
+            (time.time() - result_ttl_seconds,),
+        ).fetchall()
+        return {row["workspace_id"] for row in rows}
+
+    def get(self, job_id: str):
+        """Returns a job with its partial results, or None."""
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._row_to_dict(row)
+        rows = self._execute(
+            "SELECT analysis FROM partial_results WHERE job_id = ? ORDER BY rowid", (job_id,)
+        ).fetchall()
+        job["partial_results"] += [json.loads(partial["analysis"]) for partial in rows]
+        return job
+
+    def get_batch_jobs(self, batch_id: str) -> dict:
+        """Returns the jobs of a batch keyed by job id, without their partial results."""
+        rows = self._execute("SELECT * FROM jobs WHERE batch_id = ?", (batch_id,)).fetchall()
+        return {row["id"]: self._row_to_dict(row) for row in rows}
+
+    @staticmethod
+    def _row_to_dict(row) -> dict:
+        job = dict(row)
+        job["progress"] = json.loads(job["progress"])
+        # Databases from before the partial_results table kept the whole list in this column.
+        job["partial_results"] = json.loads(job["partial_results"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobRunner:
+    """Pool of asyncio workers that drain the job store through `handler(job, progress)`.
+
+    Every claimed job is leased to this runner and the lease is renewed while the job runs, so
+    runners in several processes (e.g. uvicorn workers) can share one store: a job is only taken
+    over once its lease expires, i.e. when the process running it has died.
+    """
+
+    def __init__(self, store: JobStore, handler, workers: int = 2, poll_interval: float = 5.0,
+                 lease_seconds: float = 60.0):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wakes idle workers after a new job has been submitted."""
+        self._wakeup.set()
+
+    async def _worker(self):
+        while True:
+            # Clear before claiming so a notify() that races with an empty claim is not lost.
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.store.claim_next, self.owner, self.lease_seconds)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            progress = JobProgress(self.store, job["id"])
+            heartbeat = asyncio.create_task(self._renew_lease(job["id"]))
+            try:
+                result = await self.handler(job, progress)
+                await progress.close()
+                await asyncio.to_thread(self.store.complete, job["id"], result)
+            except asyncio.CancelledError:
+                # Shutting down: hand the job back now instead of waiting for the lease to expire.
+                await asyncio.to_thread(self.store.release_lease, job["id"], self.owner)
+                raise
+            except Exception as e:
+                await progress.close()
+                await asyncio.to_thread(self.store.fail, job["id"], str(e))
+            finally:
+                heartbeat.cancel()
+
+    async def _renew_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(self.store.renew_lease, job_id, self.owner, self.lease_seconds):
+                print(f"Lost the lease on job {job_id}; another worker may be running it.")
+                return
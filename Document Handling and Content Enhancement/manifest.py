@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# Bump when a change to the pipeline invalidates every earlier manifest.
+PIPELINE_VERSION = 2
+
+
+def fingerprint(config: dict) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class DocumentManifest:
+    """What one processing run of a document computed, from which inputs, under which configuration.
+
+    Built up while a document is processed, next to the manifest of the previous run (if any).
+    Pages are recorded by content hash; images by their analysis key, which already combines the
+    image hash with the enhancement and OCR configuration, plus the summary key they were summarised under.
+    """
+
+    def __init__(self, document_id: str, stages: dict, previous: dict = None, source_sha256: str = None):
+        self.document_id = document_id
+        self.stages = {stage: fingerprint(config) for stage, config in stages.items()}
+        self.source_sha256 = source_sha256
+        if previous is None or previous.get("pipeline_version") != PIPELINE_VERSION:
+            previous = {}
+        self.previous = previous
+        self.pages = {}
+        self.images = {}
+        self.stats = {"pages_reused": 0, "images_reused": 0, "summaries_reused": 0, "images_processed": 0}
+
+    def previous_page(self, page: int):
+        """The previous run's entry for `page`, if it was extracted under the same configuration."""
+        if self.previous.get("stages", {}).get("extraction") != self.stages.get("extraction"):
+            return None
+        return self.previous.get("pages", {}).get(str(page))
+
+    def previous_image(self, analysis_key: str):
+        return self.previous.get("images", {}).get(analysis_key)
+
+    def record_page(self, page: int, entry: dict):
+        self.pages[str(page)] = entry
+
+    def record_image(self, analysis_key: str, entry: dict):
+        self.images[analysis_key] = entry
+
+    def to_dict(self) -> dict:
+        return {
+            "document_id": self.document_id,
+            "pipeline_version": PIPELINE_VERSION,
+            "source_sha256": self.source_sha256,
+            "updated_at": time.time(),
+            "stages": self.stages,
+            "pages": self.pages,
+            "images": self.images,
+        }
+
+
+class ManifestStore:
+    """Keeps the latest manifest of each document on disk, together with its enhanced images.
+
+    Enhanced images are stored once per analysis key, so they outlive both the request
+    workspace and the size-bounded result cache. With `max_bytes`, the least recently used
+    documents are evicted whole once the store grows past it; 0 means no limit.
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = 0):
+        self.root = root or os.path.join(tempfile.gettempdir(), "document_processor_manifests")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._bytes = sum(self._dir_usage(entry.path) for entry in os.scandir(self.root) if entry.is_dir())
+
+    @staticmethod
+    def _dir_usage(path: str) -> int:
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        except OSError:
+            return 0
+
+    def _document_dir(self, document_id: str) -> str:
+        return os.path.join(self.root, hashlib.sha256(document_id.encode()).hexdigest()[:32])
+
+    def image_path(self, document_id: str, analysis_key: str) -> str:
+        return os.path.join(self._document_dir(document_id), f"{analysis_key}.png")
+
+    def load(self, document_id: str):
+        path = os.path.join(self._document_dir(document_id), "manifest.json")
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+            os.utime(path)  # Refresh mtime so eviction is least-recently-used.
+            return manifest
+        except (OSError, ValueError):
+            return None
+
+    def save(self, manifest: DocumentManifest, workspace_dir: str):
+        """Writes `manifest`, storing any new enhanced images from `workspace_dir` and pruning unused ones."""
+        document_dir = self._document_dir(manifest.document_id)
+        os.makedirs(document_dir, exist_ok=True)
+        usage_before = self._dir_usage(document_dir)
+        for analysis_key, entry in manifest.images.items():
+            stored = self.image_path(manifest.document_id, analysis_key)
+            if not os.path.exists(stored):
+                source = os.path.join(workspace_dir, entry["filename"])
+                try:
+                    os.link(source, stored)
+                except OSError:
+                    shutil.copyfile(source, stored)
+
+        # Concurrent saves of the same document each write their own partial file.
+        partial_path = os.path.join(document_dir, f"manifest.json.{os.getpid()}.{threading.get_ident()}.partial")
+        with open(partial_path, "w") as f:
+            json.dump(manifest.to_dict(), f)
+        os.replace(partial_path, os.path.join(document_dir, "manifest.json"))
+
+        keep = {f"{analysis_key}.png" for analysis_key in manifest.images}
+        for name in os.listdir(document_dir):
+            if name.endswith(".png") and name not in keep:
+                try:
+                    os.remove(os.path.join(document_dir, name))
+                except OSError:
+                    pass
+
+        with self._lock:
+            self._bytes += self._dir_usage(document_dir) - usage_before
+            over_quota = self.max_bytes > 0 and self._bytes > self.max_bytes
+        if over_quota:
+            self._evict(keep=document_dir)
+
+    def _evict(self, keep: str):
+        """Deletes least-recently-used documents until usage drops below 90% of the limit."""
+        documents = []
+        for entry in os.scandir(self.root):
+            if entry.is_dir():
+                try:
+                    last_used = os.stat(os.path.join(entry.path, "manifest.json")).st_mtime
+                except OSError:
+                    last_used = 0.0
+                documents.append((last_used, entry.path, self._dir_usage(entry.path)))
+        documents.sort()
+        usage = sum(size for _, _, size in documents)
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        for _, path, size in documents:
+            if usage <= target:
+                break
+            if path == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            usage -= size
+            evicted += 1
+        with self._lock:
+            self._bytes = usage
+            self._evictions += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"bytes": self._bytes, "max_bytes": self.max_bytes, "evictions": self._evictions}
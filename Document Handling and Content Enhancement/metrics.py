@@ -0,0 +1,164 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+
+# Latency buckets in seconds, from a cached lookup up to a slow scanned page.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"'.replace("\n", " ") for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.setdefault(label_values, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    le = 'le="%g"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {series['count']}")
+        return lines
+
+
+class Registry:
+    """A minimal Prometheus text-format registry. Collectors are called at scrape time for gauges."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Registers a callable returning (name, type, help, value) tuples, evaluated on every render."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help, value in collector():
+                lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value:g}"])
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """Per-document timing totals, returned in responses when debugging."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += seconds * 1000
+            entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {
+                stage: {key: round(value, 2) for key, value in entry.items()} for stage, entry in self._stages.items()
+            }
+        return {"wall_ms": round((time.perf_counter() - self.started) * 1000, 2), "stages": stages}
+
+
+registry = Registry()
+stage_seconds = registry.histogram(
+    "document_stage_seconds", "Time spent in each pipeline stage.", ("stage",)
+)
+documents_total = registry.counter(
+    "documents_processed_total", "Documents processed, by file type and outcome.", ("format", "status")
+)
+pages_total = registry.counter("pages_processed_total", "Pages and slides processed, by page type.", ("page_type",))
+images_total = registry.counter("images_processed_total", "Images analysed, by how the result was obtained.", ("source",))
+errors_total = registry.counter("stage_errors_total", "Errors, by pipeline stage.", ("stage",))
+
+_current_trace = contextvars.ContextVar("document_trace", default=None)
+
+
+def start_trace() -> Trace:
+    """Starts timing a document; tasks created afterwards in this context report into the same trace."""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def observe(stage: str, seconds: float):
+    stage_seconds.observe(seconds, stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextlib.contextmanager
+def span(stage: str):
+    """Times the enclosed block as `stage`; an exception also counts as an error of that stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors_total.inc(stage)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started)
@@ -0,0 +1,246 @@
+import threading
+from array import array
+
+
+class OcrWords:
+    """Word-level OCR output stored column-wise, one entry per word in each column.
+
+    Boxes are left/top/width/height in pixels of the recognised image and `conf` is tesseract's
+    0-100 word confidence. Words are in reading order; consecutive words with the same `line`
+    were read as one text line, and `paragraph` numbers mark paragraph breaks.
+    """
+
+    COLUMNS = ("left", "top", "width", "height", "conf", "line", "paragraph")
+
+    def __init__(self, image_size: tuple = (0, 0)):
+        self.image_size = tuple(image_size)
+        self.text = []
+        self.left, self.top, self.width, self.height = array("i"), array("i"), array("i"), array("i")
+        self.conf = array("b")
+        self.line, self.paragraph = array("i"), array("i")
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def append(self, text: str, box: tuple, conf: float, line: int, paragraph: int):
+        self.text.append(text)
+        for column, value in zip(self.COLUMNS, (*box, round(conf), line, paragraph)):
+            getattr(self, column).append(int(value))
+
+    def copy_words(self, other: "OcrWords", start: int, end: int):
+        self.text.extend(other.text[start:end])
+        for column in self.COLUMNS:
+            getattr(self, column).extend(getattr(other, column)[start:end])
+
+    def to_text(self) -> str:
+        """Plain text as tesseract lays it out: words joined by spaces, lines by newlines, paragraphs by a blank line."""
+        parts = []
+        for index, word in enumerate(self.text):
+            if index:
+                if self.paragraph[index] != self.paragraph[index - 1]:
+                    parts.append("\n\n")
+                elif self.line[index] != self.line[index - 1]:
+                    parts.append("\n")
+                else:
+                    parts.append(" ")
+            parts.append(word)
+        return "".join(parts)
+
+    def iter_lines(self):
+        """Yields (start, end, box, mean_conf) for each line, where words[start:end] make up the line."""
+        start = 0
+        while start < len(self):
+            end = start + 1
+            while end < len(self) and self.line[end] == self.line[start]:
+                end += 1
+            left = min(self.left[start:end])
+            top = min(self.top[start:end])
+            right = max(x + w for x, w in zip(self.left[start:end], self.width[start:end]))
+            bottom = max(y + h for y, h in zip(self.top[start:end], self.height[start:end]))
+            yield start, end, (left, top, right - left, bottom - top), sum(self.conf[start:end]) / (end - start)
+            start = end
+
+    def to_dict(self) -> dict:
+        lines = {"left": [], "top": [], "width": [], "height": [], "conf": [], "first_word": [], "word_count": []}
+        for start, end, box, conf in self.iter_lines():
+            for column, value in zip(("left", "top", "width", "height", "conf", "first_word", "word_count"),
+                                     (*box, round(conf, 1), start, end - start)):
+                lines[column].append(value)
+        return {
+            "image_size": list(self.image_size),
+            "text": self.text,
+            **{column: getattr(self, column).tolist() for column in self.COLUMNS},
+            "lines": lines,
+        }
+
+
+class PytesseractBackend:
+    """Fallback backend: shells out to the `tesseract` binary once per image."""
+
+    name = "pytesseract"
+
+    def __init__(self, lang: str = "eng", oem: int = 3, psm: int = 6):
+        import pytesseract
+        self._pytesseract = pytesseract
+        self.lang = lang
+        self.oem = oem
+        self.config = f"--oem {oem} --psm {psm}"
+
+    def warm(self):
+        """Checks the `tesseract` binary is runnable; it loads the traineddata on every call anyway."""
+        self._pytesseract.get_tesseract_version()
+
+    def recognize(self, image) -> str:
+        return self._pytesseract.image_to_string(image, config=self.config, lang=self.lang).strip()
+
+    def recognize_words(self, image, psm: int = None) -> OcrWords:
+        """Words with boxes and confidences from a single TSV pass; `psm` overrides the page segmentation mode."""
+        config = self.config if psm is None else f"--oem {self.oem} --psm {psm}"
+        data = self._pytesseract.image_to_data(
+            image, config=config, lang=self.lang, output_type=self._pytesseract.Output.DICT
+        )
+        words = OcrWords(image.size)
+        lines, paragraphs = {}, {}
+        for index, text in enumerate(data["text"]):
+            # Level 5 rows are words; the others are page, block, paragraph and line summaries.
+            if data["level"][index] != 5 or not text.strip():
+                continue
+            paragraph_key = (data["block_num"][index], data["par_num"][index])
+            paragraph = paragraphs.setdefault(paragraph_key, len(paragraphs))
+            line = lines.setdefault((*paragraph_key, data["line_num"][index]), len(lines))
+            box = (data["left"][index], data["top"][index], data["width"][index], data["height"][index])
+            words.append(text.strip(), box, float(data["conf"][index]), line, paragraph)
+        return words
+
+
+class TesserocrBackend:
+    """Long-lived tesseract API held in-process, one instance per thread.
+
+    The traineddata is loaded once per worker thread instead of once per image, and images
+    are handed over as in-memory buffers rather than temporary PNG files.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str = "eng", oem: int = 3, psm: int = 6):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self.lang = lang
+        self.oem = oem
+        self.psm = psm
+        self._local = threading.local()
+
+    @property
+    def api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._tesserocr.PyTessBaseAPI(lang=self.lang, oem=self.oem, psm=self.psm)
+            self._local.api = api
+        return api
+
+    def warm(self):
+        """Creates this thread's tesseract API now, loading the traineddata before the first image."""
+        self.api
+
+    def recognize(self, image) -> str:
+        api = self.api
+        api.SetImage(image)
+        try:
+            return api.GetUTF8Text().strip()
+        finally:
+            api.Clear()
+
+    def recognize_words(self, image, psm: int = None) -> OcrWords:
+        """Words with boxes and confidences from a single recognition pass; `psm` overrides the page segmentation mode."""
+        RIL = self._tesserocr.RIL
+        api = self.api
+        if psm is not None:
+            api.SetPageSegMode(psm)
+        api.SetImage(image)
+        try:
+            api.Recognize()
+            words = OcrWords(image.size)
+            iterator = api.GetIterator()
+            if iterator is None:
+                return words
+            line = paragraph = -1
+            for word in self._tesserocr.iterate_level(iterator, RIL.WORD):
+                if word.IsAtBeginningOf(RIL.PARA):
+                    paragraph += 1
+                if word.IsAtBeginningOf(RIL.TEXTLINE):
+                    line += 1
+                text = word.GetUTF8Text(RIL.WORD)
+                box = word.BoundingBox(RIL.WORD)
+                if not text or not text.strip() or box is None:
+                    continue
+                left, top, right, bottom = box
+                words.append(text.strip(), (left, top, right - left, bottom - top), word.Confidence(RIL.WORD),
+                             max(line, 0), max(paragraph, 0))
+            return words
+        finally:
+            api.Clear()
+            if psm is not None:
+                api.SetPageSegMode(self.psm)
+
+
+BACKENDS = {"tesserocr": TesserocrBackend, "pytesseract": PytesseractBackend}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend(name: str = "auto", lang: str = "eng", oem: int = 3, psm: int = 6):
+    """Returns this process's OCR backend, creating it on first use.
+
+    "auto" prefers tesserocr and falls back to pytesseract when it is not installed.
+    """
+    global _backend
+    if _backend is not None:
+        return _backend
+    with _backend_lock:
+        if _backend is None:
+            candidates = ["tesserocr", "pytesseract"] if name == "auto" else [name]
+            for candidate in candidates:
+                try:
+                    _backend = BACKENDS[candidate](lang=lang, oem=oem, psm=psm)
+                    break
+                except ImportError:
+                    continue
+            else:
+                raise ImportError(f"No OCR backend available (tried {', '.join(candidates)}).")
+    return _backend
+
+
+def loaded_backend_name():
+    """Name of the backend loaded in this process, or None if OCR has not been used yet."""
+    return _backend.name if _backend is not None else None
+
+
+def reocr_low_confidence(backend, image, words: OcrWords, threshold: float, psm: int = 7, scale: float = 2.0,
+                         padding: int = 4):
+    """Re-reads only the lines whose mean confidence is below `threshold`, with other settings.
+
+    Each weak line is cropped from `image` (a PIL image), upscaled by `scale` and recognised as a
+    single line (`psm` 7 by default); the new reading replaces the old one only if it is more
+    confident. Returns the merged words and how many lines were replaced.
+    """
+    merged = OcrWords(words.image_size)
+    replaced = 0
+    for start, end, (left, top, width, height), conf in words.iter_lines():
+        if conf >= threshold:
+            merged.copy_words(words, start, end)
+            continue
+        x0, y0 = max(0, left - padding), max(0, top - padding)
+        x1, y1 = min(image.width, left + width + padding), min(image.height, top + height + padding)
+        region = image.crop((x0, y0, x1, y1))
+        region = region.resize((max(1, round(region.width * scale)), max(1, round(region.height * scale))))
+        candidate = backend.recognize_words(region, psm=psm)
+        if not len(candidate) or sum(candidate.conf) / len(candidate) <= conf:
+            merged.copy_words(words, start, end)
+            continue
+        for index, text in enumerate(candidate.text):
+            box = (x0 + candidate.left[index] / scale, y0 + candidate.top[index] / scale,
+                   candidate.width[index] / scale, candidate.height[index] / scale)
+            merged.append(text, box, candidate.conf[index], words.line[start], words.paragraph[start])
+        replaced += 1
+    return merged, replaced
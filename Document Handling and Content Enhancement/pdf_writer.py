@@ -0,0 +1,129 @@
+import fitz  # PyMuPDF
+
+
+class _Advances(dict):
+    """Per-character advance widths, measured once per character."""
+
+    def __init__(self, font, fontsize: float):
+        super().__init__()
+        self.font = font
+        self.fontsize = fontsize
+
+    def __missing__(self, char: str) -> float:
+        width = self.font.glyph_advance(ord(char)) * self.fontsize
+        self[char] = width
+        return width
+
+
+class TextPdfWriter:
+    """In-process text-to-PDF writer with word wrapping and automatic pagination.
+
+    Text can be written in several calls, so callers can stream a long document page by page
+    without holding it in memory. Nothing is ever truncated: lines that do not fit start a new page.
+    """
+
+    def __init__(self, path: str, fontsize: float = 11, fontname: str = "helv", fontfile: str = None,
+                 page_width: float = 595, page_height: float = 842, margin: float = 54, line_spacing: float = 1.3):
+        self.path = path
+        self.fontsize = fontsize
+        # Built-in base-14 fonts only cover Latin-1; pass a TTF `fontfile` for other scripts.
+        self.fontname = "F0" if fontfile else fontname
+        self.fontfile = fontfile
+        self.font = fitz.Font(fontfile=fontfile) if fontfile else fitz.Font(fontname)
+        self.line_spacing = line_spacing
+        self.page_width = page_width
+        self.page_height = page_height
+        self.margin = margin
+        self.line_height = fontsize * line_spacing
+        self.max_width = page_width - 2 * margin
+        self.lines_per_page = max(1, int((page_height - 2 * margin) // self.line_height))
+        self._doc = fitz.open()
+        self._advances = _Advances(self.font, fontsize)
+        self._lines = []
+        self._pending = ""
+
+    def _width(self, text: str) -> float:
+        return sum(map(self._advances.__getitem__, text))
+
+    def _flush_page(self):
+        """Writes the buffered lines as one page, in a single text insertion."""
+        page = self._doc.new_page(width=self.page_width, height=self.page_height)
+        page.insert_text(
+            (self.margin, self.margin + self.fontsize), self._lines, fontsize=self.fontsize,
+            fontname=self.fontname, fontfile=self.fontfile, lineheight=self.line_spacing
+        )
+        self._lines = []
+
+    def _emit_line(self, line: str):
+        self._lines.append(line)
+        if len(self._lines) >= self.lines_per_page:
+            self._flush_page()
+
+    def _longest_fitting_prefix(self, word: str) -> int:
+        low, high = 1, len(word)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._width(word[:middle]) <= self.max_width:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _wrap(self, paragraph: str):
+        """Greedily wraps one paragraph to the text width, splitting words that are wider than a line."""
+        space = self._width(" ")
+        line, line_width = "", 0.0
+        for word in paragraph.split(" "):
+            word_width = self._width(word)
+            while word_width > self.max_width:
+                if line:
+                    yield line
+                    line, line_width = "", 0.0
+                cut = self._longest_fitting_prefix(word)
+                yield word[:cut]
+                word = word[cut:]
+                word_width = self._width(word)
+            if line and line_width + space + word_width > self.max_width:
+                yield line
+                line, line_width = "", 0.0
+            if line:
+                line, line_width = f"{line} {word}", line_width + space + word_width
+            else:
+                line, line_width = word, word_width
+        yield line
+
+    def write(self, text: str):
+        """Appends text. A trailing partial line is held until the next write or close()."""
+        text = self._pending + text.replace("\r\n", "\n").replace("\t", "    ")
+        paragraphs = text.split("\n")
+        self._pending = paragraphs.pop()
+        for paragraph in paragraphs:
+            for line in self._wrap(paragraph):
+                self._emit_line(line)
+
+    def close(self) -> str:
+        if self._pending:
+            for line in self._wrap(self._pending):
+                self._emit_line(line)
+            self._pending = ""
+        if self._lines or not self._doc.page_count:
+            self._flush_page()
+        self._doc.save(self.path, deflate=True, garbage=1)
+        self._doc.close()
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._doc.close()
+
+
+def write_text_pdf(text: str, path: str, **options) -> str:
+    """Lays out `text` into a multi-page PDF at `path`."""
+    with TextPdfWriter(path, **options) as writer:
+        writer.write(text)
+    return path
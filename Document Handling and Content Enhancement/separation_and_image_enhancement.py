@@ -1,214 +1,1757 @@
-import fitz  # PyMuPDF
-import cv2
-import numpy as np
-from PIL import Image
+# PyMuPDF, OpenCV, NumPy, PIL, pypandoc, python-docx and python-pptx are imported inside the
+# functions that need them, so importing this module (workers, tests) does not pay for them.
 import io
-import pypandoc
 import tempfile
 import os
 import shutil
-import pytesseract
+import json
+import asyncio
+import hashlib
+import itertools
+import mimetypes
+import tarfile
+import zipfile
+import uuid
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, NamedTuple
 from dotenv import load_dotenv
-import google.generativeai as genai
-import docx
-from pptx import Presentation
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, Header, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, PlainTextResponse
+
+from workspace import WorkspaceManager, QuotaExceededError, is_workspace_id
+from execution import ExecutionEngine, EngineSaturatedError, JobTimeoutError
+from cache import ContentCache, content_hash, make_cache_key
+from jobs import JobStore, JobRunner
+from manifest import DocumentManifest, ManifestStore
+from chunking import ChunkWriter, read_chunks
+from embeddings import EmbeddingClient, GeminiEmbeddingBackend, StubEmbeddingBackend
+import metrics
+import enhancement
+import ocr
+from summarizer import SummarizationClient, GeminiBackend, StubBackend
+
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
 
 # --- Initial Setup ---
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 app = FastAPI(
     title="Universal Document Processor API",
     description="A comprehensive API to convert, enhance, separate, OCR, and summarize any document."
 )
 
+# Each request gets its own scratch directory so concurrent uploads never clobber each other.
+workspace_manager = WorkspaceManager(
+    root=os.getenv("WORKSPACE_ROOT"),
+    ttl_seconds=float(os.getenv("WORKSPACE_TTL_SECONDS", "3600")),
+    max_workspace_bytes=int(os.getenv("WORKSPACE_MAX_BYTES", str(512 * 1024 * 1024))),
+    max_total_bytes=int(os.getenv("WORKSPACE_MAX_TOTAL_BYTES", str(8 * 1024 * 1024 * 1024))),
+)
+WORKSPACE_SWEEP_INTERVAL_SECONDS = float(os.getenv("WORKSPACE_SWEEP_INTERVAL_SECONDS", "300"))
+
+def warm_ocr_backend():
+    """Loads the OCR backend and its traineddata once per engine worker (process or thread)."""
+    try:
+        ocr.get_backend(OCR_BACKEND, **OCR_CONFIG).warm()
+    except Exception as e:
+        print(f"OCR backend unavailable in worker: {e}")
+
+# CPU-bound handlers run on this pool; the event loop only awaits them.
+execution_engine = ExecutionEngine(
+    initializer=warm_ocr_backend,
+    mode=os.getenv("EXECUTION_MODE", "process"),
+    max_workers=int(os.getenv("EXECUTION_WORKERS", "0")) or None,
+    max_pending=int(os.getenv("EXECUTION_MAX_PENDING", "0")) or None,
+    job_timeout=float(os.getenv("EXECUTION_JOB_TIMEOUT_SECONDS", "0")) or None,
+    start_method=os.getenv("EXECUTION_START_METHOD") or None,  # forkserver | spawn | fork
+    # The document libraries are what make a cold worker slow. This module is not preloaded: importing
+    # it opens the job store and the manifest store, which the fork server has no use for.
+    preload=("fitz", "cv2", "numpy", "PIL.Image"),
+)
+
+
+# Pipeline configuration. Anything that changes a stage's output belongs here so that
+# it becomes part of that stage's cache key.
+ENHANCEMENT_PRESET = os.getenv("ENHANCEMENT_PRESET", "quality")  # fast | balanced | quality | auto
+ENHANCEMENT_TILE_SIZE = int(os.getenv("ENHANCEMENT_TILE_SIZE", "2048"))
+ENHANCEMENT_TILE_WORKERS = int(os.getenv("ENHANCEMENT_TILE_WORKERS", "0")) or None
+ENHANCEMENT_CONFIG = enhancement.preset_config(ENHANCEMENT_PRESET)
+OCR_CONFIG = {"oem": 3, "psm": 6, "lang": "eng"}
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")  # auto | tesserocr | pytesseract
+# "structured" OCR returns every word with its box and confidence, from the same single pass as
+# the text. Lines whose mean confidence is below OCR_REOCR_CONFIDENCE (0 disables) are then re-read
+# on their own, as single lines (OCR_REOCR_PSM) upscaled OCR_REOCR_SCALE times.
+OCR_OUTPUT = os.getenv("OCR_OUTPUT", "text")  # text | structured
+OCR_STRUCTURED_CONFIG = {
+    "output": OCR_OUTPUT,
+    "reocr_confidence": float(os.getenv("OCR_REOCR_CONFIDENCE", "0")),
+    "reocr_psm": int(os.getenv("OCR_REOCR_PSM", "7")),
+    "reocr_scale": float(os.getenv("OCR_REOCR_SCALE", "2")),
+}
+
+# The native writer lays text out in-process in milliseconds; pandoc (with pdflatex) is an
+# optional higher-fidelity mode that falls back to the native writer when unavailable.
+TEXT_PDF_ENGINE = os.getenv("TEXT_PDF_ENGINE", "native")  # native | pandoc
+TEXT_PDF_FONT_FILE = os.getenv("TEXT_PDF_FONT_FILE")
+SUMMARY_CONFIG = {
+    "model": "gemini-1.5-flash",
+    "backend": os.getenv("SUMMARY_BACKEND", "gemini"),  # gemini | stub
+    "batch_size": int(os.getenv("SUMMARY_BATCH_SIZE", "1")),
+}
+
+# Images are enhanced and OCR'd in parallel on the engine; summaries share one rate-limited client.
+summarizer = SummarizationClient(
+    StubBackend() if SUMMARY_CONFIG["backend"] == "stub"
+    else GeminiBackend(SUMMARY_CONFIG["model"], os.getenv("GOOGLE_API_KEY")),
+    max_concurrency=int(os.getenv("SUMMARY_CONCURRENCY", "4")),
+    requests_per_minute=float(os.getenv("SUMMARY_REQUESTS_PER_MINUTE", "60")),
+    max_retries=int(os.getenv("SUMMARY_MAX_RETRIES", "4")),
+    batch_size=SUMMARY_CONFIG["batch_size"],
+    batch_window=float(os.getenv("SUMMARY_BATCH_WINDOW_SECONDS", "0.5")),
+)
+
+# Page texts and OCR results are split into overlapping chunks for retrieval. Chunks never span
+# pages or images, so each keeps its page, image index and bounding box.
+CHUNK_SIZE_CHARS = int(os.getenv("CHUNK_SIZE_CHARS", "1200"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("CHUNK_OVERLAP_CHARS", "200"))
+EMBEDDING_CONFIG = {
+    "model": os.getenv("EMBEDDING_MODEL", "models/text-embedding-004"),
+    "backend": os.getenv("EMBEDDING_BACKEND", "gemini"),  # gemini | stub
+}
+embedder = EmbeddingClient(
+    StubEmbeddingBackend() if EMBEDDING_CONFIG["backend"] == "stub"
+    else GeminiEmbeddingBackend(EMBEDDING_CONFIG["model"], os.getenv("GOOGLE_API_KEY")),
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "100")),
+    max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "4")),
+    requests_per_minute=float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "600")),
+)
+# Chunks are embedded into one local index shared by all documents. Uploads are indexed when
+# they ask for it (`index=true`); with INDEX_ON_INGEST, every document is, including jobs and batches.
+INDEX_ON_INGEST = os.getenv("INDEX_ON_INGEST", "false").lower() == "true"
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR") or os.path.join(tempfile.gettempdir(), "document_processor_index")
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+VECTOR_INDEX_MIN_TRAIN = int(os.getenv("VECTOR_INDEX_MIN_TRAIN", "4096"))
+
+# Uploads are spooled to the request workspace in chunks of this size.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# Background jobs keep their workspace (upload and artifacts) for this long after finishing.
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", str(24 * 3600)))
+
+# Batch ingestion. Batch jobs are queued below interactive /jobs/ submissions; archives may be
+# larger than a single upload, and server-side directories can only be ingested with the admin key.
+BATCH_JOB_PRIORITY = int(os.getenv("BATCH_JOB_PRIORITY", "-1"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "10000"))
+BATCH_MAX_ARCHIVE_BYTES = int(os.getenv("BATCH_MAX_ARCHIVE_BYTES", str(4 * 1024 * 1024 * 1024)))
+BATCH_ADMIN_KEY = os.getenv("BATCH_ADMIN_KEY")
+BATCH_DIRECTORY_ROOT = os.getenv("BATCH_DIRECTORY_ROOT")
+
+# PDF images smaller than this many pixels (icons, bullets) are not analysed. 0 disables the filter.
+MIN_IMAGE_AREA = int(os.getenv("MIN_IMAGE_AREA", "0"))
+
+# PDF pages are classified before extraction. Pages with a usable text layer are read directly;
+# pages mostly covered by images whose text layer is short or covers only a sliver of the page
+# (e.g. a "Scanned with ..." footer over a full-page scan) are rendered at OCR_DPI and OCR'd.
+PAGE_MIN_TEXT_CHARS = int(os.getenv("PAGE_MIN_TEXT_CHARS", "20"))
+PAGE_SCAN_IMAGE_RATIO = float(os.getenv("PAGE_SCAN_IMAGE_RATIO", "0.5"))
+PAGE_SCAN_TEXT_COVERAGE = float(os.getenv("PAGE_SCAN_TEXT_COVERAGE", "0.05"))
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+# Embedded images on pages that already have a text layer are enhanced and summarised, but only OCR'd
+# if enabled, or if the image alone covers at least PAGE_SCAN_IMAGE_RATIO of the page.
+OCR_IMAGES_ON_TEXT_PAGES = os.getenv("OCR_IMAGES_ON_TEXT_PAGES", "false").lower() == "true"
+
+# Everything that decides how a PDF page is routed and rendered, recorded in document manifests.
+EXTRACTION_CONFIG = {
+    "min_image_area": MIN_IMAGE_AREA,
+    "page_min_text_chars": PAGE_MIN_TEXT_CHARS,
+    "page_scan_image_ratio": PAGE_SCAN_IMAGE_RATIO,
+    "page_scan_text_coverage": PAGE_SCAN_TEXT_COVERAGE,
+    "ocr_dpi": OCR_DPI,
+    "ocr_images_on_text_pages": OCR_IMAGES_ON_TEXT_PAGES,
+}
+
+# Pages are pulled from the document only while fewer than this many pages still have events or
+# image analyses waiting to be consumed, so memory stays flat however long the document is. 0 disables the bound.
+STREAM_MAX_INFLIGHT_PAGES = int(os.getenv("STREAM_MAX_INFLIGHT_PAGES", "16"))
+# PDF pages extracted ahead of the one being consumed, so a single document (e.g. one job of a
+# batch) can keep the whole worker pool busy. Defaults to the number of engine workers.
+PDF_PAGE_PREFETCH = int(os.getenv("PDF_PAGE_PREFETCH", "0")) or execution_engine.max_workers
+# Documents with at least this many pages keep no enhanced images in memory; eagerly generated
+# output PDFs are then rendered from the workspace's files instead.
+STREAMING_PAGE_THRESHOLD = int(os.getenv("STREAMING_PAGE_THRESHOLD", "200"))
+
+# Each processed document gets a manifest (page and image hashes, stage configuration, outputs).
+# Resubmitting a document under the same `document_id` only recomputes what changed. Uploads without
+# one are keyed by their content, so only identical files share a manifest and index entries.
+MANIFESTS_ENABLED = os.getenv("MANIFESTS_ENABLED", "true").lower() == "true"
+manifest_store = ManifestStore(
+    os.getenv("MANIFEST_DIR"),
+    max_bytes=int(os.getenv("MANIFEST_MAX_BYTES", str(2 * 1024 * 1024 * 1024))),
+)
+
+result_cache = ContentCache(
+    memory_items=int(os.getenv("CACHE_MEMORY_ITEMS", "256")),
+    disk_dir=os.getenv("CACHE_DIR"),
+    disk_max_bytes=int(os.getenv("CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))),
+)
+
+
+async def _sweep_workspaces_periodically():
+    while True:
+        await asyncio.sleep(WORKSPACE_SWEEP_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(workspace_manager.sweep)
+        except Exception as e:
+            print(f"Workspace sweep failed: {e}")
+
+
+@app.on_event("startup")
+async def start_workspace_sweeper():
+    # Walking and deleting workspaces is blocking I/O, so it runs off the event loop.
+    await asyncio.to_thread(workspace_manager.sweep)
+    asyncio.create_task(_sweep_workspaces_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_execution_engine():
+    execution_engine.shutdown()
+
+
+# --- Capabilities ---
+# Optional backends are probed once per process and cached. The API process probes (and imports
+# the document libraries) in the background right after startup, unless WARM_UP_ON_STARTUP=false.
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
+HEAVY_MODULES = {"pymupdf": "fitz", "opencv": "cv2", "numpy": "numpy", "pillow": "PIL.Image",
+                 "python_docx": "docx", "python_pptx": "pptx"}
+
+_capabilities = None
+_capabilities_lock = threading.Lock()
+_warm_up_done = False
+
+def _has_module(name: str) -> bool:
+    import importlib.util
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+def _probe_pandoc() -> bool:
+    try:
+        import pypandoc
+        pypandoc.get_pandoc_version()
+        return True
+    except Exception:
+        return False
+
+def capabilities() -> dict:
+    """Which optional backends this process can use: pandoc, LaTeX, tesseract, Gemini and the document libraries."""
+    global _capabilities
+    if _capabilities is None:
+        with _capabilities_lock:
+            if _capabilities is None:
+                probed = {name: _has_module(module.split(".")[0]) for name, module in HEAVY_MODULES.items()}
+                probed.update({
+                    "pandoc": _probe_pandoc(),
+                    "pdflatex": shutil.which("pdflatex") is not None,
+                    "tesseract": shutil.which("tesseract") is not None,
+                    "tesserocr": _has_module("tesserocr"),
+                    "google_api_key": bool(os.getenv("GOOGLE_API_KEY")),
+                    "summary_backend": summarizer.backend.available and (
+                        SUMMARY_CONFIG["backend"] == "stub" or _has_module("google.generativeai")
+                    ),
+                })
+                _capabilities = probed
+    return _capabilities
+
+def warm_state() -> dict:
+    """What has already been loaded in this process, so the first request does not pay for it."""
+    import sys
+    return {
+        **{name: module in sys.modules for name, module in HEAVY_MODULES.items()},
+        "capabilities_probed": _capabilities is not None,
+        "ocr_backend": ocr.loaded_backend_name(),
+        "engine_started": execution_engine.started,
+        "summary_client_configured": getattr(summarizer.backend, "configured", True),
+    }
+
+def _warm_up():
+    global _warm_up_done
+    import importlib
+    capabilities()
+    for module in HEAVY_MODULES.values():
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"Optional module {module} unavailable: {e}")
+    _warm_up_done = True
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARM_UP_ON_STARTUP:
+        asyncio.get_running_loop().run_in_executor(None, _warm_up)
+
 
 # --- Core Processing Functions ---
 
-def apply_enhancement_pipeline(image: Image.Image) -> Image.Image:
-    """Applies a robust pipeline to enhance image quality for OCR."""
-    open_cv_image = cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
-    gray = cv2.cvtColor(open_cv_image, cv2.COLOR_BGR2GRAY)
-    denoised = cv2.fastNlMeansDenoising(gray, None, h=10, templateWindowSize=7, searchWindowSize=21)
-    sharpen_kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
-    sharpened = cv2.filter2D(denoised, -1, sharpen_kernel)
-    binary = cv2.adaptiveThreshold(
-        sharpened, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY, 11, 2
+def decode_grayscale(image_bytes: bytes):
+    """Decodes image bytes straight to a single-channel uint8 array, returning (gray, dpi)."""
+    import cv2
+    import numpy as np
+    from PIL import Image
+    gray = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    # Only the header is parsed here; PIL decodes pixels lazily.
+    pil_image = Image.open(io.BytesIO(image_bytes))
+    dpi = pil_image.info.get("dpi")
+    if gray is None:
+        # Formats OpenCV cannot decode (e.g. some JPEG 2000 or palette variants) go through PIL.
+        gray = np.asarray(pil_image.convert("L"))
+    return gray, dpi[0] if dpi else None
+
+class PageRender(NamedTuple):
+    """A PDF page to be rendered to grayscale by the worker that analyses it, in place of image bytes."""
+    file_path: str
+    page_num: int
+    dpi: int
+
+def render_page_grayscale(file_path: str, page_num: int, dpi: int):
+    """Renders a PDF page straight to 8-bit grayscale, returning (gray, pixmap).
+
+    `gray` is a view of the pixmap's sample buffer, not a copy, so the pixmap must be kept
+    alive for as long as `gray` is used.
+    """
+    import fitz  # PyMuPDF
+    import numpy as np
+    pixmap = _open_pdf(file_path)[page_num].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    gray = np.ndarray((pixmap.height, pixmap.width), dtype=np.uint8, buffer=pixmap.samples_mv, strides=(pixmap.stride, 1))
+    return gray, pixmap
+
+def load_grayscale(image):
+    """Returns (gray, dpi, owner) for encoded image bytes or a PageRender; `owner` keeps `gray`'s buffer alive."""
+    if isinstance(image, PageRender):
+        gray, pixmap = render_page_grayscale(*image)
+        return gray, image.dpi, pixmap
+    gray, dpi = decode_grayscale(image)
+    return gray, dpi, None
+
+def apply_enhancement_pipeline(gray: "np.ndarray", source_dpi: float = None, preset: str = None) -> "np.ndarray":
+    """Applies the configured enhancement preset to improve image quality for OCR."""
+    return enhancement.enhance(
+        gray, preset or ENHANCEMENT_PRESET, source_dpi=source_dpi,
+        tile_size=ENHANCEMENT_TILE_SIZE, tile_workers=ENHANCEMENT_TILE_WORKERS
     )
-    return Image.fromarray(binary)
 
-def extract_text_from_image(enhanced_image: Image.Image) -> str:
+def extract_text_from_image(enhanced_image: "Image.Image") -> str:
     """Performs OCR on an enhanced PIL Image."""
     try:
-        config = r'--oem 3 --psm 6'
-        return pytesseract.image_to_string(enhanced_image, config=config, lang='eng').strip()
+        return ocr.get_backend(OCR_BACKEND, **OCR_CONFIG).recognize(enhanced_image)
     except Exception as e:
         return f"[ERROR] OCR failed: {e}"
 
-def generate_gemini_summary(enhanced_image: Image.Image, ocr_text: str) -> str:
-    """Generates a summary using Gemini, combining visual and text analysis."""
-    if not os.getenv("GOOGLE_API_KEY"):
-        return "[INFO] Google API key not configured. Skipping summary."
-        
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    try:
-        prompt = f"""
-        Analyze the provided image and its OCR text to generate a concise summary.
-        Focus on the document's purpose, key data points, and any important entities.
-
-        OCR Text:
-        ---
-        {ocr_text}
-        ---
-        """
-        response = model.generate_content([prompt, enhanced_image])
-        return response.text.strip() if response.text else "[ERROR] Gemini returned an empty response."
+def extract_words_from_image(enhanced_image: "Image.Image"):
+    """Structured OCR of an enhanced PIL Image, returning (text, words dict, seconds spent re-reading lines)."""
+    try:
+        backend = ocr.get_backend(OCR_BACKEND, **OCR_CONFIG)
+        words = backend.recognize_words(enhanced_image)
+        reocr_seconds = 0.0
+        if OCR_STRUCTURED_CONFIG["reocr_confidence"] > 0:
+            started = time.perf_counter()
+            words, replaced = ocr.reocr_low_confidence(
+                backend, enhanced_image, words, OCR_STRUCTURED_CONFIG["reocr_confidence"],
+                psm=OCR_STRUCTURED_CONFIG["reocr_psm"], scale=OCR_STRUCTURED_CONFIG["reocr_scale"]
+            )
+            reocr_seconds = time.perf_counter() - started
+        else:
+            replaced = 0
+        return words.to_text(), {**words.to_dict(), "reocr_lines": replaced}, reocr_seconds
     except Exception as e:
-        return f"[ERROR] Gemini API call failed: {e}"
+        return f"[ERROR] OCR failed: {e}", None, 0.0
 
-def analyze_image_data(image_bytes: bytes, page_num: int, img_index: int, temp_dir: str):
-    """Full pipeline for a single image: enhance, OCR, summarize."""
-    pil_image = Image.open(io.BytesIO(image_bytes))
-    enhanced_image = apply_enhancement_pipeline(pil_image)
-    ocr_text = extract_text_from_image(enhanced_image)
-    summary = generate_gemini_summary(enhanced_image, ocr_text)
-    
+def enhance_and_ocr_image(image, output_path: str, run_ocr: bool = True):
+    """CPU-bound half of the image pipeline: enhance, OCR and save the enhanced image.
+
+    `image` is either encoded image bytes or a PageRender, which is rendered here directly into
+    grayscale samples, with no encode/decode round trip. Returns the enhanced image, the OCR text,
+    the structured OCR words (None unless OCR_OUTPUT is "structured") and the seconds spent in each
+    step. Workers may be separate processes, so timings travel back with the result instead of
+    being recorded here.
+    """
+    from PIL import Image
+    timings = {}
+    started = time.perf_counter()
+    gray, dpi, owner = load_grayscale(image)
+    timings["render" if owner is not None else "decode"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    binary = apply_enhancement_pipeline(gray, dpi)
+    timings["enhance"] = time.perf_counter() - started
+    del gray, owner
+    ocr_text, ocr_words = "", None
+    if run_ocr and OCR_OUTPUT == "structured":
+        started = time.perf_counter()
+        ocr_text, ocr_words, reocr_seconds = extract_words_from_image(Image.fromarray(binary))
+        timings["ocr"] = time.perf_counter() - started - reocr_seconds
+        if reocr_seconds:
+            timings["reocr"] = reocr_seconds
+    elif run_ocr:
+        started = time.perf_counter()
+        ocr_text = extract_text_from_image(Image.fromarray(binary))
+        timings["ocr"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _write_png(output_path, binary)
+    timings["write_png"] = time.perf_counter() - started
+    # Only the 1-bit packed result crosses back to the event loop process.
+    return enhancement.BinaryImage.from_array(binary), ocr_text, ocr_words, timings
+
+def _analysis_stage_config(run_ocr: bool) -> dict:
+    if not run_ocr:
+        return {**ENHANCEMENT_CONFIG, "ocr": "skipped"}
+    if OCR_OUTPUT == "structured":
+        return {**ENHANCEMENT_CONFIG, **OCR_CONFIG, **OCR_STRUCTURED_CONFIG}
+    return {**ENHANCEMENT_CONFIG, **OCR_CONFIG}
+
+def _write_png(output_path: str, image: "np.ndarray"):
+    import cv2
+    # imwrite reports a full disk or an unwritable path by returning False, not by raising.
+    if not cv2.imwrite(output_path, image):
+        raise OSError(f"Could not write {os.path.basename(output_path)}.")
+
+def _restore_enhanced_image(stored_path: str, output_path: str):
+    """Copies a stored enhanced image into the workspace, or returns None if it was evicted meanwhile."""
+    import cv2
+    try:
+        shutil.copyfile(stored_path, output_path)
+    except FileNotFoundError:
+        return None
+    image = cv2.imread(output_path, cv2.IMREAD_GRAYSCALE)
+    return enhancement.BinaryImage.from_array(image) if image is not None else None
+
+async def analyze_image_data(image, page_num: int, img_index: int, temp_dir: str, run_ocr: bool = True,
+                             manifest: DocumentManifest = None, image_hash: str = None):
+    """Full pipeline for a single image: enhance and OCR on the engine, then summarize.
+
+    `image` is encoded image bytes or a PageRender, which needs its `image_hash` passed in.
+    Each stage is taken from the previous run's manifest if it was computed from the same
+    image under the same configuration, then looked up in the result cache, keyed by the
+    image hash plus the configuration of every stage that feeds into it.
+    """
+    image_hash = image_hash or content_hash(image)
     img_filename = f"enhanced_page_{page_num + 1}_img_{img_index + 1}.png"
-    enhanced_image.save(os.path.join(temp_dir, img_filename))
-    
+    output_path = os.path.join(temp_dir, img_filename)
+
+    stage_config = _analysis_stage_config(run_ocr)
+    stage_key = make_cache_key("analysis", image_hash, stage_config)
+    previous = manifest.previous_image(stage_key) if manifest is not None else None
+    stored_path = manifest_store.image_path(manifest.document_id, stage_key) if previous is not None else None
+    ocr_ms = None
+    enhanced_image = None
+    if previous is not None and os.path.exists(stored_path):
+        with metrics.span("manifest_restore"):
+            enhanced_image = await asyncio.to_thread(_restore_enhanced_image, stored_path, output_path)
+    if enhanced_image is not None:
+        ocr_text, ocr_words = previous["ocr_text"], previous.get("ocr_words")
+        manifest.stats["images_reused"] += 1
+        metrics.images_total.inc("manifest")
+    else:
+        with metrics.span("cache_lookup"):
+            cached = await asyncio.to_thread(result_cache.get, stage_key)
+        if cached is not None:
+            # Entries computed in text mode hold no words.
+            enhanced_image, ocr_text, ocr_words = (*cached, None)[:3]
+            await asyncio.to_thread(_write_png, output_path, enhanced_image.to_array())
+            metrics.images_total.inc("cache")
+        else:
+            started = time.perf_counter()
+            with metrics.span("enhance_and_ocr"):
+                enhanced_image, ocr_text, ocr_words, timings = await execution_engine.run(
+                    enhance_and_ocr_image, image, output_path, run_ocr, group=temp_dir
+                )
+            for stage, seconds in timings.items():
+                metrics.observe(stage, seconds)
+            metrics.observe("engine_wait", max(0.0, time.perf_counter() - started - sum(timings.values())))
+            metrics.images_total.inc("computed")
+            if "ocr" in timings:
+                ocr_ms = round(timings["ocr"] * 1000, 2)
+            if ocr_text.startswith("[ERROR]"):
+                metrics.errors_total.inc("ocr")
+            else:
+                cached = (enhanced_image, ocr_text) if ocr_words is None else (enhanced_image, ocr_text, ocr_words)
+                await asyncio.to_thread(result_cache.put, stage_key, cached)
+        if manifest is not None:
+            manifest.stats["images_processed"] += 1
+
+    summary_key = make_cache_key("summary", image_hash, {**stage_config, **SUMMARY_CONFIG})
+    if previous is not None and previous.get("summary_key") == summary_key:
+        summary = previous["summary"]
+        manifest.stats["summaries_reused"] += 1
+    else:
+        summary = await asyncio.to_thread(result_cache.get, summary_key)
+    if summary is None:
+        with metrics.span("summary"):
+            summary = await summarizer.summarize(enhanced_image.to_pil(), ocr_text, group=temp_dir)
+        if summary.startswith("[ERROR]"):
+            metrics.errors_total.inc("summary")
+        # Placeholder and error strings are not worth remembering.
+        if not summary.startswith(("[ERROR]", "[INFO]")):
+            await asyncio.to_thread(result_cache.put, summary_key, summary)
+
+    if manifest is not None and not ocr_text.startswith("[ERROR]"):
+        summary_ok = not summary.startswith(("[ERROR]", "[INFO]"))
+        manifest.record_image(stage_key, {
+            "image_hash": image_hash,
+            "filename": img_filename,
+            "ocr_text": ocr_text,
+            **({"ocr_words": ocr_words} if ocr_words is not None else {}),
+            "summary_key": summary_key if summary_ok else None,
+            "summary": summary if summary_ok else None,
+        })
+
     return {
         "source_page": page_num + 1,
+        "image_index": img_index + 1,
         "filename": img_filename,
+        "image_hash": image_hash,
         "ocr_text": ocr_text,
+        "ocr_ms": ocr_ms,
+        **({"ocr_words": ocr_words} if ocr_words is not None else {}),
         "summary": summary
     }, enhanced_image
 
+def write_text_only_pdf(text_content: str, text_pdf_path: str):
+    """Writes the text-only PDF with the configured engine, skipping pandoc if it was probed unavailable."""
+    if TEXT_PDF_ENGINE == "pandoc" and capabilities()["pandoc"] and capabilities()["pdflatex"]:
+        try:
+            import pypandoc
+            pypandoc.convert_text(text_content, 'pdf', format='markdown',
+                                  outputfile=text_pdf_path, extra_args=['--pdf-engine=pdflatex'])
+            return text_pdf_path
+        except Exception as e:
+            print(f"Pandoc PDF conversion failed, using the native writer: {e}")
+    from pdf_writer import write_text_pdf
+    return write_text_pdf(text_content, text_pdf_path, fontfile=TEXT_PDF_FONT_FILE)
+
+def write_text_only_pdf_from_file(text_path: str, text_pdf_path: str, chunk_chars: int = 1024 * 1024):
+    """Like write_text_only_pdf, but lays the text out from a file in chunks instead of reading it whole."""
+    if TEXT_PDF_ENGINE == "pandoc" and capabilities()["pandoc"] and capabilities()["pdflatex"]:
+        with open(text_path, encoding="utf-8") as f:
+            return write_text_only_pdf(f.read(), text_pdf_path)
+    from pdf_writer import TextPdfWriter
+    with open(text_path, encoding="utf-8") as f, TextPdfWriter(text_pdf_path, fontfile=TEXT_PDF_FONT_FILE) as writer:
+        for chunk in iter(lambda: f.read(chunk_chars), ""):
+            writer.write(chunk)
+    return text_pdf_path
+
+def write_images_only_pdf(images, image_pdf_path: str):
+    """Writes one page per binarised image (2-D uint8 arrays) into `image_pdf_path`."""
+    import fitz  # PyMuPDF
+    image_doc = fitz.open()
+    for image in images:
+        height, width = image.shape[:2]
+        # Pages are sized as if the image were printed at 100 DPI.
+        pixmap = fitz.Pixmap(fitz.csGRAY, width, height, image.tobytes(), 0)
+        page = image_doc.new_page(width=width * 0.72, height=height * 0.72)
+        page.insert_image(page.rect, pixmap=pixmap)
+    image_doc.save(image_pdf_path, deflate=True)  # Saved empty if no images were found
+    image_doc.close()
+    return image_pdf_path
+
 def create_output_pdfs(text_content: str, enhanced_images: list, temp_dir: str):
-    """Creates two separate PDFs: one for text and one for images."""
-    # Create Text-Only PDF using Pandoc for robust, multi-page conversion
-    text_pdf_path = os.path.join(temp_dir, "text_only_output.pdf")
-    try:
-        pypandoc.convert_text(text_content, 'pdf', format='markdown',
-                              outputfile=text_pdf_path, extra_args=['--pdf-engine=pdflatex'])
-    except Exception:
-        # Fallback to a simpler text insertion if LaTeX isn't installed
-        text_doc = fitz.open()
-        page = text_doc.new_page()
-        page.insert_textbox(page.rect, text_content, fontsize=11, fontname="helv")
-        text_doc.save(text_pdf_path)
-        text_doc.close()
-
-    # Create Image-Only PDF
-    image_pdf_path = os.path.join(temp_dir, "images_only_output.pdf")
-    if enhanced_images:
-        img_docs = [Image.open(os.path.join(temp_dir, res['filename'])) for res in enhanced_images]
-        img_docs[0].save(
-            image_pdf_path, "PDF", resolution=100.0,
-            save_all=True, append_images=img_docs[1:]
-        )
+    """Creates two separate PDFs: one for text and one for the in-memory enhanced images."""
+    text_pdf_path = os.path.join(temp_dir, ARTIFACT_FILES["text-only.pdf"])
+    write_text_only_pdf(text_content, text_pdf_path)
+    image_pdf_path = os.path.join(temp_dir, ARTIFACT_FILES["images-only.pdf"])
+    write_images_only_pdf((enhanced_image.to_array() for enhanced_image in enhanced_images), image_pdf_path)
+    return text_pdf_path, image_pdf_path
+
+# --- Lazy Artifacts ---
+# Every processed workspace keeps the extracted text and an index of its enhanced PNGs, so the
+# output PDFs can be rendered on first download instead of on every request.
+ARTIFACT_FILES = {"text-only.pdf": "text_only_output.pdf", "images-only.pdf": "images_only_output.pdf"}
+DOCUMENT_TEXT_FILE = "document_text.txt"
+CHUNKS_FILE = "chunks.jsonl"
+ARTIFACT_INDEX_FILE = "artifacts.json"
+
+def save_intermediate_results(temp_dir: str, text_content: str, image_filenames: list):
+    """Saves the text (unless None, when it was already streamed to DOCUMENT_TEXT_FILE) and the image index."""
+    if text_content is not None:
+        with open(os.path.join(temp_dir, DOCUMENT_TEXT_FILE), "w", encoding="utf-8") as f:
+            f.write(text_content)
+    with open(os.path.join(temp_dir, ARTIFACT_INDEX_FILE), "w") as f:
+        json.dump({"images": image_filenames}, f)
+
+def render_artifact(temp_dir: str, artifact: str, max_bytes: int = None) -> str:
+    """Renders one output PDF from a workspace's saved intermediate results, unless it already exists.
+
+    A rendering larger than `max_bytes` (the workspace's remaining quota) is discarded.
+    """
+    path = os.path.join(temp_dir, ARTIFACT_FILES[artifact])
+    if os.path.exists(path):
+        return path
+    # Render to a scratch name first so a concurrent download never sees a half-written file.
+    partial_path = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+    if artifact == "text-only.pdf":
+        write_text_only_pdf_from_file(os.path.join(temp_dir, DOCUMENT_TEXT_FILE), partial_path)
     else:
-        fitz.open().save(image_pdf_path) # Create an empty PDF if no images were found
+        with open(os.path.join(temp_dir, ARTIFACT_INDEX_FILE)) as f:
+            filenames = json.load(f)["images"]
+        import cv2
+        images = (cv2.imread(os.path.join(temp_dir, name), cv2.IMREAD_GRAYSCALE) for name in filenames)
+        write_images_only_pdf(images, partial_path)
+    if max_bytes is not None and os.path.getsize(partial_path) > max_bytes:
+        os.remove(partial_path)
+        raise QuotaExceededError(f"{artifact} would exceed the workspace's disk quota.")
+    os.replace(partial_path, path)
+    return path
 
-    return text_pdf_path, image_pdf_path
+def artifact_urls(workspace_id: str) -> dict:
+    return {
+        "text_only_pdf_url": f"/documents/{workspace_id}/artifacts/text-only.pdf",
+        "images_only_pdf_url": f"/documents/{workspace_id}/artifacts/images-only.pdf",
+        "chunks_url": f"/documents/{workspace_id}/chunks",
+    }
 
 # --- Document Specific Handlers ---
+#
+# Each handler is an async generator of (event, images) pairs: a "document" event first, then
+# one "page" event per page/slide together with the images first seen on it, as
+# (page_num, img_index, image, refs) tuples, where `image` is encoded bytes or a PageRender.
+# `refs` is merged into the image's analysis.
+
+_open_pdfs = OrderedDict()
+_open_pdfs_lock = threading.Lock()
 
-def process_pdf_file(file_bytes: bytes, temp_dir: str):
-    pdf_doc = fitz.open(stream=file_bytes, filetype="pdf")
-    all_text = ""
-    image_analysis_results = []
+def _open_pdf(file_path: str):
+    """Keeps recently used PDFs open per worker so page-wise calls don't re-parse the file."""
+    import fitz  # PyMuPDF
+    with _open_pdfs_lock:
+        pdf_doc = _open_pdfs.pop(file_path, None)
+        if pdf_doc is None or pdf_doc.is_closed:
+            pdf_doc = fitz.open(file_path, filetype="pdf")
+        _open_pdfs[file_path] = pdf_doc
+        while len(_open_pdfs) > 8:
+            _open_pdfs.popitem(last=False)
+    return pdf_doc
 
-    for page_num, page in enumerate(pdf_doc):
-        all_text += page.get_text("text") + "\n\n"
-        for img_index, img in enumerate(page.get_images(full=True)):
-            xref = img[0]
-            base_image = pdf_doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            analysis, _ = analyze_image_data(image_bytes, page_num, img_index, temp_dir)
-            image_analysis_results.append(analysis)
+def count_pdf_pages(file_path: str) -> int:
+    return len(_open_pdf(file_path))
 
-    return all_text, image_analysis_results
+def classify_pdf_page(page, text: str):
+    """Classifies a page as "text" (usable text layer) or "scanned" (needs render-and-OCR).
 
-def process_docx_file(file_bytes: bytes, temp_dir: str):
-    doc = docx.Document(io.BytesIO(file_bytes))
+    Returns the page type plus the text and image coverage ratios it was based on.
+    """
+    import fitz  # PyMuPDF
+    page_area = abs(page.rect) or 1.0
+    text_area = sum(abs(fitz.Rect(block[:4]) & page.rect) for block in page.get_text("blocks") if block[6] == 0)
+    image_area = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    metrics = {
+        "text_coverage": round(min(1.0, text_area / page_area), 3),
+        "image_coverage": round(min(1.0, image_area / page_area), 3),
+    }
+    if metrics["image_coverage"] >= PAGE_SCAN_IMAGE_RATIO and (
+        len(text.strip()) < PAGE_MIN_TEXT_CHARS or metrics["text_coverage"] < PAGE_SCAN_TEXT_COVERAGE
+    ):
+        return "scanned", metrics
+    return "text", metrics
+
+def _rect_coverage(rect: list, page_rect: list) -> float:
+    """Fraction of the page covered by `rect`, both given as [x0, y0, x1, y1]."""
+    width = min(rect[2], page_rect[2]) - max(rect[0], page_rect[0])
+    height = min(rect[3], page_rect[3]) - max(rect[1], page_rect[1])
+    page_area = (page_rect[2] - page_rect[0]) * (page_rect[3] - page_rect[1]) or 1.0
+    return max(0.0, width) * max(0.0, height) / page_area
+
+def pdf_page_hash(pdf_doc, page) -> str:
+    """Hashes everything get_pixmap draws a page from, without rendering it.
+
+    That is the page's size and content stream, its resources (images, Form XObjects and fonts,
+    by object and raw stream) and its annotations and widgets with their appearance streams, so
+    e.g. a stamp added to an unchanged scan changes the hash.
+    """
+    hasher = hashlib.sha256(f"{tuple(page.rect)}:{page.rotation}".encode())
+    hasher.update(page.read_contents())
+    resources = pdf_doc.xref_get_key(page.xref, "Resources")
+    hasher.update(f"{resources}".encode())
+    xrefs = {img[0] for img in page.get_images(full=True)}
+    xrefs |= {xobject[0] for xobject in page.get_xobjects()}
+    xrefs |= {font[0] for font in page.get_fonts(full=True)}
+    annotations = [annot[0] for annot in page.annot_xrefs()]
+    for xref in annotations:
+        kind, value = pdf_doc.xref_get_key(xref, "AP/N")
+        hasher.update(f"{xref}:{kind}:{value}".encode())
+        if kind == "xref":
+            xrefs.add(int(value.split()[0]))
+    for xref in annotations + sorted(xref for xref in xrefs if xref > 0):
+        hasher.update(pdf_doc.xref_object(xref, compressed=True).encode())
+        if pdf_doc.xref_is_stream(xref):
+            hasher.update(pdf_doc.xref_stream_raw(xref) or b"")
+    return hasher.hexdigest()
+
+def _rounded_rect(rect) -> list:
+    return [round(coordinate, 2) for coordinate in rect]
+
+def extract_pdf_page(file_path: str, page_num: int, known_xrefs: frozenset):
+    """Classifies one page and extracts what its route needs.
+
+    Text pages return their text layer, their image xrefs, and the bytes and bounding boxes (in
+    PDF points) of images not seen on earlier pages; images shared across pages (headers, watermarks, signatures) are extracted
+    only the first time their xref appears. Scanned pages return no images: their embedded
+    streams (often huge JBIG2/CCITT/JPEG scans) are never decoded, the page is rendered at
+    OCR_DPI by the worker that analyses it instead.
+    """
+    pdf_doc = _open_pdf(file_path)
+    page = pdf_doc[page_num]
+    text = page.get_text("text")
+    page_type, metrics = classify_pdf_page(page, text)
+    page_info = {"page_type": page_type, "page_hash": pdf_page_hash(pdf_doc, page), "page_rect": _rounded_rect(page.rect), **metrics}
+
+    if page_type == "scanned":
+        return text, page_info, [], []
+
+    image_xrefs = []
+    new_images = []
+
+    for img_index, img in enumerate(page.get_images(full=True)):
+        xref, width, height = img[0], img[2], img[3]
+        if xref in image_xrefs:
+            continue
+        image_xrefs.append(xref)
+        if xref in known_xrefs or width * height < MIN_IMAGE_AREA:
+            continue
+        rects = page.get_image_rects(xref)
+        new_images.append((img_index, xref, pdf_doc.extract_image(xref)["image"], _rounded_rect(rects[0]) if rects else None))
+
+    return text, page_info, image_xrefs, new_images
+
+def extract_docx_content(file_path: str):
+    import docx
+    doc = docx.Document(file_path)
     all_text = "\n".join([para.text for para in doc.paragraphs if para.text.strip()])
-    image_analysis_results = []
-    
+    images = []
+
     for i, rel in enumerate(doc.part.rels.values()):
         if "image" in rel.target_ref:
-            image_bytes = rel.target_part.blob
-            analysis, _ = analyze_image_data(image_bytes, 0, i, temp_dir)
-            image_analysis_results.append(analysis)
-            
-    return all_text, image_analysis_results
-
-def process_pptx_file(file_bytes: bytes, temp_dir: str):
-    prs = Presentation(io.BytesIO(file_bytes))
-    all_text = ""
-    image_analysis_results = []
+            images.append((0, i, rel.target_part.blob, {}))
+
+    return all_text, images
+
+def extract_pptx_content(file_path: str):
+    """Returns (slide_text, images) for every slide."""
+    from pptx import Presentation
+    prs = Presentation(file_path)
+    slides = []
     img_index = 0
 
     for slide_num, slide in enumerate(prs.slides):
-        all_text += f"\n--- Slide {slide_num + 1} ---\n"
+        slide_text = f"--- Slide {slide_num + 1} ---\n"
+        images = []
         for shape in slide.shapes:
             if hasattr(shape, "text"):
-                all_text += shape.text + "\n"
+                slide_text += shape.text + "\n"
             if hasattr(shape, "image"):
-                image_bytes = shape.image.blob
-                analysis, _ = analyze_image_data(image_bytes, slide_num, img_index, temp_dir)
-                image_analysis_results.append(analysis)
+                images.append((slide_num, img_index, shape.image.blob, {}))
                 img_index += 1
-                
-    return all_text, image_analysis_results
+        slides.append((slide_text, images))
+
+    return slides
+
+def page_render_hash(page_hash: str, dpi: int) -> str:
+    """Identifies a page render by what it is drawn from, so cached results are found without rendering."""
+    return content_hash(f"render:{page_hash}:{dpi}:gray".encode())
+
+async def iter_pdf_pages(file_path: str, group: str = None, manifest: DocumentManifest = None):
+    with metrics.span("extract_pdf"):
+        page_count = await execution_engine.run(count_pdf_pages, file_path, group=group)
+    yield {"type": "document", "pages": page_count}, []
+
+    async def extract(page_num: int, known_xrefs: frozenset):
+        with metrics.span("extract_pdf"):
+            return await execution_engine.run(extract_pdf_page, file_path, page_num, known_xrefs, group=group)
+
+    image_refs = {}
+    prefetched = deque()
+    try:
+        for page_num in range(page_count):
+            while len(prefetched) < max(1, PDF_PAGE_PREFETCH) and page_num + len(prefetched) < page_count:
+                next_page = page_num + len(prefetched)
+                prefetched.append(asyncio.ensure_future(extract(next_page, frozenset(image_refs))))
+            text, page_info, image_xrefs, page_images = await prefetched.popleft()
+            yield _pdf_page_event(file_path, page_num, text, page_info, image_xrefs, page_images, image_refs, manifest)
+    finally:
+        for task in prefetched:
+            task.cancel()
+        await asyncio.gather(*prefetched, return_exceptions=True)
+
+def _pdf_page_event(file_path: str, page_num: int, text: str, page_info: dict, image_xrefs: list,
+                    page_images: list, image_refs: dict, manifest: DocumentManifest = None):
+    """Turns one extracted page into its page event and image work; called in page order.
+
+    Pages are extracted ahead of the one being consumed, so an image first seen on a page that was
+    still being extracted arrives again with a later page; only its first appearance is analysed.
+    """
+    if page_info["page_type"] == "scanned":
+        # The rendered page replaces its embedded images; its OCR text becomes the page text.
+        render_hash = page_render_hash(page_info["page_hash"], OCR_DPI)
+        if manifest is not None:
+            previous = manifest.previous_page(page_num + 1)
+            if previous is not None and previous.get("render_hash") == render_hash:
+                manifest.stats["pages_reused"] += 1
+            manifest.record_page(page_num + 1, {"hash": page_info["page_hash"], "page_type": "scanned", "render_hash": render_hash})
+        refs = {"page_type": "scanned", "page_render": True, "dpi": OCR_DPI, "image_hash": render_hash, "bbox": page_info["page_rect"]}
+        page_render = PageRender(file_path, page_num, OCR_DPI)
+        return {"type": "page", "page": page_num + 1, "text": text, **page_info}, [(page_num, 0, page_render, refs)]
+
+    if manifest is not None:
+        manifest.record_page(page_num + 1, {"hash": page_info["page_hash"], "page_type": "text"})
+
+    for xref in image_xrefs:
+        if xref in image_refs and page_num + 1 not in image_refs[xref]["source_pages"]:
+            image_refs[xref]["source_pages"].append(page_num + 1)
+    images = []
+    for img_index, xref, image_bytes, bbox in page_images:
+        if xref in image_refs:
+            continue
+        image_refs[xref] = {"xref": xref, "source_pages": [page_num + 1], "bbox": bbox}
+        # An image covering most of the page likely carries content the text layer lacks.
+        if not OCR_IMAGES_ON_TEXT_PAGES and not (bbox and _rect_coverage(bbox, page_info["page_rect"]) >= PAGE_SCAN_IMAGE_RATIO):
+            image_refs[xref]["ocr_skipped"] = True
+        images.append((page_num, img_index, image_bytes, image_refs[xref]))
+    return {"type": "page", "page": page_num + 1, "text": text, "image_xrefs": image_xrefs, **page_info}, images
+
+async def iter_docx_pages(file_path: str, group: str = None):
+    with metrics.span("extract_docx"):
+        all_text, images = await execution_engine.run(extract_docx_content, file_path, group=group)
+    yield {"type": "document", "pages": 1}, []
+    yield {"type": "page", "page": 1, "text": all_text}, images
+
+async def iter_pptx_pages(file_path: str, group: str = None):
+    with metrics.span("extract_pptx"):
+        slides = await execution_engine.run(extract_pptx_content, file_path, group=group)
+    yield {"type": "document", "pages": len(slides)}, []
+    for slide_num, (slide_text, images) in enumerate(slides):
+        yield {"type": "page", "page": slide_num + 1, "text": slide_text}, images
+
+async def iter_image_pages(file_path: str, group: str = None):
+    with metrics.span("read_image"):
+        image_bytes = await asyncio.to_thread(_read_file, file_path)
+    yield {"type": "document", "pages": 1}, []
+    yield {"type": "page", "page": 1, "text": ""}, [(0, 0, image_bytes, {})]
+
+_DONE = object()
+
+async def stream_document(page_source, temp_dir: str, manifest: DocumentManifest = None):
+    """Yields page events as pages are extracted and image events as each analysis finishes.
+
+    Images are analysed concurrently while later pages are still being extracted, so image
+    events arrive in completion order; each carries its `position` in document order. At most
+    STREAM_MAX_INFLIGHT_PAGES pages are in flight: a page counts until its event and all of its
+    image events have been consumed.
+    """
+    queue = asyncio.Queue()
+    tasks = set()
+    window = asyncio.Semaphore(STREAM_MAX_INFLIGHT_PAGES) if STREAM_MAX_INFLIGHT_PAGES > 0 else None
+    outstanding = {}
+
+    async def analyze(slot, position, page_num, img_index, image, refs):
+        try:
+            analysis, enhanced_image = await analyze_image_data(
+                image, page_num, img_index, temp_dir, run_ocr=not refs.get("ocr_skipped"),
+                manifest=manifest, image_hash=refs.get("image_hash")
+            )
+        except Exception as e:
+            await queue.put((slot, e))
+            return
+        analysis.update(refs)
+        await queue.put((slot, {"type": "image", "position": position, "analysis": analysis, "enhanced_image": enhanced_image}))
+
+    async def produce():
+        pages = page_source.__aiter__()
+        position = 0
+        try:
+            for slot in itertools.count():
+                if window is not None:
+                    await window.acquire()
+                try:
+                    event, images = await pages.__anext__()
+                except StopAsyncIteration:
+                    break
+                outstanding[slot] = 1 + len(images)
+                if event["type"] == "page":
+                    event["images_queued"] = len(images)
+                await queue.put((slot, event))
+                for page_num, img_index, image, refs in images:
+                    task = asyncio.create_task(analyze(slot, position, page_num, img_index, image, refs))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    position += 1
+            await asyncio.gather(*tasks)
+        finally:
+            for task in list(tasks):
+                task.cancel()
+
+    producer = asyncio.create_task(produce())
+    producer.add_done_callback(lambda _: queue.put_nowait(_DONE))
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            slot, event = item
+            if isinstance(event, Exception):
+                raise event
+            yield event
+            outstanding[slot] -= 1
+            if not outstanding[slot]:
+                del outstanding[slot]
+                if window is not None:
+                    window.release()
+        producer.result()
+    finally:
+        producer.cancel()
+
+class DocumentCollector:
+    """Assembles streamed events into the combined text and the image results in document order.
+
+    With a `text_path`, page texts are appended to that file as soon as every earlier page is
+    final (a scanned page once its OCR text arrives) instead of being held until the end. Enhanced
+    images are only kept for documents below STREAMING_PAGE_THRESHOLD pages.
+    """
+
+    def __init__(self, progress=None, text_path: str = None):
+        self.progress = progress
+        self.text_path = text_path
+        self.page_texts = {}
+        self.images_queued = 0
+        self.keeps_images = True
+        self._images = {}
+        self._enhanced_images = {}
+        self._awaiting_render = set()
+        self._next_page = None
+        self._text_file = None
+
+    def add(self, event: dict):
+        if event["type"] == "document":
+            self.keeps_images = event["pages"] < STREAMING_PAGE_THRESHOLD
+            if self.progress is not None:
+                self.progress.set_totals(pages=event["pages"])
+        elif event["type"] == "page":
+            self.page_texts[event["page"]] = event["text"]
+            if event.get("page_type") == "scanned":
+                self._awaiting_render.add(event["page"])
+            self.images_queued += event["images_queued"]
+            if self.progress is not None:
+                self.progress.set_totals(images=self.images_queued)
+                self.progress.page_done()
+        elif event["type"] == "image":
+            self._images[event["position"]] = event["analysis"]
+            if self.keeps_images:
+                self._enhanced_images[event["position"]] = event["enhanced_image"]
+            if event["analysis"].get("page_render"):
+                self.page_texts[event["analysis"]["source_page"]] = event["analysis"]["ocr_text"]
+                self._awaiting_render.discard(event["analysis"]["source_page"])
+            if self.progress is not None:
+                self.progress.image_done(event["analysis"])
+        if self.text_path is not None:
+            self._flush_text()
+
+    def _flush_text(self, final: bool = False):
+        """Appends the longest run of final pages that directly follows what was already written."""
+        if self._text_file is None:
+            self._text_file = open(self.text_path, "w", encoding="utf-8")
+        while self.page_texts:
+            page = min(self.page_texts) if self._next_page is None or final else self._next_page
+            if page not in self.page_texts or (page in self._awaiting_render and not final):
+                break
+            if self._next_page is not None:
+                self._text_file.write("\n\n")
+            self._text_file.write(self.page_texts.pop(page))
+            self._next_page = page + 1
+
+    def close(self):
+        """Writes any remaining page text and closes the text file."""
+        if self.text_path is not None:
+            self._flush_text(final=True)
+            self._text_file.close()
+
+    @property
+    def all_text(self) -> str:
+        if self.text_path is not None:
+            with open(self.text_path, encoding="utf-8") as f:
+                return f.read()
+        return "\n\n".join(self.page_texts[page] for page in sorted(self.page_texts))
+
+    @property
+    def image_analysis(self) -> list:
+        return [self._images[position] for position in sorted(self._images)]
+
+    @property
+    def enhanced_images(self) -> list:
+        return [self._enhanced_images[position] for position in sorted(self._enhanced_images)]
+
+async def _collect(page_source, temp_dir: str, progress=None):
+    collector = DocumentCollector(progress)
+    async for event in stream_document(page_source, temp_dir):
+        collector.add(event)
+    return collector.all_text, collector.image_analysis
+
+async def process_pdf_file(file_path: str, temp_dir: str, progress=None):
+    return await _collect(iter_pdf_pages(file_path, temp_dir), temp_dir, progress)
+
+async def process_docx_file(file_path: str, temp_dir: str, progress=None):
+    return await _collect(iter_docx_pages(file_path, temp_dir), temp_dir, progress)
+
+async def process_pptx_file(file_path: str, temp_dir: str, progress=None):
+    return await _collect(iter_pptx_pages(file_path, temp_dir), temp_dir, progress)
+
+# --- Upload Ingestion ---
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+async def spool_upload(file: UploadFile, destination: str, hasher=None, max_bytes: int = None, workspace=None):
+    """Streams an upload to disk in chunks, enforcing MAX_UPLOAD_BYTES (or `max_bytes`).
+
+    If a hashlib `hasher` is given it is fed every chunk, so the upload is hashed without a second read.
+    Chunks are counted against `workspace`'s quota before they are written.
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    written = 0
+    with open(destination, "wb") as out:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadTooLargeError(
+                    f"Upload exceeds the maximum size of {max_bytes // (1024 * 1024)} MB."
+                )
+            if hasher is not None:
+                hasher.update(chunk)
+            if workspace is not None:
+                workspace.add_usage(len(chunk))
+            await asyncio.to_thread(out.write, chunk)
+    return written
+
+def copy_limited(source, destination: str, hasher=None, workspace=None):
+    """Copies a readable file object to disk like spool_upload, for archive members and local files."""
+    written = 0
+    with open(destination, "wb") as out:
+        while True:
+            chunk = source.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > MAX_UPLOAD_BYTES:
+                raise UploadTooLargeError(
+                    f"File exceeds the maximum size of {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."
+                )
+            if hasher is not None:
+                hasher.update(chunk)
+            if workspace is not None:
+                workspace.add_usage(len(chunk))
+            out.write(chunk)
+    return written
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def _file_hash(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+# --- Retrieval ---
+
+_vector_index = None
+_vector_index_lock = threading.Lock()
+
+def get_vector_index():
+    """Opens the shared vector index on first use, so numpy is only imported once it is needed."""
+    global _vector_index
+    with _vector_index_lock:
+        if _vector_index is None:
+            from vector_index import VectorIndex
+            _vector_index = VectorIndex(VECTOR_INDEX_DIR, nprobe=VECTOR_INDEX_NPROBE, min_train=VECTOR_INDEX_MIN_TRAIN)
+        return _vector_index
+
+def add_chunks(writer: ChunkWriter, event: dict):
+    """Chunks a page's text layer or an image's OCR text as its event arrives."""
+    if event["type"] == "page" and event.get("page_type") != "scanned":
+        writer.add(event["text"], page=event["page"], source="text")
+    elif event["type"] == "image":
+        analysis = event["analysis"]
+        if analysis["ocr_text"] and not analysis["ocr_text"].startswith("[ERROR]"):
+            writer.add(analysis["ocr_text"], page=analysis["source_page"], image_index=analysis["image_index"],
+                       bbox=analysis.get("bbox"), source="ocr")
+
+async def index_document_chunks(document_id: str, chunks_path: str, original_filename: str, workspace_id: str) -> int:
+    """Embeds a document's chunks in batches and replaces its earlier entries in the vector index."""
+    index = await asyncio.to_thread(get_vector_index)
+    await asyncio.to_thread(index.remove_document, document_id)
+    indexed = 0
+    for batch in read_chunks(chunks_path, batch_size=embedder.batch_size * 4):
+        with metrics.span("embed"):
+            vectors = await embedder.embed_many([chunk["text"] for chunk in batch])
+        metadatas = [{"original_filename": original_filename, "workspace_id": workspace_id, **chunk} for chunk in batch]
+        await asyncio.to_thread(index.add, document_id, vectors, metadatas)
+        indexed += len(batch)
+    return indexed
+
+# --- Pipeline ---
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".pptx")
+
+def is_supported_upload(filename: str, content_type: str) -> bool:
+    file_extension = os.path.splitext(filename)[1].lower()
+    return file_extension in SUPPORTED_EXTENSIONS or bool(content_type and content_type.startswith("image/"))
+
+def _unsupported_file_error(filename: str) -> HTTPException:
+    return HTTPException(status_code=400, detail=f"Unsupported file type: {filename}. Please upload a PDF, DOCX, PPTX, or image file.")
+
+def _page_source(upload_path: str, original_filename: str, content_type: str, group: str = None,
+                 manifest: DocumentManifest = None):
+    """Picks the page iterator for a file; `group` is its scheduling group on the execution engine."""
+    file_extension = os.path.splitext(original_filename)[1].lower()
+    if file_extension == ".pdf":
+        return iter_pdf_pages(upload_path, group, manifest)
+    if file_extension == ".docx":
+        return iter_docx_pages(upload_path, group)
+    if file_extension == ".pptx":
+        return iter_pptx_pages(upload_path, group)
+    if content_type and content_type.startswith("image/"):
+        return iter_image_pages(upload_path, group)
+    raise _unsupported_file_error(original_filename)
+
+def default_document_id(source_sha256: str) -> str:
+    """Id of a document submitted without one: its content, so same-named uploads never collide."""
+    return f"sha256:{source_sha256}"
+
+async def _open_manifest(document_id: str, source_sha256: str):
+    if not MANIFESTS_ENABLED:
+        return None
+    previous = await asyncio.to_thread(manifest_store.load, document_id)
+    stages = {
+        "extraction": EXTRACTION_CONFIG,
+        "analysis": _analysis_stage_config(True),
+        "summary": SUMMARY_CONFIG,
+    }
+    return DocumentManifest(document_id, stages, previous, source_sha256)
+
+def _document_format(original_filename: str, content_type: str) -> str:
+    file_extension = os.path.splitext(original_filename)[1].lower()
+    if file_extension in SUPPORTED_EXTENSIONS:
+        return file_extension.lstrip(".")
+    return "image" if content_type and content_type.startswith("image/") else "other"
+
+async def iter_document_events(upload_path: str, original_filename: str, content_type: str, workspace,
+                               progress=None, generate_pdfs: bool = False, document_id: str = None,
+                               debug: bool = False, index: bool = None):
+    """Streams page and image events for a spooled upload, then a final "complete" event with the payload.
+
+    The output PDFs are only built here when `generate_pdfs` is set; otherwise they are rendered
+    on their first download. Results are recorded in the manifest of `document_id` (by default the
+    upload's SHA-256, see default_document_id), and pages and images unchanged since its previous
+    run are not recomputed. Text is chunked as it arrives; with `index` (default INDEX_ON_INGEST)
+    the chunks are then embedded into the vector index under `document_id`. With `debug`, the
+    payload also carries the time spent in each stage. `workspace` is pinned while the document is
+    processed and counted against its quota as files are written.
+    """
+    index = INDEX_ON_INGEST if index is None else index
+    document_format = _document_format(original_filename, content_type)
+    trace = metrics.start_trace()
+    with workspace.in_use():
+        try:
+            temp_dir = workspace.path
+            source_sha256 = await asyncio.to_thread(_file_hash, upload_path)
+            document_id = document_id or default_document_id(source_sha256)
+            manifest = await _open_manifest(document_id, source_sha256)
+            collector = DocumentCollector(progress, text_path=os.path.join(temp_dir, DOCUMENT_TEXT_FILE))
+            chunk_writer = ChunkWriter(os.path.join(temp_dir, CHUNKS_FILE), CHUNK_SIZE_CHARS, CHUNK_OVERLAP_CHARS)
+            page_source = _page_source(upload_path, original_filename, content_type, group=temp_dir, manifest=manifest)
+            try:
+                async for event in stream_document(page_source, temp_dir, manifest):
+                    collector.add(event)
+                    add_chunks(chunk_writer, event)
+                    if event["type"] == "page":
+                        metrics.pages_total.inc(event.get("page_type", document_format))
+                        if manifest is not None and str(event["page"]) not in manifest.pages:
+                            manifest.record_page(event["page"], {"hash": content_hash(event["text"].encode())})
+                        # The quota is enforced as files are written, not only once the document is done.
+                        workspace.track_file(collector.text_path)
+                        workspace.track_file(chunk_writer.path)
+                    elif event["type"] == "image":
+                        workspace.track_file(workspace.file_path(event["analysis"]["filename"]))
+                    yield event
+            finally:
+                collector.close()
+                chunk_writer.close()
+
+            image_analysis_results = collector.image_analysis
+            await asyncio.to_thread(
+                save_intermediate_results, temp_dir, None, [analysis["filename"] for analysis in image_analysis_results]
+            )
+            if generate_pdfs:
+                with metrics.span("pdf_output"):
+                    if collector.keeps_images:
+                        await execution_engine.run(
+                            create_output_pdfs, collector.all_text, collector.enhanced_images, temp_dir, group=temp_dir
+                        )
+                    else:
+                        # Long documents kept nothing in memory: render from the streamed text and PNGs.
+                        for artifact in ARTIFACT_FILES:
+                            await execution_engine.run(
+                                render_artifact, temp_dir, artifact, workspace.remaining_bytes, group=temp_dir
+                            )
+            workspace.check_quota()
+            if manifest is not None:
+                await asyncio.to_thread(manifest_store.save, manifest, temp_dir)
+            index_result = {}
+            if index and not embedder.available:
+                index_result = {"index_error": "[INFO] Google API key not configured. Skipping indexing."}
+            elif index:
+                try:
+                    index_result = {"indexed_chunks": await index_document_chunks(
+                        document_id, chunk_writer.path, original_filename, workspace.id
+                    )}
+                except Exception as e:
+                    # Like summaries, a failed indexing step is reported rather than failing the document.
+                    print(f"Indexing {document_id} failed: {e}")
+                    index_result = {"index_error": f"[ERROR] Indexing failed: {e}"}
+        except Exception:
+            metrics.documents_total.inc(document_format, "failed")
+            raise
+    metrics.documents_total.inc(document_format, "success")
+
+    yield {
+        "type": "complete",
+        "status": "success",
+        "original_filename": original_filename,
+        "document_id": document_id,
+        "workspace_id": workspace.id,
+        "images_found": len(image_analysis_results),
+        "image_analysis": image_analysis_results,
+        "chunks": chunk_writer.count,
+        **index_result,
+        **artifact_urls(workspace.id),
+        **({"manifest": {"document_id": document_id, **manifest.stats}} if manifest is not None else {}),
+        **({"timings": trace.summary()} if debug else {}),
+    }
+
+async def run_document_pipeline(upload_path: str, original_filename: str, content_type: str, workspace,
+                                progress=None, generate_pdfs: bool = False, document_id: str = None,
+                                debug: bool = False, index: bool = None) -> dict:
+    """Processes a spooled upload inside `workspace` and returns the response payload."""
+    result = None
+    async for event in iter_document_events(
+        upload_path, original_filename, content_type, workspace, progress, generate_pdfs, document_id, debug, index
+    ):
+        if event["type"] == "complete":
+            result = event
+    result.pop("type")
+    return result
+
+def _to_http_exception(e: Exception, original_filename: str) -> HTTPException:
+    """Maps pipeline errors onto the HTTP status codes the API reports."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, QuotaExceededError):
+        return HTTPException(status_code=507, detail=str(e))
+    if isinstance(e, UploadTooLargeError):
+        return HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, JobTimeoutError):
+        return HTTPException(status_code=504, detail=f"Processing {original_filename} timed out. {e}")
+    # Provide a more detailed error log for debugging
+    print(f"An unexpected error occurred: {str(e)}")
+    return HTTPException(status_code=500, detail=f"An unexpected error occurred processing {original_filename}. Details: {str(e)}")
 
 # --- Main API Endpoint ---
 
+@app.get("/cache/stats")
+async def cache_stats():
+    return JSONResponse(result_cache.stats())
+
+def _collect_runtime_metrics():
+    stats = result_cache.stats()
+    yield from (
+        (f"result_cache_{name}_total", "counter", f"Result cache {name.replace('_', ' ')}.", stats[name])
+        for name in ("memory_hits", "disk_hits", "misses", "writes", "evictions")
+    )
+    yield "result_cache_memory_entries", "gauge", "Entries in the in-memory result cache.", stats["memory_entries"]
+    yield "result_cache_disk_bytes", "gauge", "Bytes used by the on-disk result cache.", stats["disk_bytes"]
+    manifest_stats = manifest_store.stats()
+    yield "manifest_store_bytes", "gauge", "Bytes used by stored manifests and enhanced images.", manifest_stats["bytes"]
+    yield "manifest_store_evictions_total", "counter", "Documents evicted from the manifest store.", manifest_stats["evictions"]
+    yield "execution_pending_requests", "gauge", "Requests holding an execution engine slot.", execution_engine.pending
+
+metrics.registry.add_collector(_collect_runtime_metrics)
+
+@app.get("/ready")
+async def readiness():
+    """Reports whether the processor can take documents, which optional backends it has, and what is warm."""
+    available = await asyncio.to_thread(capabilities)
+    ready = available["pymupdf"] and available["opencv"] and (_warm_up_done or not WARM_UP_ON_STARTUP)
+    return JSONResponse({
+        "ready": ready,
+        "capabilities": available,
+        "warm": warm_state(),
+    }, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of stage latencies, counters and cache statistics."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/process-document/")
-async def process_document(file: UploadFile = File(...)):
-    temp_dir = "temp_processing"
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
-    os.makedirs(temp_dir)
+async def process_document(file: UploadFile = File(...), generate_pdfs: bool = False, document_id: str = None,
+                           debug: bool = False, index: bool = None):
+    original_filename = file.filename
+    if not is_supported_upload(original_filename, file.content_type):
+        raise _unsupported_file_error(original_filename)
+    try:
+        async with execution_engine.admit():
+            return await _process_upload(file, original_filename, generate_pdfs, document_id, debug, index)
+    except EngineSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+
+async def _process_upload(file: UploadFile, original_filename: str, generate_pdfs: bool = False,
+                          document_id: str = None, debug: bool = False, index: bool = None):
+    try:
+        workspace = await asyncio.to_thread(workspace_manager.create)
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+    try:
+        file_extension = os.path.splitext(original_filename)[1].lower()
+        # Handlers open the spooled copy by path, so the upload is never held in memory whole.
+        upload_path = workspace.file_path(f"upload{file_extension}")
+        await spool_upload(file, upload_path, workspace=workspace)
+        result = await run_document_pipeline(
+            upload_path, original_filename, file.content_type, workspace,
+            generate_pdfs=generate_pdfs, document_id=document_id, debug=debug, index=index
+        )
+        return JSONResponse(result)
+
+    except Exception as e:
+        # Outputs are only kept for successful requests; failed workspaces are freed immediately.
+        workspace.release()
+        raise _to_http_exception(e, original_filename)
 
+@app.post("/process-document/stream")
+async def process_document_stream(file: UploadFile = File(...), format: str = "ndjson", generate_pdfs: bool = False,
+                                  document_id: str = None, debug: bool = False, index: bool = None):
+    """Streams page text and image analyses as they become ready, as NDJSON or server-sent events."""
+    original_filename = file.filename
+    if not is_supported_upload(original_filename, file.content_type):
+        raise _unsupported_file_error(original_filename)
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'sse'.")
     try:
-        file_bytes = await file.read()
-        original_filename = file.filename
+        execution_engine.acquire_slot()
+    except EngineSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    workspace = None
+    try:
+        workspace = await asyncio.to_thread(workspace_manager.create)
         file_extension = os.path.splitext(original_filename)[1].lower()
+        upload_path = workspace.file_path(f"upload{file_extension}")
+        await spool_upload(file, upload_path, workspace=workspace)
+    except Exception as e:
+        execution_engine.release_slot()
+        if workspace is not None:
+            workspace.release()
+        raise _to_http_exception(e, original_filename)
+
+    async def event_stream():
+        try:
+            async for event in iter_document_events(
+                upload_path, original_filename, file.content_type, workspace,
+                generate_pdfs=generate_pdfs, document_id=document_id, debug=debug, index=index
+            ):
+                yield _format_stream_event(event, format)
+        except Exception as e:
+            workspace.release()
+            error = _to_http_exception(e, original_filename)
+            yield _format_stream_event({"type": "error", "status_code": error.status_code, "detail": error.detail}, format)
+        finally:
+            execution_engine.release_slot()
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(event_stream(), media_type=media_type)
+
+def _format_stream_event(event: dict, format: str) -> str:
+    # Enhanced image buffers stay server-side; clients fetch the PNGs or the images PDF instead.
+    payload = json.dumps({key: value for key, value in event.items() if key != "enhanced_image"})
+    if format == "sse":
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+# --- Artifact Downloads ---
+
+def _get_workspace_or_404(workspace_id: str):
+    # Only directories that hold results are registered, so a probe never adds a workspace to the sweeper.
+    workspace = None
+    if is_workspace_id(workspace_id):
+        workspace = workspace_manager.adopt(workspace_id, required_file=ARTIFACT_INDEX_FILE)
+    if workspace is None or not os.path.exists(workspace.file_path(ARTIFACT_INDEX_FILE)):
+        raise HTTPException(status_code=404, detail=f"Results for document {workspace_id} are not available.")
+    return workspace
+
+@app.get("/documents/{workspace_id}/artifacts/{artifact}")
+async def download_artifact(workspace_id: str, artifact: str):
+    """Downloads an output PDF, rendering it from the saved intermediate results on first request."""
+    if artifact not in ARTIFACT_FILES:
+        raise HTTPException(status_code=404, detail=f"Unknown artifact: {artifact}. Use one of {', '.join(ARTIFACT_FILES)}.")
+    workspace = _get_workspace_or_404(workspace_id)
+    path = workspace.file_path(ARTIFACT_FILES[artifact])
+    if not os.path.exists(path):
+        try:
+            async with execution_engine.admit():
+                with metrics.span("pdf_output"), workspace.in_use():
+                    path = await execution_engine.run(
+                        render_artifact, workspace.path, artifact, workspace.remaining_bytes, group=workspace.path
+                    )
+                    workspace.track_file(path)
+        except EngineSaturatedError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        except Exception as e:
+            raise _to_http_exception(e, artifact)
+    return FileResponse(path, media_type="application/pdf", filename=artifact)
+
+@app.get("/documents/{workspace_id}/images/{filename}")
+async def download_enhanced_image(workspace_id: str, filename: str):
+    """Downloads one enhanced image, as named in `image_analysis[].filename`."""
+    workspace = _get_workspace_or_404(workspace_id)
+    path = workspace.file_path(filename)
+    if not filename.startswith("enhanced_") or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Image {filename} not found.")
+    return FileResponse(path, media_type="image/png", filename=filename)
+
+@app.get("/documents/{workspace_id}/chunks")
+async def download_chunks(workspace_id: str):
+    """Downloads the document's text chunks with their provenance, as JSON Lines."""
+    path = _get_workspace_or_404(workspace_id).file_path(CHUNKS_FILE)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No chunks were recorded for this document.")
+    return FileResponse(path, media_type="application/x-ndjson", filename=CHUNKS_FILE)
 
-        all_text = ""
-        image_analysis_results = []
-
-        if file_extension == ".pdf":
-            all_text, image_analysis_results = process_pdf_file(file_bytes, temp_dir)
-        elif file_extension == ".docx":
-            all_text, image_analysis_results = process_docx_file(file_bytes, temp_dir)
-        elif file_extension == ".pptx":
-            all_text, image_analysis_results = process_pptx_file(file_bytes, temp_dir)
-        elif file.content_type and file.content_type.startswith("image/"):
-            analysis, _ = analyze_image_data(file_bytes, 0, 0, temp_dir)
-            image_analysis_results.append(analysis)
+@app.delete("/documents/{workspace_id}", status_code=204)
+async def delete_document_results(workspace_id: str):
+    """Frees a document's workspace once the caller has collected everything it needs."""
+    _get_workspace_or_404(workspace_id).release()
+
+# --- Search API ---
+
+@app.get("/search")
+async def search_chunks(q: str, k: int = 10, document_id: str = None):
+    """Returns the indexed chunks most similar to `q`, with their document, page, image and bounding box."""
+    if not embedder.available:
+        raise HTTPException(status_code=503, detail="Google API key not configured; search is unavailable.")
+    if not 1 <= k <= 100:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 100.")
+    with metrics.span("search"):
+        try:
+            query = await embedder.embed_query(q)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Embedding the query failed: {e}")
+        index = await asyncio.to_thread(get_vector_index)
+        results = await asyncio.to_thread(index.search, query, k, document_id)
+    return {"query": q, "results": results}
+
+# --- Job API ---
+
+async def _run_job(job: dict, progress) -> dict:
+    workspace = workspace_manager.adopt(job["workspace_id"], JOB_RESULT_TTL_SECONDS)
+    if workspace is None:
+        raise RuntimeError("The job's upload is no longer available. Please resubmit the document.")
+    try:
+        result = await run_document_pipeline(
+            job["upload_path"], job["filename"], job["content_type"], workspace, progress
+        )
+    except Exception:
+        workspace.release()
+        raise
+    workspace.touch(JOB_RESULT_TTL_SECONDS)
+    return result
+
+job_store = JobStore(os.getenv("JOB_DB_PATH"))
+job_runner = JobRunner(
+    job_store, _run_job,
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    poll_interval=float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "5")),
+    # A job whose process stops renewing its lease for this long is taken over by another process.
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+)
+# Job workspaces outlive WORKSPACE_TTL_SECONDS: queued and running jobs keep theirs (also across a
+# restart, before a runner adopts them), and completed jobs keep theirs for JOB_RESULT_TTL_SECONDS.
+workspace_manager.keep = lambda: job_store.workspace_ids_in_use(JOB_RESULT_TTL_SECONDS)
+
+@app.on_event("startup")
+async def start_job_runner():
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    await job_runner.stop()
+
+async def _get_job_or_404(job_id: str) -> dict:
+    # Store calls can wait on SQLite's write lock, so they run off the event loop.
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
+
+@app.post("/jobs/", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    """Queues a document for background processing and returns its job id immediately."""
+    original_filename = file.filename
+    if not is_supported_upload(original_filename, file.content_type):
+        raise _unsupported_file_error(original_filename)
+    try:
+        workspace = await asyncio.to_thread(workspace_manager.create)
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+
+    try:
+        file_extension = os.path.splitext(original_filename)[1].lower()
+        upload_path = workspace.file_path(f"upload{file_extension}")
+        await spool_upload(file, upload_path, workspace=workspace)
+        workspace.touch(JOB_RESULT_TTL_SECONDS)
+        job_id = await asyncio.to_thread(
+            job_store.create, original_filename, file.content_type, upload_path, workspace.id
+        )
+    except Exception as e:
+        workspace.release()
+        raise _to_http_exception(e, original_filename)
+
+    job_runner.notify()
+    return JSONResponse({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+    }, status_code=202)
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Reports a job's status, progress counters and the image results finished so far."""
+    job = await _get_job_or_404(job_id)
+    return JSONResponse({
+        "job_id": job["id"],
+        "status": job["status"],
+        "original_filename": job["filename"],
+        "progress": job["progress"],
+        "partial_image_analysis": job["partial_results"],
+        "error": job["error"],
+    })
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await _get_job_or_404(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Job {job_id} failed: {job['error']}")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is still {job['status']}.")
+    return JSONResponse(job["result"])
+
+# --- Batch API ---
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def iter_archive_members(archive_path: str):
+    """Yields (name, file object) for every regular file in a ZIP or tar archive, without extracting it."""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member
+    else:
+        with tarfile.open(archive_path) as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, archive.extractfile(info)
+
+class BatchIngest:
+    """Queues the files of one batch as low-priority jobs.
+
+    Identical files (by SHA-256) are processed once; later copies point at the first copy's job.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.items = []
+        self._jobs_by_hash = {}
+
+    @property
+    def job_count(self) -> int:
+        return len(self._jobs_by_hash)
+
+    def skip(self, filename: str, reason: str):
+        self.items.append({"filename": filename, "status": "skipped", "error": reason})
+
+    def register(self, filename: str, content_type: str, upload_path: str, digest: str, workspace):
+        """Queues a staged file, or releases its workspace if an identical file is already queued."""
+        if len(self.items) >= BATCH_MAX_FILES:
+            workspace.release()
+            raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_FILES} files.")
+        item = {"filename": filename, "sha256": digest}
+        if digest in self._jobs_by_hash:
+            workspace.release()
+            item["job_id"] = self._jobs_by_hash[digest]
+            item["duplicate"] = True
         else:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {original_filename}. Please upload a PDF, DOCX, PPTX, or image file.")
-
-        text_pdf_path, image_pdf_path = create_output_pdfs(all_text, image_analysis_results, temp_dir)
-        
-        return JSONResponse({
-            "status": "success",
-            "original_filename": original_filename,
-            "images_found": len(image_analysis_results),
-            "image_analysis": image_analysis_results,
-            "text_only_pdf_path": text_pdf_path,
-            "images_only_pdf_path": image_pdf_path,
-        })
+            workspace.touch(JOB_RESULT_TTL_SECONDS)
+            item["job_id"] = job_store.create(
+                filename, content_type, upload_path, workspace.id, priority=BATCH_JOB_PRIORITY, batch_id=self.id
+            )
+            self._jobs_by_hash[digest] = item["job_id"]
+        self.items.append(item)
+
+    def add_stream(self, filename: str, source):
+        """Stages one file read from a file object (an archive member). Runs in a worker thread."""
+        content_type = mimetypes.guess_type(filename)[0]
+        if not is_supported_upload(filename, content_type):
+            self.skip(filename, "Unsupported file type.")
+            return
+        workspace = workspace_manager.create()
+        try:
+            upload_path = workspace.file_path(f"upload{os.path.splitext(filename)[1].lower()}")
+            hasher = hashlib.sha256()
+            copy_limited(source, upload_path, hasher, workspace)
+        except UploadTooLargeError as e:
+            workspace.release()
+            self.skip(filename, str(e))
+            return
+        except Exception:
+            workspace.release()
+            raise
+        self.register(filename, content_type, upload_path, hasher.hexdigest(), workspace)
 
+    def add_archive(self, archive_path: str):
+        for name, member in iter_archive_members(archive_path):
+            self.add_stream(name, member)
+
+    def add_directory(self, directory: str):
+        """Queues every supported file below a server-side directory, processing the files in place."""
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                content_type = mimetypes.guess_type(name)[0]
+                if not is_supported_upload(name, content_type):
+                    self.skip(path, "Unsupported file type.")
+                    continue
+                self.register(path, content_type, path, _file_hash(path), workspace_manager.create())
+
+def _check_batch_directory(directory: str, admin_key: str) -> str:
+    if not BATCH_ADMIN_KEY or admin_key != BATCH_ADMIN_KEY:
+        raise HTTPException(status_code=403, detail="Directory ingestion requires a valid X-Admin-Key header.")
+    directory = os.path.realpath(directory)
+    if BATCH_DIRECTORY_ROOT:
+        root = os.path.realpath(BATCH_DIRECTORY_ROOT)
+        if os.path.commonpath([root, directory]) != root:
+            raise HTTPException(status_code=403, detail=f"Directory must be inside {BATCH_DIRECTORY_ROOT}.")
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=400, detail=f"Directory not found: {directory}")
+    return directory
+
+@app.post("/batches/", status_code=202)
+async def submit_batch(files: list[UploadFile] = File(None), directory: str = Form(None),
+                       x_admin_key: str = Header(None)):
+    """Queues many documents at once: uploaded files, ZIP/tar archives of them, or (admins) a server directory.
+
+    Every distinct file becomes a background job. The job runner works through them together, and
+    the execution engine interleaves their pages and images across the worker pool.
+    """
+    if not files and not directory:
+        raise HTTPException(status_code=400, detail="Upload one or more files or archives, or give a directory.")
+    if directory:
+        directory = _check_batch_directory(directory, x_admin_key)
+
+    batch = BatchIngest()
+    try:
+        for file in files or []:
+            if is_archive(file.filename):
+                # Archives may be larger than one upload, but still count against the global quota.
+                archive_workspace = await asyncio.to_thread(workspace_manager.create, BATCH_MAX_ARCHIVE_BYTES)
+                try:
+                    archive_path = archive_workspace.file_path(f"archive-{os.path.basename(file.filename)}")
+                    await spool_upload(file, archive_path, max_bytes=BATCH_MAX_ARCHIVE_BYTES,
+                                       workspace=archive_workspace)
+                    await asyncio.to_thread(batch.add_archive, archive_path)
+                except (zipfile.BadZipFile, tarfile.TarError) as e:
+                    batch.skip(file.filename, f"Unreadable archive: {e}")
+                finally:
+                    archive_workspace.release()
+                continue
+            if not is_supported_upload(file.filename, file.content_type):
+                batch.skip(file.filename, "Unsupported file type.")
+                continue
+            workspace = await asyncio.to_thread(workspace_manager.create)
+            try:
+                upload_path = workspace.file_path(f"upload{os.path.splitext(file.filename)[1].lower()}")
+                hasher = hashlib.sha256()
+                await spool_upload(file, upload_path, hasher, workspace=workspace)
+            except UploadTooLargeError as e:
+                workspace.release()
+                batch.skip(file.filename, str(e))
+                continue
+            except Exception:
+                workspace.release()
+                raise
+            await asyncio.to_thread(
+                batch.register, file.filename, file.content_type, upload_path, hasher.hexdigest(), workspace
+            )
+        if directory:
+            await asyncio.to_thread(batch.add_directory, directory)
     except Exception as e:
-        if isinstance(e, HTTPException):
-            raise e
-        # Provide a more detailed error log for debugging
-        print(f"An unexpected error occurred: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred processing {original_filename}. Details: {str(e)}")
+        # Files queued so far still run; the batch record lets the caller find them.
+        await asyncio.to_thread(job_store.create_batch, batch.id, batch.items)
+        job_runner.notify()
+        raise _to_http_exception(e, "batch")
+
+    await asyncio.to_thread(job_store.create_batch, batch.id, batch.items)
+    job_runner.notify()
+    return JSONResponse({
+        "batch_id": batch.id,
+        "status_url": f"/batches/{batch.id}",
+        "files": len(batch.items),
+        "jobs": batch.job_count,
+        "duplicates": sum(1 for item in batch.items if item.get("duplicate")),
+        "skipped": sum(1 for item in batch.items if item.get("status") == "skipped"),
+    }, status_code=202)
 
+@app.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str, include_results: bool = True):
+    """Reports per-file status of a batch, with each completed file's result."""
+    batch = await asyncio.to_thread(job_store.get_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found.")
+    jobs = await asyncio.to_thread(job_store.get_batch_jobs, batch_id)
+    counts = {}
+    files = []
+    for item in batch["items"]:
+        entry = dict(item)
+        job = jobs.get(item.get("job_id"))
+        if job is not None:
+            entry.update({"status": job["status"], "progress": job["progress"], "error": job["error"]})
+            if include_results and job["status"] == "completed":
+                entry["result"] = job["result"]
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        files.append(entry)
+    return JSONResponse({"batch_id": batch_id, "counts": counts, "files": files})
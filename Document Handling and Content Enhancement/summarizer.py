@@ -0,0 +1,217 @@
+import asyncio
+import json
+import random
+import time
+
+SUMMARY_PROMPT = """
+        Analyze the provided image and its OCR text to generate a concise summary.
+        Focus on the document's purpose, key data points, and any important entities.
+
+        OCR Text:
+        ---
+        {ocr_text}
+        ---
+        """
+
+BATCH_SUMMARY_PROMPT = """
+        You will receive {count} images from the same document, each preceded by its OCR text.
+        For each image, analyze it together with its OCR text and write a concise summary focusing
+        on its purpose, key data points, and any important entities.
+        Respond with only a JSON array of exactly {count} strings, one summary per image, in order.
+        """
+
+# Status codes worth retrying: rate limiting and transient server errors.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetryableBackendError(Exception):
+    """A transient backend failure; `retry_after` is an optional server-suggested delay in seconds."""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RetryableBackendError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    # google.api_core exceptions carry the HTTP status in `code`.
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)
+    return code in RETRYABLE_STATUS_CODES or type(error).__name__ in (
+        "ResourceExhausted", "ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "TooManyRequests"
+    )
+
+
+class GeminiBackend:
+    """Gemini backend holding a single shared model instance, so connections are reused."""
+
+    def __init__(self, model_name: str, api_key: str = None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def configured(self) -> bool:
+        """Whether the client library has been imported and configured; this happens on first use."""
+        return self._model is not None
+
+    @property
+    def model(self):
+        if self._model is None:
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    async def generate(self, prompt: str, parts: list) -> str:
+        response = await self.model.generate_content_async([prompt, *parts])
+        return response.text
+
+
+class StubBackend:
+    """Local stand-in for Gemini, used in tests and benchmarks.
+
+    It can simulate latency and fail the first `failures` calls with a retryable error.
+    """
+
+    def __init__(self, latency: float = 0.0, failures: int = 0):
+        self.latency = latency
+        self.failures = failures
+        self.calls = 0
+
+    available = True
+
+    async def generate(self, prompt: str, parts: list) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.calls <= self.failures:
+            raise RetryableBackendError("Simulated 429 from stub backend.", retry_after=0.0)
+        snippets = [part for part in parts if isinstance(part, str)]
+        if len(snippets) > 1:
+            return json.dumps([f"Stub summary of {len(snippet)} characters of OCR text." for snippet in snippets])
+        return f"Stub summary of {len(prompt)} characters of prompt."
+
+
+class TokenBucket:
+    """Async token bucket: `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SummarizationClient:
+    """Rate-limited, retrying summariser with an optional per-document batching window.
+
+    With `batch_size` > 1, summaries requested for the same `group` within `batch_window`
+    seconds are combined into a single model request.
+    """
+
+    def __init__(self, backend, max_concurrency: int = 4, requests_per_minute: float = 60,
+                 max_retries: int = 4, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 batch_size: int = 1, batch_window: float = 0.5):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(requests_per_minute / 60.0)
+        self._batches = {}
+
+    async def _call(self, prompt: str, parts: list) -> str:
+        """Sends one request under the concurrency limit and rate limit, retrying transient failures."""
+        attempt = 0
+        while True:
+            await self._bucket.acquire()
+            try:
+                async with self._semaphore:
+                    return await self.backend.generate(prompt, parts)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                # Full jitter keeps concurrent retries from synchronising into new bursts.
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                retry_after = getattr(e, "retry_after", None)
+                await asyncio.sleep(max(delay, retry_after or 0))
+                attempt += 1
+
+    async def summarize(self, image, ocr_text: str, group: str = None) -> str:
+        """Summarises one image with its OCR text. Failures are returned as "[ERROR] ..." strings."""
+        if not self.backend.available:
+            return "[INFO] Google API key not configured. Skipping summary."
+        if self.batch_size > 1 and group is not None:
+            return await self._summarize_batched(image, ocr_text, group)
+        try:
+            text = await self._call(SUMMARY_PROMPT.format(ocr_text=ocr_text), [image])
+        except Exception as e:
+            return f"[ERROR] Gemini API call failed: {e}"
+        return text.strip() if text else "[ERROR] Gemini returned an empty response."
+
+    async def summarize_many(self, items: list) -> list:
+        """Summarises (image, ocr_text) pairs in a single request, falling back to one request each."""
+        if not self.backend.available:
+            return ["[INFO] Google API key not configured. Skipping summary."] * len(items)
+        if len(items) == 1:
+            return [await self.summarize(*items[0])]
+        parts = []
+        for index, (image, ocr_text) in enumerate(items):
+            parts.extend([f"Image {index + 1} OCR Text:\n---\n{ocr_text}\n---", image])
+        try:
+            text = await self._call(BATCH_SUMMARY_PROMPT.format(count=len(items)), parts)
+            summaries = json.loads(text.strip().removeprefix("```json").removesuffix("```").strip())
+            if isinstance(summaries, list) and len(summaries) == len(items):
+                return [str(summary).strip() for summary in summaries]
+        except Exception:
+            pass
+        return list(await asyncio.gather(*(self.summarize(image, ocr_text) for image, ocr_text in items)))
+
+    async def _summarize_batched(self, image, ocr_text: str, group: str) -> str:
+        future = asyncio.get_running_loop().create_future()
+        batch = self._batches.setdefault(group, [])
+        batch.append((image, ocr_text, future))
+        if len(batch) == 1:
+            asyncio.create_task(self._flush_after_window(group))
+        if len(batch) >= self.batch_size:
+            self._flush(group)
+        return await future
+
+    async def _flush_after_window(self, group: str):
+        await asyncio.sleep(self.batch_window)
+        self._flush(group)
+
+    def _flush(self, group: str):
+        batch = self._batches.pop(group, None)
+        if batch:
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: list):
+        try:
+            summaries = await self.summarize_many([(image, ocr_text) for image, ocr_text, _ in batch])
+        except Exception as e:
+            summaries = [f"[ERROR] Gemini API call failed: {e}"] * len(batch)
+        for (_, _, future), summary in zip(batch, summaries):
+            if not future.done():
+                future.set_result(summary)
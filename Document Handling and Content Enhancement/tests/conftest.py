@@ -0,0 +1,72 @@
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+
+PROCESSOR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROCESSOR_DIR)
+
+# The processor reads its configuration when it is imported: keep every store in a scratch
+# directory and use the local stub backends, so tests never share state or call Gemini.
+_scratch = tempfile.mkdtemp(prefix="document_processor_tests_")
+TEST_ENV = {
+    "WORKSPACE_ROOT": os.path.join(_scratch, "workspaces"),
+    "CACHE_DIR": os.path.join(_scratch, "cache"),
+    "MANIFEST_DIR": os.path.join(_scratch, "manifests"),
+    "VECTOR_INDEX_DIR": os.path.join(_scratch, "index"),
+    "JOB_DB_PATH": os.path.join(_scratch, "jobs.db"),
+    "EXECUTION_MODE": "thread",
+    "SUMMARY_BACKEND": "stub",
+    "EMBEDDING_BACKEND": "stub",
+    "WARM_UP_ON_STARTUP": "false",
+}
+os.environ.update(TEST_ENV)
+
+
+@pytest.fixture(scope="session")
+def processor():
+    """The processor module, imported once with the test configuration."""
+    pytest.importorskip("fitz")
+    pytest.importorskip("cv2")
+    import separation_and_image_enhancement
+    return separation_and_image_enhancement
+
+
+@pytest.fixture(scope="session")
+def client(processor):
+    """A TestClient with the startup hooks run."""
+    from fastapi.testclient import TestClient
+    with TestClient(processor.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def fake_ocr(processor, monkeypatch):
+    """Replaces tesseract with a fixed reading, since the binary is not needed to test the pipeline."""
+    monkeypatch.setattr(processor, "extract_text_from_image", lambda image: "scanned page text")
+
+
+def _make_pdf(pages: list) -> bytes:
+    import fitz
+    from PIL import Image
+    import enhancement
+    doc = fitz.open()
+    for spec in pages:
+        page = doc.new_page()
+        if isinstance(spec, str):
+            page.insert_text((72, 72), spec)
+            continue
+        scan = io.BytesIO()
+        Image.fromarray(enhancement.synthetic_scan(595, 842)).save(scan, "PNG")
+        page.insert_image(page.rect, stream=scan.getvalue())
+        if spec[1]:
+            page.insert_text((200, 835), spec[1], fontsize=6)
+    return doc.tobytes()
+
+
+@pytest.fixture
+def make_pdf():
+    """Builds a PDF from page specs: a string is a text page, ("scan", footer) a full-page image plus footer text."""
+    return _make_pdf
@@ -0,0 +1,85 @@
+import io
+import os
+import time
+import zipfile
+
+
+def _zip(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def test_archive_counts_against_the_global_workspace_quota(processor, client, monkeypatch):
+    manager = processor.workspace_manager
+    before = manager.total_usage()
+    monkeypatch.setattr(manager, "max_total_bytes", before + 1000)
+    archive = _zip({"noise.pdf": os.urandom(5000)})
+    response = client.post("/batches/", files=[("files", ("big.zip", archive, "application/zip"))])
+    assert response.status_code == 507
+    assert manager.total_usage() == before
+
+
+def test_archive_larger_than_the_batch_limit_is_refused(processor, client, monkeypatch):
+    monkeypatch.setattr(processor, "BATCH_MAX_ARCHIVE_BYTES", 2000)
+    archive = _zip({"noise.pdf": os.urandom(5000)})
+    response = client.post("/batches/", files=[("files", ("big.zip", archive, "application/zip"))])
+    assert response.status_code == 413
+
+
+def test_archive_workspace_quota_is_the_batch_limit(processor, monkeypatch):
+    monkeypatch.setattr(processor.workspace_manager, "max_workspace_bytes", 100)
+    workspace = processor.workspace_manager.create(max_bytes=10_000)
+    try:
+        workspace.add_usage(5000)
+        assert workspace.remaining_bytes == 5000
+    finally:
+        workspace.release()
+
+
+def _wait_for_batch(client, batch_id: str, timeout: float = 60) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        batch = client.get(f"/batches/{batch_id}").json()
+        if not {"queued", "running"} & set(batch["counts"]) or time.monotonic() > deadline:
+            return batch
+        time.sleep(0.1)
+
+
+def test_archive_members_are_queued_deduplicated_and_skipped(client, make_pdf):
+    report, other = make_pdf(["Quarterly report."]), make_pdf(["Meeting notes."])
+    archive = _zip({"reports/report.pdf": report, "copy-of-report.pdf": report, "notes.xyz": b"not a document"})
+    response = client.post("/batches/", files=[
+        ("files", ("bundle.zip", archive, "application/zip")),
+        ("files", ("other.pdf", other, "application/pdf")),
+        ("files", ("readme.xyz", b"plain", "application/octet-stream")),
+    ])
+    assert response.status_code == 202
+    summary = response.json()
+    assert (summary["files"], summary["jobs"], summary["duplicates"], summary["skipped"]) == (5, 2, 1, 2)
+
+    batch = _wait_for_batch(client, summary["batch_id"])
+    files = {entry["filename"]: entry for entry in batch["files"]}
+    assert batch["counts"] == {"completed": 3, "skipped": 2}
+    assert files["copy-of-report.pdf"]["job_id"] == files["reports/report.pdf"]["job_id"]
+    assert files["copy-of-report.pdf"]["duplicate"] is True
+    assert files["notes.xyz"]["status"] == "skipped" and files["readme.xyz"]["status"] == "skipped"
+    assert files["reports/report.pdf"]["result"]["original_filename"] == "reports/report.pdf"
+    assert files["other.pdf"]["result"]["document_id"] != files["reports/report.pdf"]["result"]["document_id"]
+
+
+def test_unreadable_archive_is_skipped(client, make_pdf):
+    response = client.post("/batches/", files=[
+        ("files", ("broken.zip", b"PK\x03\x04 truncated", "application/zip")),
+        ("files", ("ok.pdf", make_pdf(["Still queued."]), "application/pdf")),
+    ])
+    summary = response.json()
+    assert (summary["jobs"], summary["skipped"]) == (1, 1)
+    batch = client.get(f"/batches/{summary['batch_id']}?include_results=false").json()
+    assert batch["files"][0]["error"].startswith("Unreadable archive")
+
+
+def test_unknown_batch_is_not_found(client):
+    assert client.get("/batches/does-not-exist").status_code == 404
@@ -0,0 +1,81 @@
+import os
+import stat
+
+import pytest
+
+from cache import ContentCache
+
+
+def test_disk_tier_is_private_to_the_current_user(tmp_path):
+    cache = ContentCache(disk_dir=str(tmp_path / "cache"))
+    assert stat.S_IMODE(os.stat(cache.disk_dir).st_mode) == 0o700
+
+
+def test_open_directory_we_own_is_tightened(tmp_path):
+    disk_dir = tmp_path / "cache"
+    disk_dir.mkdir()
+    os.chmod(disk_dir, 0o777)
+    cache = ContentCache(disk_dir=str(disk_dir))
+    assert cache.disk_max_bytes > 0
+    assert stat.S_IMODE(os.stat(disk_dir).st_mode) == 0o700
+
+
+def test_symlinked_directory_disables_the_disk_tier(tmp_path):
+    (tmp_path / "elsewhere").mkdir()
+    os.symlink(tmp_path / "elsewhere", tmp_path / "cache")
+    cache = ContentCache(disk_dir=str(tmp_path / "cache"))
+    assert cache.disk_max_bytes == 0
+    cache.put("key", "value")
+    assert os.listdir(tmp_path / "elsewhere") == []
+    assert cache.get("key") == "value"
+
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to chown")
+def test_directory_owned_by_another_user_is_not_unpickled(tmp_path):
+    disk_dir = tmp_path / "cache"
+    disk_dir.mkdir()
+    os.chown(disk_dir, 65534, 65534)
+    cache = ContentCache(disk_dir=str(disk_dir))
+    assert cache.disk_max_bytes == 0
+
+
+def test_memory_tier_evicts_least_recently_used_to_disk(tmp_path):
+    cache = ContentCache(memory_items=2, disk_dir=str(tmp_path / "cache"))
+    for key in ("a", "b", "c"):
+        cache.put(key, key.upper())
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.get("a") == "A"
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get("c") == "C"
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used_entries(tmp_path):
+    cache = ContentCache(memory_items=1, disk_dir=str(tmp_path / "cache"), disk_max_bytes=3500)
+    for index, key in enumerate(("a", "b", "c")):
+        cache.put(key, b"x" * 1000)
+        os.utime(cache._disk_path(key), (0, 100 + index))
+    assert cache.get("a") is not None  # Read from disk, which makes "b" the oldest entry.
+    cache.put("d", b"x" * 1000)
+    stats = cache.stats()
+    assert stats["evictions"] >= 1
+    assert stats["disk_bytes"] <= 3500
+    assert not os.path.exists(cache._disk_path("b"))
+    assert os.path.exists(cache._disk_path("a"))
+
+
+def test_value_larger_than_the_disk_tier_stays_in_memory(tmp_path):
+    cache = ContentCache(disk_dir=str(tmp_path / "cache"), disk_max_bytes=100)
+    cache.put("big", b"x" * 1000)
+    assert os.listdir(cache.disk_dir) == []
+    assert cache.get("big") == b"x" * 1000
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    cache = ContentCache(memory_items=1, disk_dir=str(tmp_path / "cache"))
+    cache.put("a", "A")
+    cache.put("b", "B")
+    with open(cache._disk_path("a"), "wb") as f:
+        f.write(b"not a pickle")
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,34 @@
+def _post(client, pdf: bytes, **params):
+    response = client.post("/process-document/", params={"index": True, **params},
+                           files={"file": ("report.pdf", pdf, "application/pdf")})
+    assert response.status_code == 200
+    return response.json()
+
+
+def _search(client, query: str, document_id: str):
+    response = client.get("/search", params={"q": query, "document_id": document_id})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+def test_same_named_uploads_keep_their_own_index_entries(client, make_pdf):
+    first = _post(client, make_pdf(["Quarterly revenue grew in the northern region. " * 3]))
+    second = _post(client, make_pdf(["The cafeteria menu changes every Tuesday. " * 3]))
+    assert first["document_id"] != second["document_id"]
+    assert first["indexed_chunks"] and second["indexed_chunks"]
+    [hit] = _search(client, "quarterly revenue", first["document_id"])[:1]
+    assert "revenue" in hit["text"]
+
+
+def test_identical_upload_reuses_its_document(client, fake_ocr, make_pdf):
+    pdf = make_pdf([("scan", None)])
+    first = _post(client, pdf)
+    second = _post(client, pdf)
+    assert first["document_id"] == second["document_id"]
+    assert second["manifest"]["pages_reused"] == 1
+
+
+def test_explicit_document_id_is_kept(client, make_pdf):
+    result = _post(client, make_pdf(["Version one of a tracked contract. " * 3]), document_id="contract-7")
+    assert result["document_id"] == "contract-7"
+    assert _search(client, "tracked contract", "contract-7")
@@ -0,0 +1,67 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+import enhancement  # noqa: E402  (needs numpy and OpenCV)
+
+
+@pytest.fixture(scope="module")
+def scan():
+    return enhancement.synthetic_scan(301, 263, seed=3)  # Odd sizes leave partial tiles on both edges.
+
+
+@pytest.mark.parametrize("preset", ["fast", "balanced", "quality"])
+def test_tiled_output_equals_whole_image_output(scan, preset):
+    whole = enhancement.enhance(scan, preset, tile_size=0)
+    tiled = enhancement.enhance(scan, preset, tile_size=64, tile_workers=3)
+    assert tiled.shape == whole.shape
+    assert np.array_equal(tiled, whole)
+
+
+def test_output_is_binary(scan):
+    assert set(np.unique(enhancement.enhance(scan, "fast"))) <= {0, 255}
+
+
+def test_balanced_downscales_to_the_target_dpi(scan):
+    assert enhancement.enhance(scan, "balanced", source_dpi=600).shape == (131, 150)
+    assert enhancement.enhance(scan, "balanced", source_dpi=200).shape == scan.shape
+
+
+def test_auto_picks_fast_for_clean_images_and_quality_for_noisy_ones():
+    assert enhancement.choose_preset(enhancement.synthetic_scan(200, 200, noise_sigma=0)) == "fast"
+    assert enhancement.choose_preset(enhancement.synthetic_scan(200, 200, noise_sigma=20)) == "quality"
+
+
+def test_preset_config_identifies_the_output():
+    assert enhancement.preset_config("fast") != enhancement.preset_config("quality")
+    assert enhancement.preset_config("auto")["presets"]["fast"] == enhancement.PRESETS["fast"]
+    with pytest.raises(ValueError):
+        enhancement.preset_config("sharpest")
+
+
+def test_binary_image_round_trips(scan):
+    binary = enhancement.enhance(scan, "fast")
+    packed = enhancement.BinaryImage.from_array(binary)
+    assert (packed.height, packed.width) == binary.shape
+    assert packed.bits.shape == (263, 38)  # 301 pixels packed into whole bytes per row.
+    assert np.array_equal(packed.to_array(), binary)
+    assert np.array_equal(np.asarray(packed.to_pil().convert("L")), binary)
+
+
+def test_binary_image_survives_pickling_at_a_fraction_of_the_size(scan):
+    import pickle
+    binary = enhancement.enhance(scan, "fast")
+    pickled = pickle.dumps(enhancement.BinaryImage.from_array(binary))
+    assert len(pickled) * 7 < len(pickle.dumps(binary))
+    assert np.array_equal(pickle.loads(pickled).to_array(), binary)
+
+
+def test_images_only_pdf_is_built_from_binary_images(processor, scan, tmp_path):
+    fitz = pytest.importorskip("fitz")
+    binary = enhancement.enhance(scan, "fast")
+    path = processor.write_images_only_pdf([binary, binary[:100]], str(tmp_path / "images.pdf"))
+    with fitz.open(path) as doc:
+        assert doc.page_count == 2
+        pixmap = fitz.Pixmap(doc, doc[0].get_images()[0][0])
+        assert (pixmap.width, pixmap.height) == (301, 263)
+        assert np.array_equal(np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(263, 301), binary)
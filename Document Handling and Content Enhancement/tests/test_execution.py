@@ -0,0 +1,103 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from execution import EngineSaturatedError, ExecutionEngine, JobTimeoutError
+
+
+def test_admission_is_rejected_once_every_slot_is_taken():
+    engine = ExecutionEngine(mode="thread", max_workers=1, max_pending=2)
+    engine.acquire_slot()
+    engine.acquire_slot()
+    with pytest.raises(EngineSaturatedError):
+        engine.acquire_slot()
+    engine.release_slot()
+    engine.acquire_slot()
+    assert engine.pending == 2
+
+
+def test_admit_releases_its_slot_on_error():
+    async def scenario():
+        engine = ExecutionEngine(mode="thread", max_workers=1, max_pending=1)
+        with pytest.raises(RuntimeError):
+            async with engine.admit():
+                raise RuntimeError("handler failed")
+        return engine.pending
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_groups_are_served_round_robin():
+    order = []
+    lock = threading.Lock()
+
+    def record(name: str):
+        time.sleep(0.01)
+        with lock:
+            order.append(name)
+
+    async def scenario():
+        engine = ExecutionEngine(mode="thread", max_workers=1)
+        try:
+            # The long document queues everything first; the short one must not wait behind it.
+            await asyncio.gather(
+                *(engine.run(record, f"long-{i}", group="long") for i in range(1, 5)),
+                *(engine.run(record, f"short-{i}", group="short") for i in range(1, 3)),
+            )
+        finally:
+            engine.shutdown()
+
+    asyncio.run(scenario())
+    assert order == ["long-1", "long-2", "short-1", "long-3", "short-2", "long-4"]
+
+
+def test_at_most_max_workers_tasks_run_at_once():
+    running = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.02)
+        with lock:
+            running["now"] -= 1
+
+    async def scenario():
+        engine = ExecutionEngine(mode="thread", max_workers=2)
+        try:
+            await asyncio.gather(*(engine.run(work, group=f"doc-{i % 3}") for i in range(9)))
+        finally:
+            engine.shutdown()
+
+    asyncio.run(scenario())
+    assert running["peak"] == 2
+
+
+def test_slow_task_times_out():
+    async def scenario():
+        engine = ExecutionEngine(mode="thread", max_workers=1, job_timeout=0.05)
+        try:
+            await engine.run(time.sleep, 0.5)
+        finally:
+            engine.shutdown()
+
+    with pytest.raises(JobTimeoutError):
+        asyncio.run(scenario())
+
+
+def test_pool_is_rebuilt_after_a_worker_dies():
+    async def scenario():
+        engine = ExecutionEngine(mode="process", max_workers=1)
+        try:
+            with pytest.raises(BrokenProcessPool):
+                await engine.run(os._exit, 1)
+            return await engine.run(os.getpid)
+        finally:
+            engine.shutdown()
+
+    assert asyncio.run(scenario()) != os.getpid()
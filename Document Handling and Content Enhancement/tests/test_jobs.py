@@ -0,0 +1,143 @@
+import asyncio
+import os
+import threading
+import time
+
+from jobs import JobProgress, JobRunner, JobStore
+from workspace import WorkspaceManager
+
+
+def _store(tmp_path) -> JobStore:
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_running_job_is_only_taken_over_once_its_lease_expires(tmp_path):
+    first, second = _store(tmp_path), _store(tmp_path)  # Two processes sharing one database.
+    job_id = first.create("a.pdf", "application/pdf", "/tmp/a.pdf", "ws")
+    assert first.claim_next("first", lease_seconds=0.2)["id"] == job_id
+    assert second.claim_next("second", lease_seconds=0.2) is None
+    time.sleep(0.3)
+    assert second.claim_next("second", lease_seconds=60)["id"] == job_id
+    assert not first.renew_lease(job_id, "first", 60)
+
+
+def test_released_job_is_queued_again(tmp_path):
+    store = _store(tmp_path)
+    job_id = store.create("a.pdf", "application/pdf", "/tmp/a.pdf", "ws")
+    store.claim_next("owner", lease_seconds=60)
+    store.release_lease(job_id, "someone else")
+    assert store.get(job_id)["status"] == "running"
+    store.release_lease(job_id, "owner")
+    assert store.get(job_id)["status"] == "queued"
+
+
+def test_partial_results_are_appended_incrementally(tmp_path):
+    store = _store(tmp_path)
+    job_id = store.create("a.pdf", "application/pdf", "/tmp/a.pdf", "ws")
+    progress = JobProgress(store, job_id, flush_interval=0)
+    writes = []
+    update_progress = store.update_progress
+    store.update_progress = lambda job, counters, new: (writes.append(len(new)), update_progress(job, counters, new))
+    for index in range(5):
+        progress.image_done({"image_index": index})
+    assert writes == [1, 1, 1, 1, 1]
+    assert [analysis["image_index"] for analysis in store.get(job_id)["partial_results"]] == [0, 1, 2, 3, 4]
+    assert store.get(job_id)["progress"]["images_done"] == 5
+
+
+def test_second_runner_does_not_rerun_a_job_in_progress(tmp_path):
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+        runs = []
+
+        async def handler(job, progress):
+            runs.append(job["id"])
+            started.set()
+            await release.wait()
+            return {"ok": True}
+
+        store = _store(tmp_path)
+        job_id = store.create("a.pdf", "application/pdf", "/tmp/a.pdf", "ws")
+        first = JobRunner(store, handler, workers=1, poll_interval=0.05, lease_seconds=0.3)
+        first.start()
+        await started.wait()
+        # A second uvicorn worker starting up must leave the running job alone.
+        second = JobRunner(_store(tmp_path), handler, workers=1, poll_interval=0.05, lease_seconds=0.3)
+        second.start()
+        await asyncio.sleep(0.6)  # Two lease periods: the first runner keeps renewing.
+        release.set()
+        while store.get(job_id)["status"] != "completed":
+            await asyncio.sleep(0.02)
+        await first.stop()
+        await second.stop()
+        return runs, job_id
+
+    runs, job_id = asyncio.run(scenario())
+    assert runs == [job_id]
+
+
+def test_workspaces_of_unfinished_and_recent_jobs_are_in_use(tmp_path):
+    store = _store(tmp_path)
+    queued = store.create("a.pdf", "application/pdf", "/tmp/a.pdf", "queued-ws")
+    store.create("b.pdf", "application/pdf", "/tmp/b.pdf", "running-ws")
+    store.claim_next("owner", lease_seconds=60)  # Claims the older job, "queued-ws".
+    completed = store.create("c.pdf", "application/pdf", "/tmp/c.pdf", "completed-ws")
+    failed = store.create("d.pdf", "application/pdf", "/tmp/d.pdf", "failed-ws")
+    store.complete(completed, {})
+    store.fail(failed, "broken")
+    assert store.get(queued)["status"] == "running"
+    assert store.workspace_ids_in_use(result_ttl_seconds=60) == {"queued-ws", "running-ws", "completed-ws"}
+    assert store.workspace_ids_in_use(result_ttl_seconds=-1) == {"queued-ws", "running-ws"}
+
+
+def test_queued_job_workspace_survives_a_restart_past_its_ttl(tmp_path):
+    store = _store(tmp_path)
+    before_restart = WorkspaceManager(str(tmp_path / "workspaces"))
+    queued, stale = before_restart.create(), before_restart.create()
+    store.create("a.pdf", "application/pdf", queued.file_path("upload.pdf"), queued.id)
+    # After the restart both directories are orphans older than the workspace TTL.
+    after_restart = WorkspaceManager(str(tmp_path / "workspaces"), ttl_seconds=-1,
+                                     keep=lambda: store.workspace_ids_in_use(3600))
+    assert after_restart.sweep() == 1
+    assert os.path.isdir(queued.path) and not os.path.isdir(stale.path)
+    assert after_restart.adopt(queued.id) is not None
+
+
+def test_sweep_removes_nothing_when_the_keep_list_is_unavailable(tmp_path):
+    def keep():
+        raise RuntimeError("database is locked")
+
+    manager = WorkspaceManager(str(tmp_path), ttl_seconds=-1, keep=keep)
+    workspace = manager.create()
+    assert manager.sweep() == 0
+    assert os.path.isdir(workspace.path)
+
+
+def test_progress_is_written_off_the_event_loop(tmp_path):
+    store = _store(tmp_path)
+    job_id = store.create("a.pdf", "application/pdf", "/tmp/a.pdf", "ws")
+    writers = []
+    update_progress = store.update_progress
+
+    def slow_update_progress(job, counters, new):
+        writers.append(threading.current_thread())
+        time.sleep(0.05)  # Waiting on another process's write lock.
+        update_progress(job, counters, new)
+
+    store.update_progress = slow_update_progress
+
+    async def scenario():
+        progress = JobProgress(store, job_id, flush_interval=0)
+        started = time.monotonic()
+        for index in range(5):
+            progress.image_done({"image_index": index})
+        flushing = time.monotonic() - started
+        await progress.close()
+        return flushing
+
+    assert asyncio.run(scenario()) < 0.05
+    assert threading.main_thread() not in writers
+    # Writes do not overlap: results finished while one was in flight go out together in the next.
+    assert len(writers) < 6
+    assert [analysis["image_index"] for analysis in store.get(job_id)["partial_results"]] == [0, 1, 2, 3, 4]
+    assert store.get(job_id)["progress"]["images_done"] == 5
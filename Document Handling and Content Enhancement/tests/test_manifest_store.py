@@ -0,0 +1,55 @@
+import os
+import threading
+
+from manifest import DocumentManifest, ManifestStore
+
+
+def _manifest(workspace, document_id: str, image_bytes: int = 1000) -> DocumentManifest:
+    """A manifest with one enhanced image of `image_bytes` written into `workspace`."""
+    filename = f"{document_id}.png"
+    (workspace / filename).write_bytes(os.urandom(image_bytes))
+    manifest = DocumentManifest(document_id, {"analysis": {"dpi": 300}})
+    manifest.record_image(f"key-{document_id}", {"filename": filename})
+    return manifest
+
+
+def test_concurrent_saves_of_one_document_do_not_collide(tmp_path):
+    store = ManifestStore(str(tmp_path / "store"))
+    manifest = _manifest(tmp_path, "doc")
+    errors = []
+
+    def save():
+        try:
+            for _ in range(20):
+                store.save(manifest, str(tmp_path))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert store.load("doc")["document_id"] == "doc"
+
+
+def test_least_recently_used_documents_are_evicted(tmp_path):
+    store = ManifestStore(str(tmp_path / "store"), max_bytes=4500)
+    for document_id in ("a", "b", "c"):
+        store.save(_manifest(tmp_path, document_id), str(tmp_path))
+        os.utime(os.path.join(store._document_dir(document_id), "manifest.json"),
+                 (0, {"a": 100, "b": 200, "c": 300}[document_id]))
+    store.load("a")  # Used again, so "b" is now the oldest.
+    store.save(_manifest(tmp_path, "d"), str(tmp_path))
+    assert store.load("b") is None
+    assert all(store.load(document_id) is not None for document_id in ("a", "c", "d"))
+    assert store.stats()["evictions"] == 1
+    assert store.stats()["bytes"] <= 4500
+
+
+def test_without_a_limit_nothing_is_evicted(tmp_path):
+    store = ManifestStore(str(tmp_path / "store"))
+    for document_id in ("a", "b", "c"):
+        store.save(_manifest(tmp_path, document_id, image_bytes=100_000), str(tmp_path))
+    assert all(store.load(document_id) is not None for document_id in ("a", "b", "c"))
@@ -0,0 +1,68 @@
+import metrics
+
+
+def _samples(text: str) -> dict:
+    """Parses Prometheus text exposition into {series: value}, skipping comments."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            series, value = line.rsplit(" ", 1)
+            samples[series] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "ocr")
+    samples = _samples(registry.render())
+    assert samples['latency_seconds_bucket{stage="ocr",le="0.1"}'] == 1
+    assert samples['latency_seconds_bucket{stage="ocr",le="1"}'] == 3
+    assert samples['latency_seconds_bucket{stage="ocr",le="+Inf"}'] == 4
+    assert samples['latency_seconds_count{stage="ocr"}'] == 4
+    assert samples['latency_seconds_sum{stage="ocr"}'] == 6.05
+
+
+def test_counters_and_collectors_render_at_scrape_time():
+    registry = metrics.Registry()
+    counter = registry.counter("documents_total", "Documents.", ("format",))
+    counter.inc("pdf")
+    counter.inc("pdf", amount=2)
+    depth = {"value": 1}
+    registry.add_collector(lambda: [("queue_depth", "gauge", "Queue depth.", depth["value"])])
+    depth["value"] = 7
+    text = registry.render()
+    assert "# TYPE documents_total counter" in text and "# TYPE queue_depth gauge" in text
+    assert _samples(text) == {'documents_total{format="pdf"}': 3, "queue_depth": 7}
+
+
+def test_failed_span_counts_an_error_and_its_time():
+    before = _samples(metrics.registry.render()).get('stage_errors_total{stage="test_failure"}', 0)
+    try:
+        with metrics.span("test_failure"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    samples = _samples(metrics.registry.render())
+    assert samples['stage_errors_total{stage="test_failure"}'] == before + 1
+    assert samples['document_stage_seconds_count{stage="test_failure"}'] >= 1
+
+
+def test_metrics_endpoint_reports_processed_documents(client, make_pdf):
+    def scrape() -> dict:
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        return _samples(response.text)
+
+    series = 'documents_processed_total{format="pdf",status="success"}'
+    before = scrape().get(series, 0)
+    response = client.post("/process-document/", files={"file": ("m.pdf", make_pdf(["Counted."]), "application/pdf")})
+    assert response.status_code == 200
+    after = scrape()
+    assert after[series] == before + 1
+    assert after['pages_processed_total{page_type="text"}'] >= 1
+    assert after['document_stage_seconds_count{stage="extract_pdf"}'] >= 1
+    for gauge in ("result_cache_memory_entries", "manifest_store_bytes", "execution_pending_requests"):
+        assert gauge in after
@@ -0,0 +1,126 @@
+import threading
+import types
+
+import pytest
+
+import ocr
+
+
+@pytest.fixture
+def fake_tesserocr(monkeypatch):
+    """A tesserocr stand-in that records which threads created an API (i.e. loaded the traineddata)."""
+    created = []
+
+    class PyTessBaseAPI:
+        def __init__(self, lang, oem, psm):
+            created.append(threading.get_ident())
+
+    monkeypatch.setitem(__import__("sys").modules, "tesserocr", types.SimpleNamespace(PyTessBaseAPI=PyTessBaseAPI))
+    return created
+
+
+def test_warm_loads_the_api_in_the_calling_thread(fake_tesserocr):
+    backend = ocr.TesserocrBackend()
+    assert fake_tesserocr == []
+    worker = threading.Thread(target=backend.warm)
+    worker.start()
+    worker.join()
+    assert fake_tesserocr == [worker.ident]
+    backend.warm()
+    backend.warm()
+    assert fake_tesserocr == [worker.ident, threading.get_ident()]
+
+
+def test_engine_initializer_warms_the_backend(processor, fake_tesserocr, monkeypatch):
+    monkeypatch.setattr(ocr, "_backend", None)
+    monkeypatch.setattr(processor, "OCR_BACKEND", "tesserocr")
+    processor.warm_ocr_backend()
+    assert fake_tesserocr == [threading.get_ident()]
+
+
+def _words() -> ocr.OcrWords:
+    """Two paragraphs: a confident line, a weak line, then a confident line."""
+    words = ocr.OcrWords((200, 100))
+    words.append("Invoice", (10, 10, 40, 10), 95, line=0, paragraph=0)
+    words.append("2024", (55, 12, 20, 8), 91, line=0, paragraph=0)
+    words.append("T0tal", (10, 30, 30, 10), 40, line=1, paragraph=0)
+    words.append("du3", (45, 30, 20, 10), 30, line=1, paragraph=0)
+    words.append("Thanks", (10, 60, 35, 10), 88, line=2, paragraph=1)
+    return words
+
+
+def test_words_lay_out_like_tesseract_text():
+    words = _words()
+    assert words.to_text() == "Invoice 2024\nT0tal du3\n\nThanks"
+    lines = list(words.iter_lines())
+    assert [(start, end) for start, end, _, _ in lines] == [(0, 2), (2, 4), (4, 5)]
+    assert lines[0][2] == (10, 10, 65, 10)  # The union of the line's word boxes.
+    assert lines[1][3] == 35
+
+
+def test_words_serialise_column_wise_with_line_summaries():
+    data = _words().to_dict()
+    assert data["image_size"] == [200, 100]
+    assert data["text"][2] == "T0tal" and data["conf"][2] == 40
+    assert data["lines"]["first_word"] == [0, 2, 4] and data["lines"]["word_count"] == [2, 2, 1]
+    assert data["lines"]["conf"] == [93.0, 35.0, 88.0]
+
+
+class _LineReader:
+    """A backend that reads every crop as the given words, recording the crops it was handed."""
+
+    def __init__(self, candidate: ocr.OcrWords):
+        self.candidate = candidate
+        self.crops = []
+
+    def recognize_words(self, image, psm=None):
+        self.crops.append((image.size, psm))
+        return self.candidate
+
+
+def test_only_weak_lines_are_reread_and_mapped_back():
+    from PIL import Image
+    candidate = ocr.OcrWords((140, 36))
+    candidate.append("Total", (8, 8, 60, 20), 90, line=0, paragraph=0)
+    candidate.append("due", (78, 8, 40, 20), 85, line=0, paragraph=0)
+    backend = _LineReader(candidate)
+
+    merged, replaced = ocr.reocr_low_confidence(backend, Image.new("L", (200, 100)), _words(), threshold=60)
+    assert replaced == 1
+    # One crop: the weak line's box (10, 30, 55, 10) padded by 4 pixels, then doubled.
+    assert backend.crops == [((126, 36), 7)]
+    assert merged.to_text() == "Invoice 2024\nTotal due\n\nThanks"
+    assert (merged.left[2], merged.top[2], merged.width[2]) == (10, 30, 30)  # 6 + 8 / 2, 26 + 8 / 2, 60 / 2.
+    assert list(merged.line) == [0, 0, 1, 1, 2]
+
+
+def test_a_less_confident_reread_keeps_the_original_line():
+    from PIL import Image
+    candidate = ocr.OcrWords((10, 10))
+    candidate.append("T?t?l", (0, 0, 5, 5), 20, line=0, paragraph=0)
+    merged, replaced = ocr.reocr_low_confidence(_LineReader(candidate), Image.new("L", (200, 100)), _words(),
+                                                threshold=60)
+    assert replaced == 0
+    assert merged.to_text() == _words().to_text()
+
+
+def test_pytesseract_words_come_from_one_tsv_pass(monkeypatch):
+    from PIL import Image
+    calls = []
+
+    def image_to_data(image, config, lang, output_type):
+        calls.append(config)
+        return {  # A page, then one line holding one blank and two real words.
+            "level": [1, 4, 5, 5, 5],
+            "block_num": [0, 1, 1, 1, 1], "par_num": [0, 1, 1, 1, 1], "line_num": [0, 1, 1, 1, 1],
+            "text": ["", "", " ", "Hello", "world"],
+            "left": [0, 0, 0, 5, 40], "top": [0, 0, 0, 5, 5], "width": [0, 0, 0, 30, 30],
+            "height": [0, 0, 0, 10, 10], "conf": [-1, -1, -1, "96.5", "87"],
+        }
+
+    fake = types.SimpleNamespace(image_to_data=image_to_data, Output=types.SimpleNamespace(DICT="dict"))
+    monkeypatch.setitem(__import__("sys").modules, "pytesseract", fake)
+    words = ocr.PytesseractBackend().recognize_words(Image.new("L", (80, 20)), psm=7)
+    assert calls == ["--oem 3 --psm 7"]
+    assert words.text == ["Hello", "world"] and list(words.conf) == [96, 87]
+    assert words.to_text() == "Hello world"
@@ -0,0 +1,68 @@
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+
+from execution import ExecutionEngine
+
+
+@pytest.fixture
+def wide_engine(processor, monkeypatch):
+    """A four-worker engine with four pages prefetched, whatever the machine's CPU count."""
+    engine = ExecutionEngine(mode="thread", max_workers=4)
+    monkeypatch.setattr(processor, "execution_engine", engine)
+    monkeypatch.setattr(processor, "PDF_PAGE_PREFETCH", 4)
+    yield engine
+    engine.shutdown()
+
+
+def _iterate(processor, path: str) -> list:
+    async def collect():
+        return [(event, images) async for event, images in processor.iter_pdf_pages(path) if event["type"] == "page"]
+    return asyncio.run(collect())
+
+
+def test_pages_of_one_document_are_extracted_concurrently(processor, make_pdf, wide_engine, monkeypatch, tmp_path):
+    extract_pdf_page = processor.extract_pdf_page
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def slow_extract(*args):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(0.05)
+        try:
+            return extract_pdf_page(*args)
+        finally:
+            with lock:
+                running["now"] -= 1
+
+    monkeypatch.setattr(processor, "extract_pdf_page", slow_extract)
+    path = tmp_path / "pages.pdf"
+    path.write_bytes(make_pdf([f"Page {number} of a long report. " * 5 for number in range(1, 9)]))
+    pages = _iterate(processor, str(path))
+    assert [event["page"] for event, _ in pages] == list(range(1, 9))
+    assert running["peak"] >= 3
+
+
+def test_image_shared_across_prefetched_pages_is_analysed_once(processor, wide_engine, tmp_path):
+    import fitz
+    from PIL import Image
+    import enhancement
+    logo = io.BytesIO()
+    Image.fromarray(enhancement.synthetic_scan(80, 40, seed=3)).save(logo, "PNG")
+    doc = fitz.open()
+    xref = 0
+    for number in range(6):
+        page = doc.new_page()
+        page.insert_text((72, 200), f"Page {number + 1} body text, long enough to be a text page. " * 3, fontsize=8)
+        xref = page.insert_image(fitz.Rect(20, 20, 100, 60), stream=logo.getvalue() if not xref else None, xref=xref)
+    path = tmp_path / "logo.pdf"
+    doc.save(str(path))
+    pages = _iterate(processor, str(path))
+    images = [refs for _, page_images in pages for _, _, _, refs in page_images]
+    assert len(images) == 1
+    assert images[0]["source_pages"] == list(range(1, 7))
@@ -0,0 +1,70 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+
+def _page_hash(processor, pdf_bytes: bytes) -> str:
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return processor.pdf_page_hash(doc, doc[0])
+
+
+def test_page_hash_is_stable_across_opens(processor, make_pdf):
+    pdf_bytes = make_pdf([("scan", "page 1")])
+    assert _page_hash(processor, pdf_bytes) == _page_hash(processor, pdf_bytes)
+
+
+def test_annotation_on_an_unchanged_scan_changes_the_page_hash(processor, make_pdf):
+    pdf_bytes = make_pdf([("scan", None)])
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    page = doc[0]
+    annot = page.add_freetext_annot(fitz.Rect(100, 100, 400, 160), "CANCELLED", fontsize=24)
+    stamped = doc.tobytes()
+    assert doc[0].read_contents() == fitz.open(stream=pdf_bytes, filetype="pdf")[0].read_contents()
+    assert _page_hash(processor, stamped) != _page_hash(processor, pdf_bytes)
+
+    annot.set_info(content="APPROVED")
+    annot.update()
+    assert _page_hash(processor, doc.tobytes()) != _page_hash(processor, stamped)
+
+
+def test_form_xobject_content_is_part_of_the_page_hash(processor):
+    def page_showing(text: str) -> bytes:
+        source = fitz.open()
+        source.new_page().insert_text((72, 72), text)
+        doc = fitz.open()
+        doc.new_page().show_pdf_page(fitz.Rect(0, 0, 595, 842), source, 0)
+        return doc.tobytes()
+
+    first, second = page_showing("first form"), page_showing("second form")
+    # Both pages only say "draw the form"; what the form draws differs.
+    assert fitz.open(stream=first)[0].read_contents() == fitz.open(stream=second)[0].read_contents()
+    assert _page_hash(processor, first) != _page_hash(processor, second)
+
+
+def test_grayscale_render_is_a_view_of_the_pixmap_samples(processor, tmp_path):
+    np = pytest.importorskip("numpy")
+    doc = fitz.open()
+    page = doc.new_page(width=101, height=53)  # An odd width, so rows are not word-aligned.
+    page.draw_rect(fitz.Rect(10, 10, 40, 30), color=(0, 0, 0), fill=(0, 0, 0))
+    path = tmp_path / "odd.pdf"
+    doc.save(str(path))
+
+    gray, pixmap = processor.render_page_grayscale(str(path), 0, 144)
+    assert gray.shape == (pixmap.height, pixmap.width) == (106, 202)
+    assert gray.dtype == np.uint8 and pixmap.n == 1
+    assert np.shares_memory(gray, np.frombuffer(pixmap.samples_mv, dtype=np.uint8))
+    expected = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.stride)[:, :pixmap.width]
+    assert np.array_equal(gray, expected)
+    assert gray[40, 50] == 0 and gray[90, 180] == 255
+
+
+def test_render_matches_the_reference_rgb_conversion(processor, make_pdf, tmp_path):
+    np = pytest.importorskip("numpy")
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(make_pdf([("scan", "footer")]))
+    gray, _ = processor.render_page_grayscale(str(path), 0, 72)
+    rgb = fitz.open(str(path))[0].get_pixmap(dpi=72, alpha=False)
+    reference = np.frombuffer(rgb.samples, dtype=np.uint8).reshape(rgb.height, rgb.width, 3)
+    luma = reference @ np.array([0.299, 0.587, 0.114])
+    assert gray.shape == luma.shape
+    assert np.abs(gray.astype(float) - luma).mean() < 2
@@ -0,0 +1,54 @@
+import io
+
+
+def _classify(processor, pdf_bytes: bytes, page_num: int = 0):
+    import fitz
+    page = fitz.open(stream=pdf_bytes, filetype="pdf")[page_num]
+    return processor.classify_pdf_page(page, page.get_text("text"))
+
+
+def test_born_digital_page_is_read_from_its_text_layer(processor, make_pdf):
+    page_type, _ = _classify(processor, make_pdf(["A born-digital page with a proper text layer. " * 3]))
+    assert page_type == "text"
+
+
+def test_full_page_scan_is_rendered(processor, make_pdf):
+    page_type, metrics = _classify(processor, make_pdf([("scan", None)]))
+    assert page_type == "scanned"
+    assert metrics["image_coverage"] > 0.9
+
+
+def test_scan_with_short_footer_layer_is_still_rendered(processor, make_pdf):
+    page_type, metrics = _classify(processor, make_pdf([("scan", "Scanned with CamScanner - a scanning app for phones")]))
+    assert metrics["text_coverage"] < processor.PAGE_SCAN_TEXT_COVERAGE
+    assert page_type == "scanned"
+
+
+def test_scan_with_footer_is_ocrd_through_the_api(client, fake_ocr, make_pdf):
+    pdf = make_pdf([("scan", "Scanned with CamScanner - a scanning app for phones")])
+    response = client.post("/process-document/", files={"file": ("footer.pdf", pdf, "application/pdf")})
+    assert response.status_code == 200
+    [analysis] = response.json()["image_analysis"]
+    assert analysis["page_render"] is True
+    assert analysis["ocr_text"] == "scanned page text"
+
+
+def test_large_image_on_text_page_is_not_skipped(client, fake_ocr):
+    import fitz
+    from PIL import Image
+    import enhancement
+    doc = fitz.open()
+    page = doc.new_page()
+    photo = io.BytesIO()
+    Image.fromarray(enhancement.synthetic_scan(400, 400, seed=7)).save(photo, "PNG")
+    page.insert_image(fitz.Rect(0, 0, 595, 540), stream=photo.getvalue())
+    small = io.BytesIO()
+    Image.fromarray(enhancement.synthetic_scan(60, 60, seed=8)).save(small, "PNG")
+    page.insert_image(fitz.Rect(500, 760, 560, 820), stream=small.getvalue())
+    for line in range(12):
+        page.insert_text((40, 570 + line * 20), "A text layer long enough to count as a born-digital page. " * 2, fontsize=9)
+    response = client.post("/process-document/", files={"file": ("figure.pdf", doc.tobytes(), "application/pdf")})
+    assert response.status_code == 200
+    analyses = sorted(response.json()["image_analysis"], key=lambda analysis: analysis["image_index"])
+    assert [analysis.get("ocr_skipped", False) for analysis in analyses] == [False, True]
+    assert analyses[0]["ocr_text"] == "scanned page text"
@@ -0,0 +1,46 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+from pdf_writer import TextPdfWriter, write_text_pdf  # noqa: E402  (needs PyMuPDF)
+
+
+def _read(path) -> tuple:
+    with fitz.open(str(path)) as doc:
+        return doc.page_count, "".join(page.get_text("text") for page in doc)
+
+
+def test_long_text_is_paginated_without_truncation(tmp_path):
+    text = "\n".join(f"Line {index} of a long report with enough words to wrap around. " * 2 for index in range(300))
+    pages, extracted = _read(write_text_pdf(text, str(tmp_path / "long.pdf")))
+    assert pages > 5
+    assert extracted.split() == text.split()
+
+
+def test_word_wider_than_a_line_is_split(tmp_path):
+    word = "x" * 400
+    pages, extracted = _read(write_text_pdf(f"before {word} after", str(tmp_path / "wide.pdf")))
+    lines = extracted.split()
+    assert lines[0] == "before" and lines[-1] == "after"
+    assert len(lines) > 3 and "".join(lines[1:-1]) == word
+
+
+def test_streamed_writes_match_a_single_write(tmp_path):
+    text = "First paragraph.\nA second paragraph split across calls, mid-word and mid-line.\n\nLast."
+    write_text_pdf(text, str(tmp_path / "whole.pdf"))
+    with TextPdfWriter(str(tmp_path / "streamed.pdf")) as writer:
+        for start in range(0, len(text), 7):
+            writer.write(text[start:start + 7])
+    assert _read(tmp_path / "streamed.pdf") == _read(tmp_path / "whole.pdf")
+
+
+def test_empty_text_still_makes_a_page(tmp_path):
+    assert _read(write_text_pdf("", str(tmp_path / "empty.pdf"))) == (1, "")
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    path = tmp_path / "failed.pdf"
+    with pytest.raises(RuntimeError):
+        with TextPdfWriter(str(path)) as writer:
+            writer.write("partial text\n")
+            raise RuntimeError("source went away")
+    assert not path.exists()
@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+from chunking import ChunkWriter, make_chunks, read_chunks, split_text
+
+np = pytest.importorskip("numpy")
+from vector_index import VectorIndex  # noqa: E402  (needs numpy)
+
+TEXT = " ".join(f"word{index:04d}" for index in range(600))
+
+
+def test_spans_are_bounded_overlapping_and_cut_at_spaces():
+    spans = list(split_text(TEXT, size=200, overlap=50))
+    assert spans[0][0] == 0 and spans[-1][1] == len(TEXT)
+    for (start, end), (next_start, _) in zip(spans, spans[1:]):
+        assert end - start <= 200
+        assert next_start < end  # Consecutive spans overlap...
+        assert TEXT[next_start - 1] == " " and (end == len(TEXT) or TEXT[end] == " ")  # ...at word boundaries.
+
+
+def test_invalid_chunk_settings_are_rejected():
+    with pytest.raises(ValueError):
+        list(split_text(TEXT, size=100, overlap=100))
+
+
+def test_chunks_carry_their_provenance():
+    chunks = make_chunks(TEXT, size=300, overlap=0, page=3, source="ocr", bbox=[1, 2, 3, 4])
+    assert " ".join(chunk["text"] for chunk in chunks).split() == TEXT.split()
+    assert all(chunk["page"] == 3 and chunk["source"] == "ocr" and chunk["bbox"] == [1, 2, 3, 4] for chunk in chunks)
+    assert make_chunks("   \n  ", page=1) == []
+
+
+def test_chunk_file_round_trips_in_batches(tmp_path):
+    writer = ChunkWriter(str(tmp_path / "chunks.jsonl"), size=300, overlap=0)
+    first = writer.add(TEXT, page=1, source="text")
+    writer.add("A caption read from an image.", page=2, image_index=0, source="ocr")
+    writer.close()
+    batches = list(read_chunks(writer.path, batch_size=4))
+    chunks = [chunk for batch in batches for chunk in batch]
+    assert all(len(batch) <= 4 for batch in batches)
+    assert [chunk["chunk_index"] for chunk in chunks] == list(range(writer.count))
+    assert chunks[first]["image_index"] == 0 and chunks[first]["page"] == 2
+
+
+def _vectors(count: int, dim: int = 16, seed: int = 0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def test_exact_search_finds_the_nearest_vectors(tmp_path):
+    index = VectorIndex(str(tmp_path), min_train=10_000)
+    vectors = _vectors(50)
+    index.add("doc", vectors, [{"row": row} for row in range(50)])
+    results = index.search(vectors[7], k=3)
+    assert results[0]["row"] == 7 and results[0]["document_id"] == "doc"
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+    assert [result["score"] for result in results] == sorted((result["score"] for result in results), reverse=True)
+
+
+def test_removed_and_filtered_documents(tmp_path):
+    index = VectorIndex(str(tmp_path), min_train=10_000)
+    vectors = _vectors(20)
+    index.add("a", vectors[:10], [{"row": row} for row in range(10)])
+    index.add("b", vectors[10:], [{"row": row} for row in range(10, 20)])
+    assert {result["document_id"] for result in index.search(vectors[0], k=20, document_id="b")} == {"b"}
+    assert index.remove_document("a") == 10
+    assert {result["document_id"] for result in index.search(vectors[0], k=20)} == {"b"}
+    assert index.stats()["live_vectors"] == 10
+
+
+def test_ivf_search_with_every_list_probed_matches_exact_search(tmp_path):
+    vectors = _vectors(400, seed=1)
+    metadatas = [{"row": row} for row in range(400)]
+    exact = VectorIndex(str(tmp_path / "exact"), min_train=10_000)
+    exact.add("doc", vectors, metadatas)
+    ivf = VectorIndex(str(tmp_path / "ivf"), min_train=100)
+    ivf.add("doc", vectors[:200], metadatas[:200])
+    ivf.add("doc", vectors[200:], metadatas[200:])  # Assigned to lists as they arrive.
+    lists = ivf.stats()["lists"]
+    assert lists > 1
+    query = _vectors(1, seed=2)[0]
+    expected = [result["row"] for result in exact.search(query, k=5)]
+    assert [result["row"] for result in ivf.search(query, k=5, nprobe=lists)] == expected
+
+
+def test_index_reopens_from_disk(tmp_path):
+    vectors = _vectors(30)
+    VectorIndex(str(tmp_path), min_train=10).add("doc", vectors, [{"row": row} for row in range(30)])
+    reopened = VectorIndex(str(tmp_path), min_train=10)
+    assert reopened.count == 30
+    assert reopened.search(vectors[4], k=1, nprobe=reopened.stats()["lists"])[0]["row"] == 4
+    with pytest.raises(ValueError):
+        reopened.add("doc", _vectors(1, dim=8), [{}])
+
+
+def test_instances_sharing_a_directory_see_each_others_writes(tmp_path):
+    # Two processes (e.g. uvicorn workers) each holding their own instance of one index.
+    first, second = VectorIndex(str(tmp_path), min_train=10_000), VectorIndex(str(tmp_path), min_train=10_000)
+    vectors = _vectors(30)
+    assert first.add("a", vectors[:10], [{"row": row} for row in range(10)]) == range(0, 10)
+    assert second.add("b", vectors[10:20], [{"row": row} for row in range(10, 20)]) == range(10, 20)
+    assert first.add("c", vectors[20:], [{"row": row} for row in range(20, 30)]) == range(20, 30)
+    for index in (first, second, VectorIndex(str(tmp_path), min_train=10_000)):
+        assert index.count == 30
+        for row in (5, 15, 25):
+            assert index.search(vectors[row], k=1)[0]["row"] == row
+    assert second.remove_document("a") == 10
+    assert {result["document_id"] for result in first.search(vectors[0], k=30)} == {"b", "c"}
+
+
+def test_opening_an_index_keeps_rows_saved_by_another_instance(tmp_path):
+    writer = VectorIndex(str(tmp_path), min_train=10_000)
+    writer.add("a", _vectors(5), [{}] * 5)
+    reader = VectorIndex(str(tmp_path), min_train=10_000)
+    writer.add("b", _vectors(5, seed=1), [{}] * 5)
+    VectorIndex(str(tmp_path), min_train=10_000)  # A third process starting up must not cut "b" off.
+    assert reader.stats()["live_vectors"] == 10
+    assert os.path.getsize(tmp_path / "vectors.f32") == 10 * 16 * 4
+
+
+def test_rows_left_by_an_interrupted_add_are_dropped(tmp_path):
+    index = VectorIndex(str(tmp_path), min_train=10_000)
+    vectors = _vectors(6)
+    index.add("a", vectors[:3], [{"row": row} for row in range(3)])
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        vectors[3:4].tofile(f)  # A crash between appending vectors and saving the state.
+    index.add("b", vectors[4:], [{"row": row} for row in range(4, 6)])
+    assert index.search(vectors[5], k=1)[0]["row"] == 5
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+PROCESSOR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Runs in a fresh interpreter so the process pool and the warm-up thread start exactly as in production.
+FIRST_REQUEST_SCRIPT = textwrap.dedent("""
+    import sys
+    sys.path.insert(0, sys.argv[1])
+
+    if __name__ == "__main__":
+        import fitz
+        from fastapi.testclient import TestClient
+        import separation_and_image_enhancement as processor
+
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), "Posted right after startup. " * 3)
+        with TestClient(processor.app) as client:
+            response = client.post("/process-document/", files={"file": ("a.pdf", doc.tobytes(), "application/pdf")})
+            print("status", response.status_code)
+""")
+
+
+def test_first_request_after_startup_does_not_hang(tmp_path):
+    """Workers must not be forked while the warm-up thread holds import locks."""
+    pytest.importorskip("fitz")
+    pytest.importorskip("cv2")
+    script = tmp_path / "first_request.py"
+    script.write_text(FIRST_REQUEST_SCRIPT)
+    env = {**os.environ, "EXECUTION_MODE": "process", "WARM_UP_ON_STARTUP": "true", "EXECUTION_WORKERS": "2"}
+    env.pop("EXECUTION_START_METHOD", None)
+    try:
+        result = subprocess.run([sys.executable, str(script), PROCESSOR_DIR], env=env, capture_output=True,
+                                text=True, timeout=180)
+    except subprocess.TimeoutExpired:
+        pytest.fail("The first request after startup hung.")
+    assert result.returncode == 0, result.stderr
+    # Workers share stdout and may log (e.g. a missing OCR binary) around the status line.
+    assert "status 200" in result.stdout.splitlines()
+
+
+PRELOAD_SCRIPT = textwrap.dedent("""
+    import asyncio
+    import sys
+    sys.path.insert(0, sys.argv[1])
+
+    def loaded_in_worker():
+        return sorted(name for name in ("fitz", "separation_and_image_enhancement") if name in sys.modules)
+
+    if __name__ == "__main__":
+        from execution import ExecutionEngine
+        engine = ExecutionEngine(mode="process", max_workers=1, start_method="forkserver", preload=("fitz",))
+        try:
+            print("loaded", *asyncio.run(engine.run(loaded_in_worker)))
+        finally:
+            engine.shutdown()
+""")
+
+
+def test_workers_start_with_the_preloaded_libraries(tmp_path):
+    pytest.importorskip("fitz")
+    script = tmp_path / "preload.py"
+    script.write_text(PRELOAD_SCRIPT)
+    result = subprocess.run([sys.executable, str(script), PROCESSOR_DIR], capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert "loaded fitz" in result.stdout.splitlines()
+
+
+def test_fork_server_preloads_libraries_not_the_app_module(processor):
+    preload = processor.execution_engine.preload
+    assert processor.__name__ not in preload
+    assert {"fitz", "cv2", "numpy"} <= set(preload)
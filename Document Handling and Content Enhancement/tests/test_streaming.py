@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+
+async def _pages(count: int, pulled: list):
+    """A page source with one image per page that records how far it has been read."""
+    yield {"type": "document", "pages": count}, []
+    for page in range(count):
+        pulled.append(page)
+        yield {"type": "page", "page": page + 1, "text": f"page {page + 1}"}, [(page, 0, b"image", {})]
+
+
+@pytest.fixture
+def instant_analysis(processor, monkeypatch):
+    async def analyze_image_data(image, page_num, img_index, temp_dir, run_ocr=True, manifest=None, image_hash=None):
+        await asyncio.sleep(0)
+        return {"source_page": page_num + 1, "image_index": img_index}, None
+
+    monkeypatch.setattr(processor, "analyze_image_data", analyze_image_data)
+
+
+def test_pages_are_pulled_only_within_the_window(processor, instant_analysis, monkeypatch, tmp_path):
+    monkeypatch.setattr(processor, "STREAM_MAX_INFLIGHT_PAGES", 3)
+    pulled, consumed_pages = [], set()
+
+    async def consume():
+        events = []
+        async for event in processor.stream_document(_pages(20, pulled), str(tmp_path)):
+            events.append(event)
+            if event["type"] == "image":
+                consumed_pages.add(event["analysis"]["source_page"])
+            # The document event holds a slot too, so at most 3 pages are ahead of the consumer.
+            assert len(pulled) - len(consumed_pages) <= 3
+            await asyncio.sleep(0.001)
+        return events
+
+    events = asyncio.run(consume())
+    assert len(pulled) == 20
+    assert [event["page"] for event in events if event["type"] == "page"] == list(range(1, 21))
+    assert sorted(event["position"] for event in events if event["type"] == "image") == list(range(20))
+
+
+def test_without_a_window_the_source_is_read_ahead(processor, instant_analysis, monkeypatch, tmp_path):
+    monkeypatch.setattr(processor, "STREAM_MAX_INFLIGHT_PAGES", 0)
+    pulled = []
+
+    async def first_event():
+        stream = processor.stream_document(_pages(20, pulled), str(tmp_path))
+        await stream.__anext__()
+        await asyncio.sleep(0.05)
+        await stream.aclose()
+
+    asyncio.run(first_event())
+    assert len(pulled) == 20
+
+
+def test_analysis_error_ends_the_stream(processor, monkeypatch, tmp_path):
+    async def failing_analysis(*args, **kwargs):
+        raise RuntimeError("enhancement failed")
+
+    monkeypatch.setattr(processor, "analyze_image_data", failing_analysis)
+
+    async def consume():
+        async for _ in processor.stream_document(_pages(5, []), str(tmp_path)):
+            pass
+
+    with pytest.raises(RuntimeError, match="enhancement failed"):
+        asyncio.run(consume())
+
+
+def test_endpoint_streams_ndjson_events_in_page_order(client, make_pdf):
+    response = client.post(
+        "/process-document/stream",
+        files={"file": ("report.pdf", make_pdf(["first page", "second page"]), "application/pdf")},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert events[0]["type"] == "document" and events[-1]["type"] == "complete"
+    assert [event["page"] for event in events if event["type"] == "page"] == [1, 2]
+
+
+def test_endpoint_streams_server_sent_events(client, make_pdf):
+    response = client.post(
+        "/process-document/stream?format=sse",
+        files={"file": ("report.pdf", make_pdf(["only page"]), "application/pdf")},
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    blocks = [block for block in response.text.split("\n\n") if block]
+    assert blocks[0].startswith("event: document\ndata: ")
+    assert blocks[-1].startswith("event: complete\ndata: ")
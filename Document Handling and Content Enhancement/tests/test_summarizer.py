@@ -0,0 +1,116 @@
+import asyncio
+import time
+import types
+
+from summarizer import RetryableBackendError, StubBackend, SummarizationClient, TokenBucket, is_retryable
+
+
+def _client(backend, **options) -> SummarizationClient:
+    """A client with no real rate limit and near-zero backoff, unless a test asks for them."""
+    return SummarizationClient(backend, **{"requests_per_minute": 60_000, "backoff_base": 0.001, **options})
+
+
+def test_retryable_failures_are_retried():
+    backend = StubBackend(failures=2)
+    summary = asyncio.run(_client(backend).summarize(b"image", "text"))
+    assert summary.startswith("Stub summary")
+    assert backend.calls == 3
+
+
+def test_retries_give_up_after_max_retries():
+    backend = StubBackend(failures=10)
+    summary = asyncio.run(_client(backend, max_retries=2).summarize(b"image", "text"))
+    assert summary.startswith("[ERROR]")
+    assert backend.calls == 3
+
+
+def test_other_errors_are_not_retried():
+    class BrokenBackend(StubBackend):
+        async def generate(self, prompt, parts):
+            self.calls += 1
+            raise ValueError("bad request")
+
+    backend = BrokenBackend()
+    summary = asyncio.run(_client(backend).summarize(b"image", "text"))
+    assert summary == "[ERROR] Gemini API call failed: bad request"
+    assert backend.calls == 1
+
+
+def test_backoff_waits_at_least_retry_after():
+    class ThrottledBackend(StubBackend):
+        async def generate(self, prompt, parts):
+            self.calls += 1
+            if self.calls == 1:
+                raise RetryableBackendError("429", retry_after=0.2)
+            return "ok"
+
+    started = time.monotonic()
+    assert asyncio.run(_client(ThrottledBackend()).summarize(b"image", "text")) == "ok"
+    assert time.monotonic() - started >= 0.2
+
+
+def test_status_codes_decide_what_is_retryable():
+    assert is_retryable(types.SimpleNamespace(code=429))
+    assert is_retryable(types.SimpleNamespace(code=types.SimpleNamespace(value=503)))
+    assert not is_retryable(types.SimpleNamespace(code=400))
+
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    async def acquire_all():
+        bucket = TokenBucket(rate=20, capacity=1)
+        for _ in range(5):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    asyncio.run(acquire_all())
+    # The first request uses the burst; the other four wait 1/20 s each.
+    assert time.monotonic() - started >= 0.18
+
+
+def test_concurrency_is_limited():
+    class CountingBackend(StubBackend):
+        running = peak = 0
+
+        async def generate(self, prompt, parts):
+            CountingBackend.running += 1
+            CountingBackend.peak = max(CountingBackend.peak, CountingBackend.running)
+            await asyncio.sleep(0.02)
+            CountingBackend.running -= 1
+            return "ok"
+
+    async def summarize_all():
+        client = _client(CountingBackend(), max_concurrency=2)
+        return await asyncio.gather(*(client.summarize(b"image", f"text {i}") for i in range(6)))
+
+    assert asyncio.run(summarize_all()) == ["ok"] * 6
+    assert CountingBackend.peak == 2
+
+
+def test_summaries_of_one_group_are_batched_into_one_request():
+    backend = StubBackend()
+
+    async def summarize_all():
+        client = _client(backend, batch_size=3, batch_window=0.05)
+        return await asyncio.gather(*(client.summarize(b"image", "x" * (i + 1), group="doc") for i in range(3)))
+
+    summaries = asyncio.run(summarize_all())
+    assert backend.calls == 1
+    # Each image gets its own entry of the JSON array, in order.
+    snippets = [f"Image {i + 1} OCR Text:\n---\n{'x' * (i + 1)}\n---" for i in range(3)]
+    assert summaries == [f"Stub summary of {len(snippet)} characters of OCR text." for snippet in snippets]
+
+
+def test_unparseable_batch_response_falls_back_to_single_requests():
+    class ProseBackend(StubBackend):
+        async def generate(self, prompt, parts):
+            self.calls += 1
+            return "Here are your summaries!" if len(parts) > 1 else "single"
+
+    backend = ProseBackend()
+
+    async def summarize_all():
+        client = _client(backend, batch_size=3, batch_window=0.05)
+        return await asyncio.gather(*(client.summarize(b"image", "text", group="doc") for _ in range(3)))
+
+    assert asyncio.run(summarize_all()) == ["single"] * 3
+    assert backend.calls == 1 + 3
@@ -0,0 +1,141 @@
+import asyncio
+import io
+import os
+
+import pytest
+
+from workspace import QuotaExceededError, WorkspaceManager
+
+
+class _Upload:
+    """The part of UploadFile that spool_upload reads."""
+
+    def __init__(self, data: bytes):
+        self._stream = io.BytesIO(data)
+
+    async def read(self, size: int) -> bytes:
+        return self._stream.read(size)
+
+
+def test_spooling_stops_at_the_workspace_quota(processor, tmp_path):
+    manager = WorkspaceManager(str(tmp_path), max_workspace_bytes=processor.UPLOAD_CHUNK_BYTES)
+    workspace = manager.create()
+    destination = workspace.file_path("upload.pdf")
+    with pytest.raises(QuotaExceededError):
+        asyncio.run(processor.spool_upload(_Upload(b"x" * processor.UPLOAD_CHUNK_BYTES * 3), destination,
+                                           workspace=workspace))
+    assert os.path.getsize(destination) <= processor.UPLOAD_CHUNK_BYTES
+
+
+def test_tracked_files_count_their_growth_once(tmp_path):
+    manager = WorkspaceManager(str(tmp_path), max_workspace_bytes=100)
+    workspace = manager.create()
+    path = workspace.file_path("text.txt")
+    with open(path, "w") as f:
+        f.write("a" * 40)
+    workspace.track_file(path)
+    with open(path, "a") as f:
+        f.write("a" * 40)
+    workspace.track_file(path)
+    assert workspace.used == 80
+    with open(path, "a") as f:
+        f.write("a" * 40)
+    with pytest.raises(QuotaExceededError):
+        workspace.track_file(path)
+
+
+def test_workspace_in_use_is_not_swept(tmp_path):
+    manager = WorkspaceManager(str(tmp_path), ttl_seconds=0)
+    workspace = manager.create()
+    with workspace.in_use():
+        workspace.expires_at = 0
+        manager.sweep()
+        assert os.path.isdir(workspace.path)
+        assert manager.get(workspace.id) is workspace
+    # The TTL restarts when the run ends; with a zero TTL the next sweep removes it.
+    manager.sweep()
+    assert not os.path.isdir(workspace.path)
+
+
+def test_failed_png_write_raises(processor, tmp_path):
+    import numpy as np
+    with pytest.raises(OSError):
+        processor._write_png(str(tmp_path / "missing" / "image.png"), np.zeros((4, 4), dtype=np.uint8))
+
+
+def test_lazily_rendered_artifact_counts_against_the_quota(processor, client, make_pdf, monkeypatch):
+    response = client.post("/process-document/", files={"file": ("quota.pdf", make_pdf(["Quota test. " * 20]),
+                                                                   "application/pdf")})
+    assert response.status_code == 200
+    workspace = processor.workspace_manager.get(response.json()["workspace_id"])
+    monkeypatch.setattr(processor.workspace_manager, "max_workspace_bytes", workspace.used + 10)
+    response = client.get(f"/documents/{workspace.id}/artifacts/text-only.pdf")
+    assert response.status_code == 507
+    assert not os.path.exists(workspace.file_path(processor.ARTIFACT_FILES["text-only.pdf"]))
+
+
+@pytest.mark.parametrize("workspace_id", ["..", ".", "%2E%2E", "not-a-workspace", "A" * 32])
+def test_ids_that_are_not_workspace_ids_are_never_adopted(tmp_path, workspace_id):
+    manager = WorkspaceManager(str(tmp_path / "root"), ttl_seconds=0)
+    (tmp_path / "root" / workspace_id).mkdir(exist_ok=True)
+    assert manager.adopt(workspace_id) is None
+    manager.release(workspace_id)
+    manager.sweep()
+    assert os.path.isdir(tmp_path / "root") and os.path.isdir(tmp_path / "root" / workspace_id)
+
+
+def test_directory_without_results_is_not_registered(tmp_path):
+    manager = WorkspaceManager(str(tmp_path))
+    workspace = manager.create()
+    manager.release(workspace.id)
+    os.makedirs(workspace.path)
+    assert manager.adopt(workspace.id, required_file="artifacts.json") is None
+    assert manager.get(workspace.id) is None
+
+
+@pytest.mark.parametrize("path", ["/documents/%2E%2E/chunks", "/documents/%2E/chunks", "/documents/..%2F..%2Ftmp/chunks"])
+def test_traversal_ids_are_not_found(processor, client, path):
+    before = dict(processor.workspace_manager._workspaces)
+    assert client.get(path).status_code == 404
+    assert processor.workspace_manager._workspaces == before
+    assert os.path.isdir(processor.workspace_manager.root)
+
+
+def test_usage_is_counted_without_walking_the_root(tmp_path, monkeypatch):
+    import workspace as workspace_module
+    manager = WorkspaceManager(str(tmp_path), max_total_bytes=100)
+    first, second = manager.create(), manager.create()
+    monkeypatch.setattr(workspace_module, "_directory_size", lambda path: pytest.fail("walked " + path))
+    for workspace in (first, second):
+        path = workspace.file_path("text.txt")
+        with open(path, "w") as f:
+            f.write("a" * 40)
+        workspace.track_file(path)
+    assert manager.total_usage() == 80
+    manager.create()
+    first.release()
+    assert manager.total_usage() == 40
+
+
+def test_full_root_is_swept_before_a_workspace_is_refused(tmp_path):
+    manager = WorkspaceManager(str(tmp_path), max_total_bytes=50, usage_check_interval=0)
+    stale = manager.create()
+    with pytest.raises(QuotaExceededError):
+        stale.add_usage(60)  # The write that fills the root fails too.
+    with pytest.raises(QuotaExceededError):
+        manager.create()
+    stale.expires_at = 0
+    assert manager.create() is not None
+    assert not os.path.isdir(stale.path) and manager.total_usage() == 0
+
+
+def test_sweep_measures_directories_left_by_an_earlier_run(tmp_path):
+    earlier = WorkspaceManager(str(tmp_path)).create()
+    with open(earlier.file_path("upload.pdf"), "wb") as f:
+        f.write(b"x" * 30)
+    manager = WorkspaceManager(str(tmp_path))
+    assert manager.total_usage() == 0
+    manager.sweep()
+    assert manager.total_usage() == 30
+    assert manager.adopt(earlier.id).used == 30
+    assert manager.total_usage() == 30
@@ -0,0 +1,308 @@
+import json
+import math
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not POSIX: only one process may write the index.
+    fcntl = None
+
+
+class VectorIndex:
+    """Append-only, file-backed vector index with an inverted-file (IVF) layer for approximate search.
+
+    Vectors are L2-normalised and appended as raw float32 rows, so scores are cosine similarities
+    and the matrix is read through a memory map instead of being loaded. Until `min_train` vectors
+    exist, search is exact. From then on the vectors are clustered with k-means into about sqrt(n)
+    lists, and a query only scores the vectors in the `nprobe` lists whose centroids are closest
+    to it. Vectors added after training are assigned to their nearest list as they arrive; the
+    clustering is retrained whenever the index has grown fourfold.
+
+    Vectors are added per document; re-adding a document first removes its previous vectors,
+    which are then skipped by search (their rows are not reclaimed).
+
+    Several processes (e.g. uvicorn workers) may share one index directory: writes hold an
+    exclusive lock on `index.lock` and searches a shared one, and each reloads the saved state
+    first if another process has changed it.
+    """
+
+    def __init__(self, root: str, nprobe: int = 8, min_train: int = 4096, max_lists: int = 4096):
+        self.root = root
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.max_lists = max_lists
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._state_stamp = None
+        with self._lock, self._file_lock(exclusive=True):
+            self._reload()
+            # Under the exclusive lock no other process is mid-add, so anything past the state is debris.
+            self._truncate_to_state()
+
+    # --- Storage ---
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """Holds the cross-process lock on the index directory; call with self._lock held."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._path("index.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self._path("state.json"))
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _reload(self):
+        """Reloads the state and lists if another process saved them since this one last looked."""
+        stamp = self._stamp()
+        if stamp is not None and stamp == self._state_stamp:
+            return
+        self._state = self._load_state()
+        self._state_stamp = stamp
+        self._centroids = self._load_array("centroids.npy")
+        self._list_order = self._load_array("list_order.npy")
+        self._list_offsets = self._load_array("list_offsets.npy")
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self._path("state.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"dim": None, "count": 0, "meta_bytes": 0, "trained_count": 0, "listed_count": 0,
+                    "documents": {}, "removed": []}
+
+    def _save_state(self):
+        partial_path = self._path(f"state.json.{os.getpid()}.partial")
+        with open(partial_path, "w") as f:
+            json.dump(self._state, f)
+        os.replace(partial_path, self._path("state.json"))
+        self._state_stamp = self._stamp()
+
+    def _truncate_to_state(self):
+        """Drops anything appended after the last saved state, e.g. by an interrupted add()."""
+        count, dim = self._state["count"], self._state["dim"] or 0
+        sizes = {"vectors.f32": count * dim * 4, "meta_offsets.u64": count * 8, "meta.jsonl": self._state["meta_bytes"],
+                 "assignments.i32": count * 4 if self._state["trained_count"] else 0}
+        for name, size in sizes.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _load_array(self, name: str):
+        path = self._path(name)
+        return np.load(path) if os.path.exists(path) and self._state["trained_count"] else None
+
+    def _save_array(self, name: str, array):
+        partial_path = self._path(f"{name}.{os.getpid()}.partial.npy")
+        np.save(partial_path, array)
+        os.replace(partial_path, self._path(name))
+
+    def _vectors(self, count: int):
+        if not count:
+            return np.empty((0, self._state["dim"] or 0), dtype=np.float32)
+        return np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(count, self._state["dim"]))
+
+    def _assignments(self, start: int, stop: int):
+        if stop <= start:
+            return np.empty(0, dtype=np.int32)
+        return np.fromfile(self._path("assignments.i32"), dtype=np.int32, count=stop - start, offset=start * 4)
+
+    @property
+    def count(self) -> int:
+        with self._lock, self._file_lock(exclusive=False):
+            self._reload()
+            return self._state["count"]
+
+    def stats(self) -> dict:
+        with self._lock, self._file_lock(exclusive=False):
+            self._reload()
+            removed = sum(end - start for start, end in self._state["removed"])
+            return {
+                "vectors": self._state["count"],
+                "live_vectors": self._state["count"] - removed,
+                "documents": len(self._state["documents"]),
+                "dim": self._state["dim"],
+                "lists": 0 if self._centroids is None else len(self._centroids),
+            }
+
+    # --- Writing ---
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def add(self, document_id: str, vectors, metadatas: list) -> range:
+        """Appends vectors for `document_id` with one metadata dict each; returns their ids."""
+        vectors = self._normalize(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(metadatas):
+            raise ValueError("Expected one metadata dict per vector.")
+        with self._lock, self._file_lock(exclusive=True):
+            self._reload()
+            # Appends always start where the saved state ends, never after debris of a failed add.
+            self._truncate_to_state()
+            try:
+                return self._append(document_id, vectors, metadatas)
+            except BaseException:
+                self._state_stamp = None  # The in-memory state may be half-updated; reload it next time.
+                raise
+
+    def _append(self, document_id: str, vectors, metadatas: list) -> range:
+        state = self._state
+        if state["dim"] is None:
+            state["dim"] = int(vectors.shape[1])
+        elif vectors.shape[1] != state["dim"]:
+            raise ValueError(f"Expected {state['dim']}-dimensional vectors, got {vectors.shape[1]}.")
+        start = state["count"]
+        offsets = []
+        with open(self._path("meta.jsonl"), "ab") as f:
+            for metadata in metadatas:
+                offsets.append(f.tell())
+                f.write(json.dumps({"document_id": document_id, **metadata}).encode() + b"\n")
+            state["meta_bytes"] = f.tell()
+        with open(self._path("meta_offsets.u64"), "ab") as f:
+            np.asarray(offsets, dtype=np.uint64).tofile(f)
+        with open(self._path("vectors.f32"), "ab") as f:
+            vectors.tofile(f)
+        if state["trained_count"]:
+            with open(self._path("assignments.i32"), "ab") as f:
+                self._assign(vectors).tofile(f)
+        state["count"] = start + len(vectors)
+        state["documents"].setdefault(document_id, []).append([start, state["count"]])
+        self._save_state()
+        self._maybe_rebuild()
+        return range(start, state["count"])
+
+    def remove_document(self, document_id: str) -> int:
+        """Removes a document's vectors from search results; returns how many were removed."""
+        with self._lock, self._file_lock(exclusive=True):
+            self._reload()
+            ranges = self._state["documents"].pop(document_id, [])
+            if ranges:
+                self._state["removed"].extend(ranges)
+                self._save_state()
+            return sum(end - start for start, end in ranges)
+
+    # --- Clustering ---
+
+    def _assign(self, vectors, block: int = 65536):
+        return np.concatenate([
+            np.argmax(vectors[start:start + block] @ self._centroids.T, axis=1).astype(np.int32)
+            for start in range(0, len(vectors), block)
+        ]) if len(vectors) else np.empty(0, dtype=np.int32)
+
+    def _maybe_rebuild(self):
+        state = self._state
+        if state["count"] >= self.min_train and state["count"] >= 4 * state["trained_count"]:
+            self._train()
+        elif state["trained_count"] and state["count"] - state["listed_count"] > 0.1 * state["count"]:
+            self._build_lists()
+
+    def _train(self, iterations: int = 10, seed: int = 0):
+        """Clusters a sample of the vectors with spherical k-means and assigns every vector to a list."""
+        count = self._state["count"]
+        vectors = self._vectors(count)
+        lists = max(1, min(self.max_lists, int(math.sqrt(count))))
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(vectors[np.sort(rng.choice(count, min(count, lists * 64), replace=False))])
+        centroids = sample[rng.choice(len(sample), lists, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            filled = np.bincount(assignments, minlength=lists) > 0
+            centroids[filled] = self._normalize(sums[filled])
+        self._centroids = centroids
+        self._save_array("centroids.npy", centroids)
+        self._assign(vectors).tofile(self._path("assignments.i32"))
+        self._state["trained_count"] = count
+        self._build_lists()
+
+    def _build_lists(self):
+        """Groups vector ids by list, so a probe reads one contiguous slice per list."""
+        count = self._state["count"]
+        assignments = self._assignments(0, count)
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(assignments[order], np.arange(len(self._centroids) + 1))
+        self._save_array("list_order.npy", order)
+        self._save_array("list_offsets.npy", offsets)
+        self._list_order, self._list_offsets = order, offsets
+        self._state["listed_count"] = count
+        self._save_state()
+
+    # --- Search ---
+
+    @staticmethod
+    def _in_ranges(ids, ranges: list):
+        """Boolean mask of the ids that fall inside any of the non-overlapping [start, end) ranges."""
+        if not ranges:
+            return np.zeros(len(ids), dtype=bool)
+        ranges = sorted(ranges)
+        starts = np.asarray([start for start, _ in ranges])
+        ends = np.asarray([end for _, end in ranges])
+        index = np.searchsorted(starts, ids, side="right") - 1
+        return (index >= 0) & (ids < ends[np.maximum(index, 0)])
+
+    def _candidates(self, query, count: int, nprobe: int):
+        """The ids to score: everything before training, otherwise the members of the probed lists."""
+        if self._centroids is None:
+            return np.arange(count)
+        probe = np.argsort(self._centroids @ query)[::-1][:nprobe]
+        listed = [self._list_order[self._list_offsets[i]:self._list_offsets[i + 1]] for i in probe]
+        listed_count = self._state["listed_count"]
+        tail = self._assignments(listed_count, count)
+        listed.append(listed_count + np.flatnonzero(np.isin(tail, probe)))
+        return np.sort(np.concatenate(listed))
+
+    def _read_metadata(self, ids) -> list:
+        offsets = np.memmap(self._path("meta_offsets.u64"), dtype=np.uint64, mode="r")
+        results = []
+        with open(self._path("meta.jsonl"), "rb") as f:
+            for vector_id in ids:
+                f.seek(int(offsets[vector_id]))
+                results.append(json.loads(f.readline()))
+        return results
+
+    def search(self, query, k: int = 10, document_id: str = None, nprobe: int = None) -> list:
+        """Returns up to `k` metadata dicts of the vectors most similar to `query`, best first, with their score."""
+        query = self._normalize(query).reshape(-1)
+        with self._lock, self._file_lock(exclusive=False):
+            self._reload()
+            count = self._state["count"]
+            if not count:
+                return []
+            candidates = self._candidates(query, count, nprobe or self.nprobe)
+            removed = list(self._state["removed"])
+            document_ranges = self._state["documents"].get(document_id, []) if document_id else None
+        if document_ranges is not None:
+            candidates = candidates[self._in_ranges(candidates, document_ranges)]
+        candidates = candidates[~self._in_ranges(candidates, removed)]
+        if not len(candidates):
+            return []
+
+        vectors = self._vectors(count)
+        scores = np.empty(len(candidates), dtype=np.float32)
+        block = 65536
+        for start in range(0, len(candidates), block):
+            scores[start:start + block] = vectors[candidates[start:start + block]] @ query
+        top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        metadatas = self._read_metadata(candidates[top])
+        return [{"score": round(float(scores[i]), 6), **metadata} for i, metadata in zip(top, metadatas)]
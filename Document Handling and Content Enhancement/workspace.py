@@ -0,0 +1,260 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+class QuotaExceededError(Exception):
+    """Raised when a workspace (or the workspace root) runs out of disk quota."""
+
+
+_WORKSPACE_ID = re.compile(r"[0-9a-f]{32}")
+
+
+def is_workspace_id(value: str) -> bool:
+    """True if `value` has the form of an id made by WorkspaceManager.create() (a uuid4 hex)."""
+    return isinstance(value, str) and _WORKSPACE_ID.fullmatch(value) is not None
+
+
+def _directory_size(path: str) -> int:
+    """Returns the total size in bytes of all files below `path`."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class Workspace:
+    """An isolated scratch directory owned by a single request."""
+
+    def __init__(self, manager: "WorkspaceManager", workspace_id: str, path: str, used: int = 0,
+                 max_bytes: int = None):
+        self.manager = manager
+        self.id = workspace_id
+        self.path = path
+        self.created_at = time.time()
+        self.expires_at = self.created_at + manager.ttl_seconds
+        # Bytes written so far, counted as files are written so the quota holds during a run.
+        self.used = used
+        # Overrides the manager's per-workspace quota, e.g. for a batch archive larger than one upload.
+        self.max_bytes = max_bytes
+        self._file_sizes = {}
+        self._pins = 0
+
+    def file_path(self, filename: str) -> str:
+        """Returns the absolute path of `filename` inside this workspace."""
+        return os.path.join(self.path, os.path.basename(filename))
+
+    def usage(self) -> int:
+        return _directory_size(self.path)
+
+    @property
+    def quota(self) -> int:
+        return self.max_bytes or self.manager.max_workspace_bytes
+
+    @property
+    def remaining_bytes(self) -> int:
+        return max(0, self.quota - self.used)
+
+    def add_usage(self, nbytes: int):
+        """Counts `nbytes` written to this workspace, raising QuotaExceededError once it or the root is over quota."""
+        manager = self.manager
+        with manager._lock:
+            self.used += nbytes
+            used = self.used
+            if manager._workspaces.get(self.id) is self:
+                manager._tracked_bytes += nbytes
+            total = manager._tracked_bytes + manager._untracked_bytes
+        if used > self.quota:
+            raise QuotaExceededError(f"Workspace {self.id} uses {used} bytes, quota is {self.quota} bytes.")
+        if nbytes > 0 and total > manager.max_total_bytes:
+            raise QuotaExceededError("Workspace storage is full. Please retry later.")
+
+    def track_file(self, path: str):
+        """Counts a file written (or grown) in this workspace since it was last tracked."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self.manager._lock:
+            growth = size - self._file_sizes.get(path, 0)
+            self._file_sizes[path] = size
+        self.add_usage(growth)
+
+    def check_quota(self):
+        """Measures the workspace on disk, raising QuotaExceededError if it exceeds its disk quota."""
+        self.add_usage(self.usage() - self.used)
+
+    def touch(self, ttl_seconds: float = None):
+        """Extends the lifetime of this workspace."""
+        self.expires_at = time.time() + (ttl_seconds if ttl_seconds is not None else self.manager.ttl_seconds)
+
+    @contextmanager
+    def in_use(self):
+        """Keeps the workspace from being swept while a run uses it; its TTL restarts when the run ends."""
+        with self.manager._lock:
+            self._pins += 1
+        try:
+            yield self
+        finally:
+            with self.manager._lock:
+                self._pins -= 1
+            self.expires_at = max(self.expires_at, time.time() + self.manager.ttl_seconds)
+
+    @property
+    def pinned(self) -> bool:
+        return self._pins > 0
+
+    def release(self):
+        """Deletes the workspace once its results have been collected."""
+        self.manager.release(self.id)
+
+
+class WorkspaceManager:
+    """Hands out per-request scratch directories and cleans them up after a TTL."""
+
+    def __init__(self, root: str = None, ttl_seconds: float = 3600,
+                 max_workspace_bytes: int = 512 * 1024 * 1024,
+                 max_total_bytes: int = 8 * 1024 * 1024 * 1024, usage_check_interval: float = 5.0,
+                 keep=None):
+        self.root = root or os.path.join(tempfile.gettempdir(), "document_processor")
+        self.ttl_seconds = ttl_seconds
+        # Optional callable returning ids of workspaces that other state (e.g. queued jobs) still
+        # references; sweep() never deletes those, whatever their TTL or whoever created them.
+        self.keep = keep
+        self.max_workspace_bytes = max_workspace_bytes
+        self.max_total_bytes = max_total_bytes
+        # Usage is counted as workspaces are written and freed, so create() never walks the root.
+        # Only when the root looks full does it sweep first, at most once per this many seconds.
+        self.usage_check_interval = usage_check_interval
+        self._last_sweep_at = None
+        self._tracked_bytes = 0
+        # Bytes in directories this manager does not track (e.g. from an earlier run), as of the last sweep.
+        self._untracked_bytes = 0
+        self._workspaces = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def create(self, max_bytes: int = None) -> Workspace:
+        """Creates a fresh workspace, enforcing the global quota; `max_bytes` overrides its own quota.
+
+        If the root is full, expired workspaces are swept first, which walks and deletes
+        directories: call this from a worker thread, not the event loop.
+        """
+        if self.total_usage() > self.max_total_bytes and (
+                self._last_sweep_at is None or time.monotonic() - self._last_sweep_at >= self.usage_check_interval):
+            self.sweep()
+        if self.total_usage() > self.max_total_bytes:
+            raise QuotaExceededError("Workspace storage is full. Please retry later.")
+
+        workspace_id = uuid.uuid4().hex
+        path = os.path.join(self.root, workspace_id)
+        os.makedirs(path)
+        workspace = Workspace(self, workspace_id, path, max_bytes=max_bytes)
+        with self._lock:
+            self._workspaces[workspace_id] = workspace
+        return workspace
+
+    def adopt(self, workspace_id: str, ttl_seconds: float = None, required_file: str = None):
+        """Re-registers an existing workspace directory, e.g. one owned by a job queued before a restart.
+
+        Ids that create() could not have made are rejected, and an untracked directory is only
+        registered if it contains `required_file`. Workspaces this manager already tracks are
+        never revived once they have expired.
+        """
+        if not is_workspace_id(workspace_id):
+            return None
+        with self._lock:
+            tracked = workspace_id in self._workspaces
+        if tracked:
+            return self.get(workspace_id)
+        path = os.path.join(self.root, workspace_id)
+        if not os.path.isdir(path) or (required_file and not os.path.exists(os.path.join(path, required_file))):
+            return None
+        workspace = Workspace(self, workspace_id, path, used=_directory_size(path))
+        workspace.touch(ttl_seconds)
+        with self._lock:
+            self._workspaces[workspace_id] = workspace
+            self._tracked_bytes += workspace.used
+            self._untracked_bytes = max(0, self._untracked_bytes - workspace.used)
+        return workspace
+
+    def get(self, workspace_id: str):
+        """Returns a live workspace by id, or None if it is unknown or expired."""
+        with self._lock:
+            workspace = self._workspaces.get(workspace_id)
+        if workspace is None or (workspace.expires_at < time.time() and not workspace.pinned):
+            return None
+        return workspace
+
+    def release(self, workspace_id: str):
+        with self._lock:
+            workspace = self._workspaces.pop(workspace_id, None)
+            if workspace is not None:
+                self._tracked_bytes -= workspace.used
+        if workspace is None and not is_workspace_id(workspace_id):
+            return
+        path = workspace.path if workspace else os.path.join(self.root, workspace_id)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def total_usage(self) -> int:
+        """Bytes used under the root: counted for tracked workspaces, measured by the last sweep for the rest."""
+        with self._lock:
+            return self._tracked_bytes + self._untracked_bytes
+
+    def sweep(self) -> int:
+        """Removes expired workspaces, including ones left behind by a previous process.
+
+        Workspaces in use by a run, or listed by `keep`, are kept however long they are needed.
+        If `keep` fails nothing is removed, since any directory might still be referenced.
+        This walks and deletes directories: call it from a worker thread, not the event loop.
+        """
+        self._last_sweep_at = time.monotonic()
+        try:
+            keep = set(self.keep()) if self.keep else set()
+        except Exception as e:
+            print(f"Skipping the workspace sweep: could not list workspaces still in use: {e}")
+            return 0
+        now = time.time()
+        with self._lock:
+            # Unregistered under the lock, so get() and adopt() stop returning them before their directories go.
+            expired = [self._workspaces.pop(ws_id) for ws_id, ws in list(self._workspaces.items())
+                       if ws.expires_at < now and not ws.pinned and ws_id not in keep]
+            self._tracked_bytes -= sum(workspace.used for workspace in expired)
+
+        for workspace in expired:
+            shutil.rmtree(workspace.path, ignore_errors=True)
+
+        # Directories not tracked by this manager are orphans from an earlier run. Only names
+        # create() could have made are considered, so nothing else under the root is touched.
+        orphans = 0
+        untracked = 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            names = []
+        for name in names:
+            path = os.path.join(self.root, name)
+            with self._lock:
+                tracked = name in self._workspaces
+            if tracked or not is_workspace_id(name) or not os.path.isdir(path):
+                continue
+            try:
+                if name not in keep and os.path.getmtime(path) + self.ttl_seconds < now:
+                    shutil.rmtree(path, ignore_errors=True)
+                    orphans += 1
+                else:
+                    untracked += _directory_size(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._untracked_bytes = untracked
+        return len(expired) + orphans